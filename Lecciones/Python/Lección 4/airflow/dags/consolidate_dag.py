@@ -8,6 +8,9 @@ from airflow.utils.dates import days_ago
 from structlog import get_logger
 import pandas as pd
 
+from pipeline import metrics
+from pipeline.bulk_load import bulk_insert, get_bulk_engine
+
 logger = get_logger()
 
 
@@ -20,17 +23,19 @@ GROUP BY 1 , 2
 """
 CONNECTION_DB_NAME = 'mysql_db'
 
+@metrics.instrument
 def etl_process(**kwargs):
     logger.info(kwargs["execution_date"])
-    mysql_connection = MySqlHook(mysql_conn_id=CONNECTION_DB_NAME).get_sqlalchemy_engine()
+    mysql_connection = get_bulk_engine(MySqlHook(mysql_conn_id=CONNECTION_DB_NAME))
 
     df = pd.read_sql(QUERY, con=mysql_connection, coerce_float=False)
 
     with mysql_connection.begin() as connection:
         connection.execute("DELETE FROM test.consolidate_sales WHERE 1=1")
-        df.to_sql("consolidate_sales", con=connection, schema="test", if_exists="append", index=False)
+        bulk_insert(df, "consolidate_sales", connection, schema="test")
 
     logger.info(f"Rows inserted {len(df.index)}")
+    metrics.add_rows(rows_in=len(df.index), rows_out=len(df.index))
 
 
 
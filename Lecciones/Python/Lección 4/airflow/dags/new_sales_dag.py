@@ -8,6 +8,9 @@ from airflow.utils.dates import days_ago
 from structlog import get_logger
 import os
 
+from pipeline import metrics
+from pipeline.bulk_load import bulk_insert, get_bulk_engine
+
 dag = DAG('new_sales_dag', description = "This is a new implementation of the sales DAG",
           default_args = {
               'owner': 'eddysanoli',
@@ -53,7 +56,8 @@ DATE_COLUMNS = ["ORDERDATE"]
 
 logger = get_logger()
 
-def process_file():
+@metrics.instrument
+def process_file(**context):
 
     file_path = f"{FSHook('fs_default').get_path()}/sales.csv"
     df = (pd.read_csv(file_path, encoding = "ISO-8859-1", parse_dates = DATE_COLUMNS)
@@ -61,16 +65,17 @@ def process_file():
          )
 
     # Para ejecutarlo de forma transaccional
-    connection = MySqlHook('mysql_default').get_sqlalchemy_engine()
+    connection = get_bulk_engine(MySqlHook('mysql_default'))
 
     # Se agregan los datos a la base de datos
     # (Borrando los mismos primero)
     with connection.begin() as transaction:
         transaction.execute("DELETE FROM test.sales WHERE 1=1")
-        df.to_sql('sales', con = transaction, schema = 'test', if_exists = 'append', index = False)
+        bulk_insert(df, 'sales', transaction, schema = 'test')
 
     # Logger
     logger.info(f"Rows inserted {len(df.index)}")
+    metrics.add_rows(rows_in = len(df.index), rows_out = len(df.index))
     os.remove(file_path)
     logger.info(f'File {file_path} was deleted.')
 
@@ -93,7 +98,8 @@ sensor = FileSensor(task_id = 'sales_sensor_file',
 
 process_file_operator = PythonOperator(task_id = 'process_file',
                                        dag = dag,
-                                       python_callable = process_file)
+                                       python_callable = process_file,
+                                       provide_context = True)
 
 # ===============
 # PIPELINE
@@ -0,0 +1,172 @@
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import DBAPIError
+from structlog import get_logger
+
+logger = get_logger()
+
+# Número de filas que se escriben por bloque al TSV y por sentencia INSERT
+# en caso de usar el método alternativo (INSERT de múltiples filas)
+DEFAULT_CHUNKSIZE = int(os.environ.get("BULK_LOAD_CHUNKSIZE", 5000))
+
+# Argumento que habilita "LOAD DATA LOCAL INFILE" del lado del cliente, según el driver
+LOCAL_INFILE_ARGS = {
+    "mysqldb": {"local_infile": 1},
+    "mysqlconnector": {"allow_local_infile": True}
+}
+
+# Engines ya creados, por conexión de Airflow y esquema (ver "get_bulk_engine")
+_engines = {}
+_engines_lock = threading.Lock()
+
+# ===============
+# FUNCIONES
+# ===============
+
+def get_bulk_engine(hook):
+    """
+    Engine de SQLAlchemy de un MySqlHook de Airflow, con "LOAD DATA LOCAL INFILE"
+    habilitado en el cliente. Se crea un solo engine (y un solo pool de conexiones)
+    por conexión y esquema, que se reutiliza en todas las llamadas del proceso.
+
+    Args:
+        hook (MySqlHook): Hook de la conexión de MySQL.
+
+    Returns:
+        sqlalchemy.engine.Engine: Engine para usar con "bulk_insert".
+    """
+
+    key = (getattr(hook, hook.conn_name_attr), hook.schema)
+
+    with _engines_lock:
+        if key not in _engines:
+            uri = hook.get_uri()
+            driver = make_url(uri).get_driver_name()
+
+            # "pool_pre_ping" descarta las conexiones que MySQL cerró entre tareas
+            _engines[key] = create_engine(uri, connect_args = LOCAL_INFILE_ARGS.get(driver, {}), pool_pre_ping = True)
+
+        return _engines[key]
+
+
+def _to_tsv_column(series):
+    """
+    Convierte una columna a strings en el formato que espera "LOAD DATA": nulos como
+    "\\N", fechas como "YYYY-MM-DD HH:MM:SS" (o "YYYY-MM-DD" si ninguna tiene hora, para
+    columnas DATE) y tabs, saltos de línea y backslashes escapados.
+    """
+
+    nulls = series.isna().to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        dates = series[~nulls]
+        out = series.dt.strftime("%Y-%m-%d" if (dates == dates.dt.normalize()).all() else "%Y-%m-%d %H:%M:%S")
+    elif pd.api.types.is_bool_dtype(series):
+        out = series.astype(int).astype(str)
+    elif pd.api.types.is_numeric_dtype(series):
+        out = series.astype(str)
+    else:
+        out = (series.astype(str)
+                .str.replace("\\", "\\\\", regex = False)
+                .str.replace("\t", "\\t", regex = False)
+                .str.replace("\n", "\\n", regex = False)
+                .str.replace("\r", "\\r", regex = False))
+
+    out = out.to_numpy(dtype = object)
+    out[nulls] = "\\N"
+
+    return pd.Series(out)
+
+
+def write_tsv(df, path, chunksize = DEFAULT_CHUNKSIZE):
+    """
+    Escribe un dataframe a un archivo TSV compatible con "LOAD DATA", por bloques
+    de "chunksize" filas (para no duplicar el dataframe completo como strings).
+
+    Args:
+        df (df): Datos a escribir.
+        path (str): Ruta del archivo de salida.
+        chunksize (int, optional): Filas por bloque. Defaults to DEFAULT_CHUNKSIZE.
+    """
+
+    with open(path, "w", encoding = "utf-8", newline = "") as f:
+        for start in range(0, len(df.index), chunksize):
+
+            chunk = df.iloc[start:start + chunksize]
+            columns = [_to_tsv_column(chunk[col]) for col in chunk.columns]
+            lines = columns[0].str.cat(columns[1:], sep = "\t") if len(columns) > 1 else columns[0]
+
+            f.write("\n".join(lines.tolist()))
+            f.write("\n")
+
+
+def bulk_insert(df, table, connection, schema = "test", chunksize = DEFAULT_CHUNKSIZE, use_load_data = True):
+    """
+    Inserta un dataframe en una tabla de MySQL usando "LOAD DATA LOCAL INFILE" sobre
+    un TSV temporal. Si el servidor o el cliente no permiten "LOAD DATA LOCAL", se
+    usan sentencias INSERT de múltiples filas ("chunksize" filas por sentencia).
+
+    Se ejecuta sobre la conexión recibida, por lo que si esta es una transacción
+    (engine.begin()), la carga forma parte de la misma transacción que, por ejemplo,
+    el "DELETE" previo.
+
+    Args:
+        df (df): Datos a insertar. Los nombres de columna deben coincidir con la tabla.
+        table (str): Nombre de la tabla.
+        connection (sqlalchemy.engine.Connection): Conexión o transacción abierta.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+        chunksize (int, optional): Filas por bloque. Defaults to DEFAULT_CHUNKSIZE.
+        use_load_data (bool, optional): Intentar "LOAD DATA" primero. Defaults to True.
+
+    Returns:
+        dict: Método usado, filas insertadas, segundos y filas por segundo.
+    """
+
+    start = time.perf_counter()
+    method = "multi_insert"
+
+    if len(df.index) == 0:
+        use_load_data = False
+
+    if use_load_data:
+
+        fd, path = tempfile.mkstemp(suffix = ".tsv")
+        os.close(fd)
+
+        try:
+            write_tsv(df, path, chunksize)
+
+            columns = ", ".join(f"`{col}`" for col in df.columns)
+            connection.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE `{schema}`.`{table}` "
+                "CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+                "LINES TERMINATED BY '\\n' "
+                f"({columns})",
+                (path,)
+            )
+            method = "load_data"
+
+        except DBAPIError as e:
+            logger.warning(f"LOAD DATA LOCAL INFILE failed, falling back to multi-row INSERT: {e.orig}")
+
+        finally:
+            os.remove(path)
+
+    if method == "multi_insert":
+        df.to_sql(table, con = connection, schema = schema, if_exists = "append", index = False,
+                  method = "multi", chunksize = chunksize)
+
+    elapsed = time.perf_counter() - start
+    rows = len(df.index)
+    rows_per_sec = rows / elapsed if elapsed > 0 else float("inf")
+
+    logger.info(f"Bulk insert into {schema}.{table}: {rows} rows in {elapsed:.2f}s ({rows_per_sec:,.0f} rows/s, method: {method})")
+
+    return {"method": method, "rows": rows, "seconds": elapsed, "rows_per_sec": rows_per_sec}
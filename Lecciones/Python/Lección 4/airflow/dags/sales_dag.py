@@ -9,6 +9,9 @@ from airflow.utils.dates import days_ago
 from structlog import get_logger
 import pandas as pd
 
+from pipeline import metrics
+from pipeline.bulk_load import bulk_insert, get_bulk_engine
+
 logger = get_logger()
 
 COLUMNS = {
@@ -44,11 +47,12 @@ DATE_COLUMNS = ["ORDERDATE"]
 FILE_CONNECTION_NAME = 'monitor_file'
 CONNECTION_DB_NAME = 'mysql_db'
 
+@metrics.instrument
 def etl_process(**kwargs):
     logger.info(kwargs["execution_date"])
     file_path = FSHook(FILE_CONNECTION_NAME).get_path()
     filename = 'sales.csv'
-    mysql_connection = MySqlHook(mysql_conn_id=CONNECTION_DB_NAME).get_sqlalchemy_engine()
+    mysql_connection = get_bulk_engine(MySqlHook(mysql_conn_id=CONNECTION_DB_NAME))
     full_path = f'{file_path}/{filename}'
     df = (pd.read_csv(full_path, encoding = "ISO-8859-1", usecols=COLUMNS.keys(), parse_dates=DATE_COLUMNS)
           .rename(columns=COLUMNS)
@@ -56,11 +60,12 @@ def etl_process(**kwargs):
 
     with mysql_connection.begin() as connection:
         connection.execute("DELETE FROM test.sales WHERE 1=1")
-        df.to_sql('sales', con=connection, schema='test', if_exists='append', index=False)
+        bulk_insert(df, 'sales', connection, schema='test')
 
     os.remove(full_path)
 
     logger.info(f"Rows inserted {len(df.index)}")
+    metrics.add_rows(rows_in=len(df.index), rows_out=len(df.index))
 
 
 
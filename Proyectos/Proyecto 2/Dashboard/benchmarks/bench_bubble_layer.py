@@ -0,0 +1,111 @@
+"""
+Benchmark del mapa de burbujas ("Data by Region"):
+
+- legacy: un folium.CircleMarker por región, cada uno con un popup con su propio
+          folium.IFrame (como se construía antes de "BubbleLayer").
+- layer:  functions.BubbleLayer (un solo arreglo con los datos y una sola función de
+          JavaScript para los marcadores y los popups).
+
+Para cada número de regiones (~290 en el dataset actual, ~3,300 con condados de
+Estados Unidos) se reporta el tiempo de construcción y render del mapa y el tamaño
+del HTML.
+
+Uso (desde "Dashboard"):
+    python benchmarks/bench_bubble_layer.py
+    python benchmarks/bench_bubble_layer.py --regions 290 3300 10000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import folium
+from folium import plugins
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit"))
+
+from functions import _base_map, build_bubbles_map
+
+
+# FUNCIÓN: Datos por región sintéticos (con las columnas de "prepare_map_data")
+def make_regions(num_regions, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    confirmed = rng.integers(0, 10**6, num_regions)
+
+    return pd.DataFrame({
+        "region_and_province": [f"Country {i // 10}, Province {i}" for i in range(num_regions)],
+        "lat": rng.uniform(-60, 80, num_regions).astype("float32"),
+        "lon": rng.uniform(-180, 180, num_regions).astype("float32"),
+        "confirmed": confirmed.astype("int32"),
+        "deaths": (confirmed // 50).astype("int32"),
+        "recovered": (confirmed // 2).astype(float),
+        "marker_size": (pd.qcut(confirmed, q = 8, labels = False) + 1) / 8
+    })
+
+
+# FUNCIÓN: Mapa de burbujas original (un CircleMarker con IFrame por región)
+def legacy_bubbles_map(unGroupedData):
+
+    map_bubbles = _base_map()
+    feature_group = folium.FeatureGroup(name = "Cases by Region")
+
+    unGroupedData.apply(lambda row:
+        folium.CircleMarker(
+            location = [row["lat"], row["lon"]],
+            radius = row["marker_size"] * 12,
+            color = "#3186cc",
+            fill = True,
+            fill_color = "#3186cc",
+            popup = folium.Popup(
+                folium.IFrame(
+                    f'''<h4 style="font-family: Arial">{row["region_and_province"]}</h4>
+                    <p style="font-family: Arial">
+                    <b>Confirmed</b>: {"{:,}".format(row["confirmed"])}<br>
+                    <b>Deaths</b>: {"{:,}".format(row["deaths"])}<br>
+                    <b>Recovered</b>: {"{:,}".format(int(row["recovered"])) if np.isnan(row["recovered"]) == False else 0}<br>
+                    </p>
+                    '''
+                ),
+                min_width=250,
+                max_width=250
+            )
+        ).add_to(feature_group),
+        axis = 1)
+
+    feature_group.add_to(map_bubbles)
+    map_bubbles.keep_in_front(feature_group)
+    map_bubbles.add_child(plugins.MiniMap(toggle_display=True))
+
+    return map_bubbles
+
+
+# FUNCIÓN: Tiempo de construcción y render, y tamaño del HTML
+def measure(build, regions):
+
+    start = time.perf_counter()
+    html = folium.Figure().add_child(build(regions)).render()
+    return time.perf_counter() - start, len(html.encode())
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--regions", type = int, nargs = "+", default = [290, 3300])
+    args = parser.parse_args()
+
+    print(f"{'regions':>8} {'impl':>7} {'time (s)':>9} {'HTML (KB)':>10}")
+
+    for num_regions in args.regions:
+
+        regions = make_regions(num_regions)
+        for name, build in [("legacy", legacy_bubbles_map), ("layer", build_bubbles_map)]:
+            elapsed, size = measure(build, regions)
+            print(f"{num_regions:>8} {name:>7} {elapsed:>9.3f} {size / 1000:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
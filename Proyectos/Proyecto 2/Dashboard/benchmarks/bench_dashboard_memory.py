@@ -0,0 +1,153 @@
+"""
+Benchmark de la representación del dataset del dashboard: dataframe con los tipos
+que devuelve "pd.read_sql" (strings de objeto, float64 e int64) contra el mismo
+dataframe convertido con "compact.compact_frame" (categorías, int32, float32 y
+ordenado por país y fecha).
+
+Se genera un dataset sintético con la forma del que leía "get_DBData" (~290 regiones
+x ~900 fechas, escalado en número de regiones), y se reporta la memoria de cada
+representación y el tiempo de un filtro por fecha y de un "groupby" por país.
+
+Uso (desde "Dashboard"):
+    python benchmarks/bench_dashboard_memory.py
+    python benchmarks/bench_dashboard_memory.py --scales 1 10
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import structlog
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dags"))
+
+from bench_to_database_format import BASE_DATES, BASE_REGIONS
+from compact import compact_frame, memory_mb
+from pipeline import snapshot
+
+# El reporte se imprime como tabla, sin los mensajes de compact_frame
+structlog.configure(wrapper_class = structlog.make_filtering_bound_logger(logging.WARNING))
+
+CONTINENTS = ["Africa", "Asia", "Europe", "North America", "Oceania", "South America"]
+
+
+# FUNCIÓN: Dataset sintético con los tipos que devuelve "pd.read_sql"
+def make_dataset(num_regions, num_dates, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2020-01-22", periods = num_dates, freq = "D")
+
+    countries = np.array([f"Country {i // 3}" for i in range(num_regions)], dtype = object)
+    provinces = np.array([f"Province {i}" if i % 3 == 0 else None for i in range(num_regions)], dtype = object)
+    confirmed = np.cumsum(rng.integers(0, 50, size = (num_regions, num_dates)), axis = 1)
+
+    # Como en la consulta original, las filas vienen ordenadas por fecha y región
+    return pd.DataFrame({
+        "province_state": np.tile(provinces, num_dates),
+        "country_region": np.tile(countries, num_dates),
+        "lat": np.tile(rng.uniform(-60, 80, num_regions), num_dates),
+        "lon": np.tile(rng.uniform(-180, 180, num_regions), num_dates),
+        "date": np.repeat(dates.values, num_regions),
+        "confirmed": confirmed.T.ravel(),
+        "deaths": (confirmed.T.ravel() // 50),
+        "recovered": (confirmed.T.ravel() // 2).astype(float),
+        "continent": np.tile(np.array([CONTINENTS[i % len(CONTINENTS)] for i in range(num_regions)], dtype = object), num_dates),
+        "population": np.tile(rng.integers(10**5, 10**9, num_regions).astype(float), num_dates),
+        "code": np.tile(np.array([f"C{i // 3:03d}" for i in range(num_regions)], dtype = object), num_dates)
+    })
+
+
+# FUNCIÓN: La copia del DAG ("snapshot.compact") y el dashboard ("compact_frame") usan
+# los mismos tipos, con y sin nulos en los conteos, y sin tipos enteros con pd.NA
+def check_snapshot_dtypes():
+
+    for with_nulls in [False, True]:
+
+        dataset = make_dataset(12, 5)
+        if with_nulls:
+            dataset.loc[3, "confirmed"] = np.nan
+            dataset.loc[[1, 7], "recovered"] = np.nan
+
+        published = pa.Table.from_pandas(snapshot.compact(snapshot.add_max_recovered(dataset)), preserve_index = False).to_pandas()
+        dashboard = compact_frame(dataset, "dataset")
+
+        for column in dashboard.columns.drop(["date", "population"]):
+            assert published[column].dtype == dashboard[column].dtype, (column, published[column].dtype, dashboard[column].dtype)
+
+        assert not any(pd.api.types.is_extension_array_dtype(dtype) and dtype != "category" for dtype in published.dtypes)
+        assert (published["confirmed"].dtype == np.float64) == with_nulls
+        assert published["population"].dtype == np.int32
+
+
+# FUNCIÓN: "max_recovered" de la copia del DAG es el máximo de recuperados de cada
+# región hasta cada fecha (como "MAX(recovered)" en MySQL), aunque la región deje de
+# reportar recuperados o los reporte a la baja
+def check_max_recovered():
+
+    # (una sola región sin provincia por país)
+    dataset = make_dataset(12, 8)
+    regions = np.tile(np.arange(12), 8)
+    dataset["province_state"] = np.where(regions % 3 == 0, None, np.char.add("Province ", regions.astype(str))).astype(object)
+    dataset.loc[dataset.sample(frac = 0.3, random_state = 0).index, "recovered"] = np.nan
+    dataset.loc[dataset["date"] >= dataset["date"].iloc[-1], "recovered"] = 0
+
+    published = snapshot.add_max_recovered(dataset)
+    keys = ["country_region", "province_state"]
+
+    for date in dataset["date"].unique():
+        expected = (dataset[dataset["date"] <= date]
+                        .groupby(keys, dropna = False)["recovered"].max()
+                        .rename("expected").reset_index())
+        day = published[published["date"] == date].merge(expected, on = keys, how = "left")
+        assert day["max_recovered"].equals(day["expected"]), date
+
+
+# FUNCIÓN: Operaciones típicas del dashboard (datos de una fecha y máximo por país)
+def workload(df, date):
+
+    start = time.perf_counter()
+    df[df["date"] == date]
+    filtered = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df[["country_region", "confirmed", "recovered"]].groupby(by = "country_region", observed = True).max()
+    grouped = time.perf_counter() - start
+
+    return filtered, grouped
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type = int, nargs = "+", default = [1, 10])
+    parser.add_argument("--dates", type = int, default = BASE_DATES)
+    args = parser.parse_args()
+
+    check_snapshot_dtypes()
+    check_max_recovered()
+
+    print(f"{'scale':>6} {'rows':>12} {'repr':>8} {'memory (MB)':>12} {'filter (s)':>11} {'groupby (s)':>12}")
+
+    for scale in args.scales:
+
+        dataset = make_dataset(BASE_REGIONS * scale, args.dates)
+        date = dataset["date"].iloc[-1]
+
+        runs = [
+            ("read_sql", dataset),
+            ("compact", compact_frame(dataset, "dataset", sort_by = ["country_region", "date"]))
+        ]
+
+        for name, df in runs:
+            filtered, grouped = workload(df, date)
+            print(f"{scale:>5}x {len(df):>12,} {name:>8} {memory_mb(df):>12.1f} {filtered:>11.4f} {grouped:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark de la edición del GeoJson con los conteos de cada país (geo.enrich_geojson):
+
+- legacy: carga del archivo en cada render y tres filtros "GroupedData.loc[...]" por
+          país (uno por conteo), modificando el GeoJson cargado.
+- dict:   geo.enrich_geojson (un diccionario nombre de país -> conteos y un solo
+          recorrido de los países) sobre el GeoJson cargado una vez por proceso.
+
+Se usa "countries-min.json" y un dataframe de conteos por país como el del mapa.
+
+Uso (desde "Dashboard"):
+    python benchmarks/bench_geojson_enrichment.py
+    python benchmarks/bench_geojson_enrichment.py --repeat 50
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit"))
+
+from geo import GEOJSON_PATH, enrich_geojson, load_geojson
+
+
+# FUNCIÓN: Edición original (previa a geo.enrich_geojson)
+def legacy_enrich(GroupedData):
+
+    with open(GEOJSON_PATH) as f:
+        geojson_countries = json.load(f)
+
+    for i in geojson_countries['features']:
+
+        i['id'] = i['properties']['ADMIN']
+        i['properties']["Country"] = i['id']
+
+        for prop, column in [("Confirmed", "confirmed"), ("Deaths", "deaths"), ("Recovered", "recovered")]:
+            match = GroupedData.loc[GroupedData["country_region"] == i["id"], column].values
+            i['properties'][prop] = int(match[0]) if len(match) != 0 else 0
+
+    return geojson_countries
+
+
+# FUNCIÓN: Conteos sintéticos por país (con los nombres del GeoJson y algunos extra)
+def make_grouped_data(names, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    names = names + [f"Country {i}" for i in range(20)]
+
+    return pd.DataFrame({
+        "country_region": names,
+        "confirmed": rng.integers(0, 10**7, len(names)),
+        "deaths": rng.integers(0, 10**5, len(names)),
+        "recovered": rng.integers(0, 10**6, len(names)).astype(float)
+    })
+
+
+# FUNCIÓN: Tiempo promedio de una función
+def measure(func, repeat):
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type = int, default = 20)
+    args = parser.parse_args()
+
+    names = [feature["properties"]["ADMIN"] for feature in load_geojson()["features"]]
+    GroupedData = make_grouped_data(names)
+
+    legacy_time, legacy = measure(lambda: legacy_enrich(GroupedData), args.repeat)
+    dict_time, enriched = measure(lambda: enrich_geojson(load_geojson(), GroupedData), args.repeat)
+
+    # Ambas versiones deben producir las mismas propiedades
+    assert [f["properties"] for f in legacy["features"]] == [f["properties"] for f in enriched["features"]]
+    assert [f["id"] for f in legacy["features"]] == [f["id"] for f in enriched["features"]]
+
+    print(f"{len(names)} features, {len(GroupedData)} countries")
+    print(f"{'impl':>8} {'time (ms)':>10}")
+    print(f"{'legacy':>8} {legacy_time * 1000:>10.2f}")
+    print(f"{'dict':>8} {dict_time * 1000:>10.2f}")
+    print(f"speedup: {legacy_time / dict_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
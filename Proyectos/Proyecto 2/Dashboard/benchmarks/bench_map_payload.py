@@ -0,0 +1,161 @@
+"""
+Benchmark del tamaño de los mapas choropleth que se envían al navegador:
+
+- geojson: choropleth original ("folium.Choropleth" con "countries-min.json"
+           completo, los conteos de cada país en sus propiedades y "highlight").
+- low / medium / high: "build_choropleth_map" con cada nivel de detalle de las
+           fronteras ("ChoroplethLayer" con la topología compacta de cada nivel).
+
+Para cada versión se construyen los tres choropleth (confirmados, muertes y
+recuperados) y se mide el HTML de cada mapa, que es lo que "get_FoliumMap" envía al
+navegador (el dashboard envía un solo mapa). Antes se revisa que todos los países
+tengan geometría y que "ChoroplethLayer" use los mismos colores que
+"folium.Choropleth".
+
+Uso (desde "Dashboard"):
+    python benchmarks/bench_map_payload.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import folium
+from folium import plugins
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit"))
+
+import functions
+import geo
+from bench_geojson_enrichment import make_grouped_data
+from geo import country_values, enrich_geojson, enrich_topology, load_geojson, load_topology
+from topology import LEVELS
+
+
+# FUNCIÓN: Choropleth original, con el GeoJson completo (como se construía antes de
+# "topology.py" y "ChoroplethLayer")
+def legacy_choropleth_map(map_type, GroupedData, unGroupedData):
+
+    settings = functions.CHOROPLETHS[map_type]
+    column = settings["column"]
+
+    folium_map = functions._base_map()
+    bins = functions.generate_bins(max(unGroupedData[column]))
+
+    choropleth = folium.Choropleth(
+        geo_data = enrich_geojson(load_geojson(), GroupedData),
+        name = settings["name"],
+        data = GroupedData,
+        columns = ["country_region", column],
+        key_on = "feature.id",
+        fill_color = settings["fill_color"],
+        fill_opacity = 0.7,
+        line_opacity = 0.5,
+        highlight = True,
+        bins = bins
+    )
+    for key in list(choropleth._children):
+        if key.startswith("color_map"):
+            del(choropleth._children[key])
+    choropleth.add_to(folium_map)
+
+    colormap = settings["colormap"].scale(0, 500).to_step(index = np.log(np.array(bins) + 1))
+    colormap.caption = settings["caption"]
+    colormap.add_to(folium_map)
+
+    folium.features.GeoJsonPopup(fields = ["Country", settings["field"]]).add_to(choropleth.geojson)
+    folium_map.add_child(plugins.MiniMap(toggle_display = True))
+    folium_map.add_child(functions.BindColormap(choropleth, colormap))
+
+    return folium_map
+
+
+# FUNCIÓN: "build_choropleth_map" con un nivel de detalle fijo (DASHBOARD_MAP_DETAIL)
+def level_choropleth_map(level):
+
+    def build(map_type, GroupedData, unGroupedData):
+        geo.MAP_DETAIL = level
+        return functions.build_choropleth_map(map_type, GroupedData, unGroupedData)
+
+    return build
+
+
+# FUNCIÓN: Todos los países tienen geometría en cada nivel (incluidos los más pequeños
+# que una celda de la cuadrícula, como el Vaticano)
+def check_geometries(names):
+
+    for level in LEVELS:
+        geometries = load_topology(level)["objects"]["countries"]["geometries"]
+        assert [geometry["properties"]["ADMIN"] for geometry in geometries] == names
+        assert all(geometry["type"] in ("Polygon", "MultiPolygon") for geometry in geometries), level
+
+
+# FUNCIÓN: "ChoroplethLayer" colorea cada país (incluidos los países sin datos) y
+# muestra el mismo valor en su popup que "folium.Choropleth"
+def check_colors(GroupedData):
+
+    GroupedData = GroupedData.iloc[20:]
+    for map_type, settings in functions.CHOROPLETHS.items():
+
+        column = settings["column"]
+        bins = functions.generate_bins(max(GroupedData[column]))
+
+        choropleth = folium.Choropleth(
+            geo_data = enrich_topology(load_topology("low"), GroupedData),
+            topojson = "objects.countries",
+            data = GroupedData,
+            columns = ["country_region", column],
+            key_on = "feature.id",
+            fill_color = settings["fill_color"],
+            fill_opacity = 0.7,
+            line_opacity = 0.5,
+            bins = bins
+        )
+        choropleth.geojson.style_data()
+        expected = choropleth.geojson.data["objects"]["countries"]["geometries"]
+
+        layer = functions.ChoroplethLayer("low", country_values(load_topology("low"), GroupedData, column), bins,
+                                          fill_color = settings["fill_color"], field = settings["field"])
+
+        assert [layer.colors[index] for index, _ in layer.rows] == [geometry["properties"]["style"]["fillColor"] for geometry in expected]
+        assert [value for _, value in layer.rows] == [geometry["properties"][settings["field"]] for geometry in expected]
+
+
+# FUNCIÓN: Tamaño (bytes) y tiempo de construcción y render de los mapas
+def payload(build, GroupedData):
+
+    start = time.perf_counter()
+    size = 0
+    for map_type in functions.CHOROPLETHS:
+        folium_map = build(map_type, GroupedData, GroupedData)
+        size += len(folium.Figure().add_child(folium_map).render().encode())
+
+    return size, time.perf_counter() - start
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    names = [feature["properties"]["ADMIN"] for feature in load_geojson()["features"]]
+    GroupedData = make_grouped_data(names)
+
+    check_geometries(names)
+    check_colors(GroupedData)
+
+    runs = [("geojson", legacy_choropleth_map)] + [(level, level_choropleth_map(level)) for level in LEVELS]
+
+    baseline = None
+    print(f"{'geometry':>8} {'3 maps (KB)':>12} {'per map (KB)':>13} {'build (s)':>11} {'reduction':>10}")
+    for name, build in runs:
+        size, elapsed = payload(build, GroupedData)
+        baseline = baseline or size
+        print(f"{name:>8} {size / 1000:>12.0f} {size / 3000:>13.0f} {elapsed:>11.2f} {baseline / size:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark de la unión de confirmados, muertes y recuperados en "merge_data":
+
+- legacy:   dos "pd.merge" sobre Province/State, Country/Region, Lat, Long y Date
+            (strings de objeto y fechas como string) + "pd.to_datetime" al final.
+- pd.merge: las mismas dos uniones, pero sobre las tablas tipadas de pipeline.reshape.
+- region:   pipeline.reshape.merge_series (ID entero de región + día).
+
+Uso (desde "Dashboard"):
+    python benchmarks/bench_merge_data.py
+    python benchmarks/bench_merge_data.py --scales 1 10
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dags"))
+
+from bench_to_database_format import BASE_DATES, BASE_REGIONS, legacy_to_database_format, make_wide_frame
+from pipeline.reshape import merge_series, to_database_format
+
+MERGE_KEYS = ["Province/State", "Country/Region", "Lat", "Long", "Date"]
+
+
+# FUNCIÓN: Unión original (previa a merge_series)
+def legacy_merge(confirmed, deaths, recovered):
+
+    df_merge1 = pd.merge(left = confirmed, right = deaths, on = MERGE_KEYS, how = "left")
+    df_merge2 = pd.merge(left = df_merge1, right = recovered, on = MERGE_KEYS, how = "left")
+    df_merge2["Date"] = pd.to_datetime(df_merge2["Date"], format = "%m/%d/%y")
+
+    return df_merge2
+
+
+# FUNCIÓN: Mismas uniones sobre tablas tipadas
+def typed_merge(confirmed, deaths, recovered):
+
+    df_merge1 = pd.merge(left = confirmed, right = deaths, on = MERGE_KEYS, how = "left")
+
+    return pd.merge(left = df_merge1, right = recovered, on = MERGE_KEYS, how = "left")
+
+
+# FUNCIÓN: Compara merge_series con "pd.merge" cuando las series tienen regiones que no
+# están en la serie base (una provincia nueva de un país existente y un país nuevo)
+def check_mismatched_regions():
+
+    base = pd.DataFrame({
+        "Province/State": [np.nan, np.nan, "Ontario"],
+        "Country/Region": ["United Kingdom", "France", "Canada"],
+        "Lat": [55.0, 46.0, 51.3],
+        "Long": [-3.0, 2.0, -85.3],
+        "1/22/20": [1, 2, 3],
+        "1/23/20": [4, 5, 6]
+    })
+    other = pd.DataFrame({
+        "Province/State": [np.nan, "Gibraltar", np.nan, "Bermuda"],
+        "Country/Region": ["United Kingdom", "United Kingdom", "Atlantis", "France"],
+        "Lat": [55.0, 36.1, 0.0, 46.0],
+        "Long": [-3.0, -5.3, 0.0, 2.0],
+        "1/22/20": [10, 50, 70, 90],
+        "1/23/20": [20, 60, 80, 100]
+    })
+
+    confirmed = to_database_format(base, "Confirmed")[0]
+    deaths = to_database_format(other, "Deaths")[0]
+
+    expected = typed_merge(confirmed, deaths, deaths.rename(columns = {"Deaths": "Recovered"}))
+    result = merge_series(confirmed, [deaths, deaths.rename(columns = {"Deaths": "Recovered"})])
+
+    for column in ["Deaths", "Recovered"]:
+        assert result[column].astype("Float64").tolist() == expected[column].astype("Float64").tolist(), column
+    assert result.loc[result["Country/Region"] == "United Kingdom", "Deaths"].tolist() == [10, 20]
+
+    # Un conteo vacío en la serie queda nulo, como con "pd.merge"
+    other.loc[0, "1/23/20"] = np.nan
+    deaths = to_database_format(other, "Deaths")[0]
+    expected = typed_merge(confirmed, deaths, deaths.rename(columns = {"Deaths": "Recovered"}))
+    result = merge_series(confirmed, [deaths, deaths.rename(columns = {"Deaths": "Recovered"})])
+    assert result["Deaths"].astype("Float64").tolist() == expected["Deaths"].astype("Float64").tolist()
+    assert result.loc[result["Country/Region"] == "United Kingdom", "Deaths"].isna().tolist() == [False, True]
+
+
+# FUNCIÓN: Mide tiempo y memoria pico de una función
+def measure(func, *args):
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    df_out = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak, len(df_out)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type = int, nargs = "+", default = [1, 10])
+    parser.add_argument("--dates", type = int, default = BASE_DATES)
+    args = parser.parse_args()
+
+    check_mismatched_regions()
+
+    print(f"{'scale':>6} {'rows':>12} {'impl':>10} {'time (s)':>10} {'peak (MB)':>10}")
+
+    for scale in args.scales:
+
+        num_regions = BASE_REGIONS * scale
+        confirmed = make_wide_frame(num_regions, args.dates, seed = 0)
+        deaths = make_wide_frame(num_regions, args.dates, seed = 1)
+        deaths[["Lat", "Long"]] = confirmed[["Lat", "Long"]]
+
+        # Como en los archivos reales, "recovered" tiene menos regiones que "confirmed"
+        recovered = make_wide_frame(num_regions, args.dates, seed = 2)
+        recovered[["Lat", "Long"]] = confirmed[["Lat", "Long"]]
+        recovered = recovered.iloc[:int(num_regions * 0.95)]
+
+        legacy = [legacy_to_database_format(df, name)[0] for df, name in [(confirmed, "Confirmed"), (deaths, "Deaths"), (recovered, "Recovered")]]
+        typed = [to_database_format(df, name)[0] for df, name in [(confirmed, "Confirmed"), (deaths, "Deaths"), (recovered, "Recovered")]]
+
+        runs = [
+            ("legacy", legacy_merge, legacy),
+            ("pd.merge", typed_merge, typed),
+            ("region", lambda c, d, r: merge_series(c, [d, r]), typed)
+        ]
+
+        for name, func, frames in runs:
+            elapsed, peak, rows = measure(func, *frames)
+            print(f"{scale:>5}x {rows:>12,} {name:>10} {elapsed:>10.3f} {peak / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark de "to_database_format": implementación original (np.repeat + lista de
+strings de fechas) contra la implementación vectorizada y tipada de pipeline.reshape.
+
+Se generan archivos sintéticos con la forma de los archivos de JHU (~290 regiones x
+~900 fechas) escalados 1x, 10x y 100x en número de regiones, y se reporta el tiempo
+de ejecución y la memoria pico (tracemalloc) de cada implementación.
+
+Uso (desde "Dashboard"):
+    python benchmarks/bench_to_database_format.py
+    python benchmarks/bench_to_database_format.py --scales 1 10 --legacy-max-scale 10
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dags"))
+
+from pipeline.reader import iter_long_blocks
+from pipeline.reshape import to_database_format
+
+# La implementación original parsea las fechas sin formato explícito
+warnings.filterwarnings("ignore", category = UserWarning)
+
+BASE_REGIONS = 290
+BASE_DATES = 900
+
+
+# FUNCIÓN: Implementación original (previa a pipeline.reshape), usada como referencia
+def legacy_to_database_format(data, column_name):
+
+    data_noFechas = data.iloc[:, 0:4]
+    fechas = data.iloc[:, 4:].columns.values
+    fecha_mas_reciente = str(pd.to_datetime(fechas).max().date())
+
+    num_fechas = len(fechas)
+    num_regiones = len(data)
+
+    df_out = data_noFechas.loc[np.repeat(data.index.values, num_fechas)]
+    df_out = df_out.reset_index()
+    df_out["Date"] = pd.DataFrame(list(fechas) * num_regiones)
+    df_out = df_out.drop(columns = ["index"])
+    df_out[column_name] = np.reshape(data.iloc[:, 4:].values, (-1, 1))
+
+    return(df_out, fecha_mas_reciente)
+
+
+# FUNCIÓN: Genera un archivo "ancho" sintético con el formato de JHU
+def make_wide_frame(num_regions, num_dates, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    fechas = pd.date_range("2020-01-22", periods = num_dates, freq = "D")
+    headers = [f"{d.month}/{d.day}/{d.strftime('%y')}" for d in fechas]
+
+    # Conteos acumulados (no decrecientes), como en los archivos reales
+    counts = np.cumsum(rng.integers(0, 50, size = (num_regions, num_dates)), axis = 1)
+
+    ids = pd.DataFrame({
+        "Province/State": [f"Province {i}" if i % 3 == 0 else np.nan for i in range(num_regions)],
+        "Country/Region": [f"Country {i // 3}" for i in range(num_regions)],
+        "Lat": rng.uniform(-60, 80, num_regions),
+        "Long": rng.uniform(-180, 180, num_regions),
+    })
+
+    return pd.concat([ids, pd.DataFrame(counts, columns = headers)], axis = 1)
+
+
+# FUNCIÓN: Compara con la implementación original un archivo con celdas vacías (los
+# conteos deben quedar nulos, no como enteros inválidos)
+def check_missing_counts():
+
+    data = make_wide_frame(6, 5)
+    data = data.astype({col: float for col in data.columns[4:]})
+    data.iloc[1, 5] = np.nan
+    data.iloc[4, 8] = np.nan
+
+    expected = legacy_to_database_format(data, "Confirmed")[0]["Confirmed"]
+    result, _ = to_database_format(data, "Confirmed")
+
+    assert str(result["Confirmed"].dtype) == "Int32"
+    assert result["Confirmed"].astype("Float64").tolist() == expected.astype("Float64").tolist()
+    assert result["Confirmed"].isna().sum() == 2
+
+    # Sin celdas vacías se conserva int32
+    assert to_database_format(make_wide_frame(6, 5), "Confirmed")[0]["Confirmed"].dtype == np.int32
+
+
+# FUNCIÓN: "reader.iter_long_blocks" (por bloques de fechas y de filas) devuelve las
+# mismas filas que "to_database_format" sobre el archivo completo, con los conteos como
+# Int32 en todos los bloques (aunque solo un bloque tenga celdas vacías)
+def check_long_blocks():
+
+    data = make_wide_frame(7, 10)
+    data = data.astype({col: float for col in data.columns[4:]})
+    data.iloc[5, 12] = np.nan
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "confirmed.csv")
+        data.to_csv(path, index = False)
+
+        expected = to_database_format(pd.read_csv(path), "Confirmed")[0]
+        keys = ["Country/Region", "Province/State", "Lat", "Long", "Date"]
+
+        for row_block in [0, 3]:
+            blocks = list(iter_long_blocks(path, "Confirmed", date_block = 4, row_block = row_block))
+            assert all(str(block["Confirmed"].dtype) == "Int32" for block in blocks)
+
+            result = pd.concat(blocks).astype({"Province/State": object, "Country/Region": object})
+            assert str(result["Confirmed"].dtype) == "Int32"
+            assert len(result) == len(expected)
+            merged = result.merge(expected.astype({"Province/State": object, "Country/Region": object}), on = keys)
+            assert merged["Confirmed_x"].astype("Float64").equals(merged["Confirmed_y"].astype("Float64"))
+
+
+# FUNCIÓN: Mide tiempo y memoria pico de una función
+def measure(func, data):
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    df_out, _ = func(data, "Confirmed")
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak, df_out.memory_usage(deep = True).sum(), len(df_out)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type = int, nargs = "+", default = [1, 10, 100])
+    parser.add_argument("--dates", type = int, default = BASE_DATES)
+    parser.add_argument("--legacy-max-scale", type = int, default = 100,
+                        help = "Escala máxima a la que se ejecuta la implementación original")
+    args = parser.parse_args()
+
+    check_missing_counts()
+    check_long_blocks()
+
+    print(f"{'scale':>6} {'rows':>12} {'impl':>10} {'time (s)':>10} {'peak (MB)':>10} {'output (MB)':>12}")
+
+    for scale in args.scales:
+
+        data = make_wide_frame(BASE_REGIONS * scale, args.dates)
+        impls = [("vectorized", to_database_format)]
+
+        if scale <= args.legacy_max_scale:
+            impls.insert(0, ("legacy", legacy_to_database_format))
+
+        for name, func in impls:
+            elapsed, peak, out_bytes, rows = measure(func, data)
+            print(f"{scale:>5}x {rows:>12,} {name:>10} {elapsed:>10.3f} {peak / 1e6:>10.1f} {out_bytes / 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
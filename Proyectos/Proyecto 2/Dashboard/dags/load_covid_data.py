@@ -1,15 +1,19 @@
 import os
 import pandas as pd
-import numpy as np
 
 from airflow import DAG
 from airflow.contrib.hooks.fs_hook import FSHook
 from airflow.contrib.sensors.file_sensor import FileSensor
 from airflow.hooks.mysql_hook import MySqlHook
-from airflow.operators.python_operator import PythonOperator
+from airflow.operators.python_operator import PythonOperator, ShortCircuitOperator
 from airflow.utils.dates import days_ago
 from structlog import get_logger
 
+from pipeline import countries, deltas, fingerprint, handoff, metrics, parallel, partitions, regions, rollups, snapshot, versions
+from pipeline.bulk_load import bulk_insert, get_bulk_engine
+from pipeline.reshape import merge_series
+from pipeline.staging import load_and_swap
+
 logger = get_logger()
 
 # ===============
@@ -31,131 +35,347 @@ dag = DAG('load_covid_data', description = "DAG for loading new COVID-19 data to
 # FUNCIONES
 # ===============
 
-# FUNCIÓN: Convierte la data al formato de la base de datos
-def to_database_format(data, column_name):
+# Archivos fuente (dentro del volumen "monitor") de cada serie
+SOURCE_FILES = {
+    "confirmed": "time_series_covid19_confirmed_global.csv",
+    "deaths": "time_series_covid19_deaths_global.csv",
+    "recovered": "time_series_covid19_recovered_global.csv"
+}
+
+# Nombre de la columna de conteos de cada serie
+SERIES_COLUMNS = {
+    "confirmed": "Confirmed",
+    "deaths": "Deaths",
+    "recovered": "Recovered"
+}
+
+# Modo de formateo de las series:
+# - "per_series": una tarea por serie (format_confirmed, format_deaths, format_recovered)
+# - "parallel": una sola tarea (format_all) que formatea las tres series en paralelo,
+#   con COVID_FORMAT_WORKERS procesos. Útil en hosts donde se corre una sola tarea grande.
+FORMAT_MODE = os.environ.get("COVID_FORMAT_MODE", "per_series")
+
+# Parámetros fijos con los que se guardan las salidas reutilizables de cada serie
+# (la fecha de la carga incremental no es parte de ellos, ver "get_reusable_output")
+OUTPUT_PARAMS = {"format_version": parallel.FORMAT_VERSION}
+
+# Tarea que publica en XCom el descriptor de cada serie
+FORMAT_TASK_IDS = {
+    series: "format_all" if FORMAT_MODE == "parallel" else f"format_{series}"
+    for series in SOURCE_FILES
+}
 
-    # Dataset sin datos por fecha
-    data_noFechas = data.iloc[:, 0:4]
+# --------------
+# FUNCIÓN: Directorio de intercambio de datos entre tareas de la corrida actual
+# (Los dataframes se guardan como archivos Arrow y por XCom solo pasa un descriptor)
+def get_handoff_dir(context):
 
-    # Fechas cubiertas por la data
-    fechas = data.iloc[:, 4:].columns.values
+    return handoff.run_dir(FSHook('fs_default').get_path(), dag.dag_id, context['run_id'])
 
-    # Se extrae la fecha más reciente del dataset
-    fecha_mas_reciente = str(pd.to_datetime(fechas).max().date())
+# --------------
+# FUNCIÓN: Revisar si se pidió una recarga completa
+# (airflow trigger_dag load_covid_data -c '{"full_reload": true}')
+def is_full_reload(context):
 
-    # Número de fechas y número de combinaciones únicas de país y estado
-    num_fechas = len(fechas)
-    num_regiones = len(data)
+    dag_run = context.get('dag_run')
+    return bool(dag_run and dag_run.conf and dag_run.conf.get("full_reload", False))
 
-    # Se repiten las regiones tantas veces como hay fechas
-    # (Para que cada país tenga todas las fechas)
-    df_out = data_noFechas.loc[np.repeat(data.index.values, num_fechas)]
-    df_out = df_out.reset_index()
+# --------------
+# FUNCIÓN: Revisar si los archivos fuente cambiaron desde la última corrida exitosa
+# (Si ninguno cambió, se omite el resto del DAG)
+@metrics.instrument
+def check_sources(**context):
 
-    # Se repite la secuencia de fechas tantas veces como hay regiones
-    # (Se elimina la columna de index creada previamente por "reset_index")
-    df_out["Date"] = pd.DataFrame(list(fechas) * num_regiones)
-    df_out = df_out.drop(columns = ["index"])
+    fingerprints, changed = fingerprint.check_sources(FSHook('fs_default').get_path(), dag.dag_id, list(SOURCE_FILES.values()))
 
-    # Se extraen los casos confirmados y se ordenan para que coincidan con el orden
-    # del resto de la tabla.
-    df_out[column_name] = np.reshape(data.iloc[:, 4:].values, (-1, 1))
+    # En una recarga completa se procesan todos los archivos
+    if is_full_reload(context):
+        changed = list(SOURCE_FILES.values())
 
-    return(df_out, fecha_mas_reciente)
+    logger.info(f"Changed sources: {changed if changed else 'none, skipping run'}")
 
+    ti = context['ti']
+    ti.xcom_push(key = "source_fingerprints", value = fingerprints)
+    ti.xcom_push(key = "changed_sources", value = changed)
+
+    return len(changed) > 0
 
 # --------------
-# FUNCIÓN: Conversión de datos de confirmados
-def format_confirmed(**context):
+# FUNCIÓN: Obtener la última fecha cargada en la base de datos
+@metrics.instrument
+def get_last_loaded_date(**context):
+
+    # Por defecto la carga es incremental. Si la tabla está vacía, MAX(date) es
+    # nulo y se hace una carga completa
+    last_date = None
+    if not is_full_reload(context):
+        last_date = MySqlHook('mysql_default').get_first("SELECT MAX(date) FROM test.covid_fact")[0]
 
-    confirmed = pd.read_csv(f"{FSHook('fs_default').get_path()}/time_series_covid19_confirmed_global.csv")
-    db_confirmed, max_date = to_database_format(confirmed, "Confirmed")
+    last_date = str(pd.Timestamp(last_date).date()) if last_date is not None else None
+    logger.info(f"Load mode: {'incremental' if last_date else 'full'} (last loaded date: {last_date})")
 
     ti = context['ti']
-    ti.xcom_push(key = "confirmed_data", value = [db_confirmed, max_date])
+    ti.xcom_push(key = "last_loaded_date", value = last_date)
 
 # --------------
-# FUNCIÓN: Conversión de datos de muertes
-def format_deaths(**context):
+# FUNCIÓN: Descriptor de la salida de la última corrida exitosa para una serie, si su
+# archivo fuente no cambió y la salida incluye todas las fechas posteriores a la última
+# fecha cargada. Si incluye fechas que ya están cargadas, se vuelve a escribir sin ellas.
+def get_reusable_output(series, context):
+
+    ti = context['ti']
+    last_date = ti.xcom_pull(key = "last_loaded_date", task_ids = "get_last_loaded_date")
+    fingerprints = ti.xcom_pull(key = "source_fingerprints", task_ids = "check_sources")
+    changed = ti.xcom_pull(key = "changed_sources", task_ids = "check_sources")
+
+    filename = SOURCE_FILES[series]
+    if filename in changed:
+        return None
 
-    deaths = pd.read_csv(f"{FSHook('fs_default').get_path()}/time_series_covid19_deaths_global.csv")
-    db_deaths, max_date = to_database_format(deaths, "Deaths")
+    base_dir = FSHook('fs_default').get_path()
+    descriptor = fingerprint.reusable_output(base_dir, dag.dag_id, filename, fingerprints[filename], OUTPUT_PARAMS, since = last_date)
+    if descriptor is None:
+        return None
+
+    logger.info(f"{filename} unchanged, reusing {descriptor['path']}")
+
+    # La salida reemplaza a la guardada (que ya no se necesita para fechas anteriores)
+    if descriptor["since"] != last_date:
+        sliced = handoff.filter_after(descriptor, "Date", last_date, handoff.cache_dir(base_dir, dag.dag_id), series)
+        descriptor = dict(sliced, max_date = descriptor["max_date"], since = last_date)
+
+    return descriptor
+
+# --------------
+# FUNCIÓN: Conversión de una serie (confirmados, muertes o recuperados) al formato de
+# la base de datos. Si el archivo fuente no cambió desde la última corrida exitosa, se
+# reutiliza la salida de esa corrida en lugar de volver a leer el CSV.
+def format_series(series, context):
 
     ti = context['ti']
-    ti.xcom_push(key = "deaths_data", value = [db_deaths, max_date])
+    last_date = ti.xcom_pull(key = "last_loaded_date", task_ids = "get_last_loaded_date")
+    base_dir = FSHook('fs_default').get_path()
+
+    # El CSV se lee por bloques de columnas de fecha, y cada bloque (ya en formato
+    # largo) se escribe directamente al archivo de intercambio
+    descriptor = get_reusable_output(series, context)
+    if descriptor is None:
+        descriptor = parallel.format_source(f"{base_dir}/{SOURCE_FILES[series]}", SERIES_COLUMNS[series],
+                                            handoff.cache_dir(base_dir, dag.dag_id), series,
+                                            since = last_date)
+
+    metrics.add_rows(rows_out = descriptor["rows"])
+    ti.xcom_push(key = f"{series}_data", value = [descriptor, descriptor["max_date"]])
+
+# --------------
+# FUNCIÓN: Conversión de datos de confirmados
+@metrics.instrument
+def format_confirmed(**context):
+
+    format_series("confirmed", context)
+
+# --------------
+# FUNCIÓN: Conversión de datos de muertes
+@metrics.instrument
+def format_deaths(**context):
+
+    format_series("deaths", context)
 
 
 # --------------
 # FUNCIÓN: Conversión de datos de recuperados
+@metrics.instrument
 def format_recovered(**context):
 
-    recovered = pd.read_csv(f"{FSHook('fs_default').get_path()}/time_series_covid19_recovered_global.csv")
-    db_recovered, max_date = to_database_format(recovered, "Recovered")
+    format_series("recovered", context)
+
+
+# --------------
+# FUNCIÓN: Conversión de las tres series en una sola tarea (COVID_FORMAT_MODE=parallel).
+# Cada serie que cambió se formatea en su propio proceso; los procesos escriben sus
+# archivos de intercambio y solo regresan el descriptor, no el dataframe.
+@metrics.instrument
+def format_all(**context):
 
     ti = context['ti']
-    ti.xcom_push(key = "recovered_data", value = [db_recovered, max_date])
+    last_date = ti.xcom_pull(key = "last_loaded_date", task_ids = "get_last_loaded_date")
+    base_dir = FSHook('fs_default').get_path()
+
+    descriptors = {}
+    sources = {}
+    for series in SOURCE_FILES:
+        descriptor = get_reusable_output(series, context)
+        if descriptor is None:
+            sources[series] = (f"{base_dir}/{SOURCE_FILES[series]}", SERIES_COLUMNS[series])
+        else:
+            descriptors[series] = descriptor
+
+    descriptors.update(parallel.format_sources(sources, handoff.cache_dir(base_dir, dag.dag_id), since = last_date))
+
+    for series, descriptor in descriptors.items():
+        metrics.add_rows(rows_out = descriptor["rows"])
+        ti.xcom_push(key = f"{series}_data", value = [descriptor, descriptor["max_date"]])
 
 
 # --------------
 # FUNCIÓN: Unir los dataframes de confirmados, recuperados y muertos
+@metrics.instrument
 def merge_data(**context):
 
     # Se obtiene la "ti" o "Task instance"
     ti = context['ti']
 
-    # Se recuperan los datos de XCOM
-    db_confirmed, date_confirmed = ti.xcom_pull(key = "confirmed_data", task_ids = "format_confirmed")
-    db_deaths, date_deaths = ti.xcom_pull(key = "deaths_data", task_ids = "format_deaths")
-    db_recovered, date_recovered = ti.xcom_pull(key = "recovered_data", task_ids = "format_recovered")
+    # Se recuperan los descriptores de XCOM
+    desc_confirmed, date_confirmed = ti.xcom_pull(key = "confirmed_data", task_ids = FORMAT_TASK_IDS["confirmed"])
+    desc_deaths, date_deaths = ti.xcom_pull(key = "deaths_data", task_ids = FORMAT_TASK_IDS["deaths"])
+    desc_recovered, date_recovered = ti.xcom_pull(key = "recovered_data", task_ids = FORMAT_TASK_IDS["recovered"])
 
     # Se revisa que todas las fechas máximas sean iguales
     if (date_confirmed == date_deaths) and (date_deaths == date_recovered):
 
-        # Unión de confirmados y muertes
-        df_merge1 = pd.merge(left = db_confirmed, right = db_deaths, on = ["Province/State", "Country/Region", "Lat", "Long", "Date"], how = "left")
-
-        # Unión de confirmados, muertes y recuperados
-        df_merge2 = pd.merge(left = df_merge1, right = db_recovered, on = ["Province/State", "Country/Region", "Lat", "Long", "Date"], how = "left")
+        # Se leen los datos de los archivos de intercambio
+        db_confirmed = handoff.read_frame(desc_confirmed)
+        db_deaths = handoff.read_frame(desc_deaths)
+        db_recovered = handoff.read_frame(desc_recovered)
 
-        # Convierte las fechas a datetime
-        df_merge2["Date"] = pd.to_datetime(df_merge2["Date"])
+        # Unión de confirmados, muertes y recuperados (left join sobre confirmados)
+        # alineando por ID de región y día, en una sola pasada.
+        # (Las fechas ya son datetime desde "to_database_format")
+        df_merged = merge_series(db_confirmed, [db_deaths, db_recovered])
+        metrics.add_rows(rows_in = len(db_confirmed) + len(db_deaths) + len(db_recovered), rows_out = len(df_merged))
 
-        ti.xcom_push(key = "merged_df", value = df_merge2)
+        ti.xcom_push(key = "merged_df", value = handoff.write_frame(df_merged, get_handoff_dir(context), "merged"))
 
     else:
         raise Exception("ERROR: Files were extracted on different dates. We encourage you to download them from the same date.")
 
 # --------------
 # FUNCIÓN: Postear a base de datos
+@metrics.instrument
 def post_to_db(**context):
 
     ti = context['ti']
-    merged_df = ti.xcom_pull(key = "merged_df", task_ids = "merge_data")
-
-    # Se renombran las columnas del dataframe para que sean compatibles con
-    # la base de datos de MySQL
-    merged_df = merged_df.rename(columns = {
-        "Province/State": "province_state",
-        "Country/Region": "country_region",
-        "Lat": "lat",
-        "Long": "lon",
-        "Date": "date",
-        "Confirmed": "confirmed",
-        "Deaths": "deaths",
-        "Recovered": "recovered"})
-    
+    merged_df = handoff.read_frame(ti.xcom_pull(key = "merged_df", task_ids = "merge_data"))
+    last_date = ti.xcom_pull(key = "last_loaded_date", task_ids = "get_last_loaded_date")
+
     # Para ejecutarlo de forma transaccional
     # (Editar la conexión en 'Connections' antes: Host = db / Schema = test / Login = test / Password = test123 / Port = 3306)
-    connection = MySqlHook('mysql_default').get_sqlalchemy_engine()
+    connection = get_bulk_engine(MySqlHook('mysql_default'))
 
-    # Se agregan los datos a la base de datos
-    # (Borrando los mismos primero)
+    # Se registran las regiones nuevas en la dimensión "region" (con el ID de su país,
+    # por código ISO3) y cada fila se convierte a una fila de la tabla de hechos (ID de
+    # región, fecha y conteos)
+    lookup = countries.load_iso3_lookup(FSHook('fs_default').get_path())
     with connection.begin() as transaction:
-        transaction.execute("DELETE FROM test.covid_data WHERE 1=1")
-        merged_df.to_sql('covid_data', con = transaction, schema = 'test', if_exists = 'append', index = False)
+        region_ids = regions.upsert_regions(transaction, merged_df, lookup, schema = 'test')
+        regions.refresh_region_attributes(transaction, schema = 'test')
+
+    fact_df = regions.to_fact(merged_df, region_ids)
+
+    # Cambio diario y ventanas de 7 días por región. En una carga incremental se usan
+    # los últimos 7 días ya cargados como punto de partida.
+    history = None
+    if last_date is not None:
+        history = pd.read_sql(
+            "SELECT region_id, date, confirmed, deaths, recovered FROM test.covid_fact WHERE date > %s - INTERVAL %s DAY",
+            con = connection,
+            params = (last_date, deltas.WINDOW),
+            parse_dates = ["date"]
+        )
+
+    fact_df = deltas.add_deltas(fact_df, history)
+
+    # En una carga completa no se vuelven a cargar los meses retirados por la política
+    # de retención ni los que ya están archivados (después de calcular los cambios
+    # diarios, para que el primer día conservado tenga su cambio real)
+    if last_date is None and not fact_df.empty:
+        cutoff = partitions.load_cutoff(connection, 'covid_fact', fact_df["date"].max(), schema = 'test')
+        if cutoff is not None:
+            logger.info(f"Skipping {int((fact_df['date'] < cutoff).sum())} rows before {cutoff.date()} (retired or archived)")
+            fact_df = fact_df[fact_df["date"] >= cutoff]
+
+    # La tabla de hechos está particionada por mes: se crean las particiones de los
+    # meses nuevos antes de cargarlos (la tabla de staging copia las particiones)
+    if not fact_df.empty:
+        partitions.ensure_partitions(connection, 'covid_fact', fact_df["date"].max(), schema = 'test')
+
+    # Se agregan los datos a la base de datos
+    # - Carga completa: se carga una tabla de staging y se intercambia con la tabla
+    #   actual con "RENAME TABLE" (la tabla nunca queda vacía ni bloqueada)
+    # - Carga incremental: solo se borran las fechas posteriores a la última fecha
+    #   cargada (para que reintentar la tarea no duplique filas). El filtro por fecha
+    #   limita el DELETE y la carga a las particiones de los meses más recientes
+    if last_date is None:
+        load_and_swap(connection, fact_df, 'covid_fact', schema = 'test')
+    else:
+        with connection.begin() as transaction:
+            transaction.execute("DELETE FROM test.covid_fact WHERE date > %s", (last_date,))
+            bulk_insert(fact_df, 'covid_fact', transaction, schema = 'test')
 
     # Print a log
     logger.info(f"Rows Inserted: {len(merged_df.index)}")
+    metrics.add_rows(rows_in = len(merged_df.index), rows_out = len(merged_df.index))
+
+    # Se eliminan los archivos de intercambio de la corrida
+    handoff.remove_run_dir(get_handoff_dir(context))
+
+# --------------
+# FUNCIÓN: Recalcular las tablas de agregados diarios (global, por continente y por
+# país) que usa el dashboard, a partir de las fechas nuevas
+@metrics.instrument
+def build_rollups(**context):
+
+    ti = context['ti']
+    last_date = ti.xcom_pull(key = "last_loaded_date", task_ids = "get_last_loaded_date")
+
+    # Si una corrida anterior no terminó de construir los agregados, se recalculan
+    # también las fechas que le faltaron
+    last_rollup = MySqlHook('mysql_default').get_first("SELECT MAX(date) FROM test.covid_daily_global")[0]
+    since = None
+    if last_date is not None and last_rollup is not None:
+        since = min(last_date, str(pd.Timestamp(last_rollup).date()))
+
+    # En una carga completa se recalculan las fechas de la tabla de hechos, pero no los
+    # meses retirados o archivados (ya no están en la tabla y los agregados los conservan)
+    if last_date is None:
+        first_date = MySqlHook('mysql_default').get_first("SELECT MIN(date) FROM test.covid_fact")[0]
+        if first_date is not None:
+            since = str((pd.Timestamp(first_date) - pd.Timedelta(days = 1)).date())
+
+    rollups.refresh_rollups(get_bulk_engine(MySqlHook('mysql_default')), since = since, schema = 'test')
+
+    # Política de retención (COVID_RETENTION_MONTHS): los meses más antiguos se sacan
+    # de la tabla de hechos con "EXCHANGE PARTITION" y quedan en tablas de archivo.
+    # Los agregados ya construidos conservan esos meses.
+    partitions.apply_retention(get_bulk_engine(MySqlHook('mysql_default')), 'covid_fact', schema = 'test')
+
+    # Se guardan las huellas de los archivos fuente y las salidas formateadas, para
+    # omitir las siguientes corridas (o ramas) cuyos archivos fuente no cambien
+    outputs = {SOURCE_FILES[series]: ti.xcom_pull(key = f"{series}_data", task_ids = FORMAT_TASK_IDS[series])[0] for series in SOURCE_FILES}
+    fingerprint.save_state(FSHook('fs_default').get_path(), dag.dag_id,
+                           ti.xcom_pull(key = "source_fingerprints", task_ids = "check_sources"),
+                           outputs,
+                           OUTPUT_PARAMS)
+
+# --------------
+# FUNCIÓN: Publicar una copia en formato Arrow del dataset del dashboard (en el
+# volumen compartido con Streamlit), para que el dashboard la abra con memory
+# mapping en lugar de consultar MySQL
+@metrics.instrument
+def publish_snapshot(**context):
+
+    connection = get_bulk_engine(MySqlHook('mysql_default'))
+
+    descriptor = snapshot.publish_snapshot(
+        connection,
+        os.path.join(FSHook('fs_default').get_path(), snapshot.SNAPSHOT_FOLDER),
+        schema = 'test'
+    )
+    metrics.add_rows(rows_out = descriptor["rows"])
+
+    # Última tarea de la carga: se registra una nueva versión de los datos para que
+    # el dashboard los vuelva a leer
+    versions.bump_data_version(connection, dag.dag_id, context['run_id'], schema = 'test')
 
 # ===============
 # SENSORES
@@ -186,16 +406,23 @@ sensor_recovered = FileSensor(task_id = 'recovered_sensor',
 # OPERADORES
 # ===============
 
-DAG_format_confirmed = PythonOperator(task_id = 'format_confirmed', dag = dag, python_callable = format_confirmed, provide_context=True)
-DAG_format_deaths = PythonOperator(task_id = 'format_deaths', dag = dag, python_callable = format_deaths, provide_context=True)
-DAG_format_recovered = PythonOperator(task_id = 'format_recovered', dag = dag, python_callable = format_recovered, provide_context=True)
+DAG_check_sources = ShortCircuitOperator(task_id = 'check_sources', dag = dag, python_callable = check_sources, provide_context=True)
+DAG_get_last_loaded_date = PythonOperator(task_id = 'get_last_loaded_date', dag = dag, python_callable = get_last_loaded_date, provide_context=True)
+if FORMAT_MODE == "parallel":
+    DAG_format = [PythonOperator(task_id = 'format_all', dag = dag, python_callable = format_all, provide_context=True)]
+else:
+    DAG_format = [PythonOperator(task_id = 'format_confirmed', dag = dag, python_callable = format_confirmed, provide_context=True),
+                  PythonOperator(task_id = 'format_deaths', dag = dag, python_callable = format_deaths, provide_context=True),
+                  PythonOperator(task_id = 'format_recovered', dag = dag, python_callable = format_recovered, provide_context=True)]
 DAG_merge_data = PythonOperator(task_id = 'merge_data', dag = dag, python_callable = merge_data, provide_context=True)
 DAG_post_to_db = PythonOperator(task_id = 'post_to_db', dag = dag, python_callable = post_to_db, provide_context=True)
+DAG_build_rollups = PythonOperator(task_id = 'build_rollups', dag = dag, python_callable = build_rollups, provide_context=True)
+DAG_publish_snapshot = PythonOperator(task_id = 'publish_snapshot', dag = dag, python_callable = publish_snapshot, provide_context=True)
 
 # ===============
 # PIPELINE
 # ===============
 
-[sensor_confirmed >> DAG_format_confirmed, 
- sensor_deaths    >> DAG_format_deaths, 
- sensor_recovered >> DAG_format_recovered] >> DAG_merge_data >> DAG_post_to_db
\ No newline at end of file
+[sensor_confirmed, sensor_deaths, sensor_recovered] >> DAG_check_sources >> DAG_get_last_loaded_date
+
+DAG_get_last_loaded_date >> DAG_format >> DAG_merge_data >> DAG_post_to_db >> DAG_build_rollups >> DAG_publish_snapshot
\ No newline at end of file
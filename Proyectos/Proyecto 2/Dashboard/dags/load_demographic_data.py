@@ -7,10 +7,15 @@ from airflow import DAG
 from airflow.contrib.hooks.fs_hook import FSHook
 from airflow.contrib.sensors.file_sensor import FileSensor
 from airflow.hooks.mysql_hook import MySqlHook
-from airflow.operators.python_operator import PythonOperator
+from airflow.operators.python_operator import PythonOperator, ShortCircuitOperator
+from airflow.sensors.external_task_sensor import ExternalTaskSensor
 from airflow.utils.dates import days_ago
 from structlog import get_logger
 
+from pipeline import countries, fingerprint, handoff, metrics, regions, rollups, snapshot, versions
+from pipeline.bulk_load import get_bulk_engine
+from pipeline.staging import load_and_swap
+
 logger = get_logger()
 
 # ===============
@@ -32,11 +37,66 @@ dag = DAG('load_demographic_data', description = "DAG for loading demographic da
 # FUNCIONES
 # ===============
 
+# Archivos fuente (dentro del volumen "monitor") de cada rama del DAG
+SOURCE_FILES = {
+    "country": "time_series_covid19_confirmed_global.csv",
+    "population": "world_bank_population.csv"
+}
+
+# --------------
+# FUNCIÓN: Directorio de intercambio de datos entre tareas de la corrida actual
+# (Los dataframes se guardan como archivos Arrow y por XCom solo pasa un descriptor)
+def get_handoff_dir(context):
+
+    return handoff.run_dir(FSHook('fs_default').get_path(), dag.dag_id, context['run_id'])
+
+# --------------
+# FUNCIÓN: Revisar si los archivos fuente cambiaron desde la última corrida exitosa
+# (Si ninguno cambió, se omite el resto del DAG)
+@metrics.instrument
+def check_sources(**context):
+
+    fingerprints, changed = fingerprint.check_sources(FSHook('fs_default').get_path(), dag.dag_id, list(SOURCE_FILES.values()))
+    logger.info(f"Changed sources: {changed if changed else 'none, skipping run'}")
+
+    ti = context['ti']
+    ti.xcom_push(key = "source_fingerprints", value = fingerprints)
+    ti.xcom_push(key = "changed_sources", value = changed)
+
+    return len(changed) > 0
+
+# --------------
+# FUNCIÓN: Salida de la última corrida exitosa de una rama, si su archivo fuente no cambió
+def get_reusable_output(branch, context):
+
+    ti = context['ti']
+    filename = SOURCE_FILES[branch]
+
+    if filename in ti.xcom_pull(key = "changed_sources", task_ids = "check_sources"):
+        return None
+
+    fingerprints = ti.xcom_pull(key = "source_fingerprints", task_ids = "check_sources")
+    descriptor = fingerprint.reusable_output(FSHook('fs_default').get_path(), dag.dag_id, filename, fingerprints[filename])
+
+    if descriptor is not None:
+        logger.info(f"{filename} unchanged, reusing {descriptor['path']}")
+
+    return descriptor
+
 # --------------
 # FUNCIÓN: Obtener continente y código de cada país
+@metrics.instrument
 def get_country_continentAndCode(**context):
 
-    confirmed = pd.read_csv(f"{FSHook('fs_default').get_path()}/time_series_covid19_confirmed_global.csv")
+    # Si el archivo de confirmados no cambió, se reutiliza la salida anterior
+    ti = context['ti']
+    descriptor = get_reusable_output("country", context)
+
+    if descriptor is not None:
+        ti.xcom_push(key = "country_data", value = descriptor)
+        return
+
+    confirmed = pd.read_csv(f"{FSHook('fs_default').get_path()}/{SOURCE_FILES['country']}")
     
     # Lista de paises únicos en dataset de COVID
     countries = confirmed["Country/Region"].unique().tolist()
@@ -121,92 +181,86 @@ def get_country_continentAndCode(**context):
     for key in manual_correction_codes.keys():
         df_country.loc[df_country["Country"] == key, "Country Code"] = manual_correction_codes[key]
 
-    ti = context['ti']
-    ti.xcom_push(key = "country_data", value = df_country)
+    metrics.add_rows(rows_in = len(confirmed.index), rows_out = len(df_country.index))
+
+    cache_dir = handoff.cache_dir(FSHook('fs_default').get_path(), dag.dag_id)
+    ti.xcom_push(key = "country_data", value = handoff.write_frame(df_country, cache_dir, "country"))
     
 
 # --------------
 # FUNCIÓN: Formatear los datos de población
+@metrics.instrument
 def format_population(**context):
 
-    df_population = pd.read_csv(f"{FSHook('fs_default').get_path()}/world_bank_population.csv")
-
-    # Corrección de nombres de país en base de datos de población, para que
-    # coincida con los nombres de país de los datos de COVID
-    name_correction_population = {
-        "Russian Federation": "Russia",
-        "United States": "US",
-        "Iran, Islamic Rep.": "Iran",
-        "Taiwan*": "Taiwan",
-        "Bahamas, The": "Bahamas",
-        "Brunei Darussalam": "Brunei",
-        "Myanmar": "Burma",
-        "Czech Republic" : "Czechia",
-        "Egypt, Arab Rep.": "Egypt",
-        "Congo, Rep.": "Congo (Brazzaville)",
-        "Congo, Dem. Rep.": "Congo (Kinshasa)",
-        "Gambia, The": "Gambia",
-        "Lao PDR": "Laos",
-        "Micronesia, Fed. Sts.": "Micronesia",
-        "Venezuela, RB" : "Venezuela",
-        "Yemen, Rep.": "Yemen",
-        "Slovak Republic": "Slovakia",
-        "St. Vincent and the Grenadines": "Saint Vincent and the Grenadines",
-        "Kyrgyz Republic": "Kyrgyzstan",
-        "Syrian Arab Republic": "Syria",
-        "St. Lucia": "Saint Lucia",
-        "St. Kitts and Nevis": "Saint Kitts and Nevis",
-        "Korea, Rep.": "Korea, South"
-    }
+    # Si el archivo de población no cambió, se reutiliza la salida anterior
+    ti = context['ti']
+    descriptor = get_reusable_output("population", context)
 
-    for key in name_correction_population.keys():   
-        df_population.loc[df_population["Country Name"] == key, "Country Name"] = name_correction_population[key]
+    if descriptor is not None:
+        ti.xcom_push(key = "population_data", value = descriptor)
+        return
 
-    ti = context['ti']
-    ti.xcom_push(key = "population_data", value = df_population)
+    df_population = pd.read_csv(f"{FSHook('fs_default').get_path()}/{SOURCE_FILES['population']}")
+
+    metrics.add_rows(rows_in = len(df_population.index), rows_out = len(df_population.index))
+
+    cache_dir = handoff.cache_dir(FSHook('fs_default').get_path(), dag.dag_id)
+    ti.xcom_push(key = "population_data", value = handoff.write_frame(df_population, cache_dir, "population"))
 
 # --------------
 # FUNCIÓN: Combinar datos de población y de país
+@metrics.instrument
 def merge_data(**context):
 
     # Se obtiene la "ti" o "Task instance"
     ti = context['ti']
 
     # Se recuperan los datos de XCOM
-    df_country = ti.xcom_pull(key = "country_data", task_ids = "get_country_continentAndCode")
-    df_population = ti.xcom_pull(key = "population_data", task_ids = "format_population")
+    df_country = handoff.read_frame(ti.xcom_pull(key = "country_data", task_ids = "get_country_continentAndCode"))
+    df_population = handoff.read_frame(ti.xcom_pull(key = "population_data", task_ids = "format_population"))
 
     # Año para el que se extraerá la población
     pop_year = "2020"
 
-    # Se combinan los dos dataframes
+    # Se combinan los dos dataframes por código ISO3 de país (el de JHU y el código de
+    # país del Banco Mundial), no por nombre
+    lookup = countries.load_iso3_lookup(FSHook('fs_default').get_path())
+    df_country["ISO3"] = countries.iso3_codes(df_country["Country"], lookup)
+    df_population = df_population.assign(ISO3 = df_population["Country Code"].replace(countries.WORLD_BANK_CODES))
+
     df_demography = pd.merge(
         left = df_country, 
-        right = df_population[["Country Name", pop_year]], 
-        left_on = "Country", 
-        right_on = "Country Name", 
+        right = df_population[["ISO3", pop_year]], 
+        on = "ISO3", 
         how = "left"
     )
 
-    # Se reemplazan los NANs con ceros los dataframes combinados
-    df_demography[df_demography[pop_year].isna()] = df_demography[df_demography[pop_year].isna()].fillna(0)
+    # Los países sin población del Banco Mundial quedan con población nula (y no 0)
+    # y se registran en el log
+    unmatched = df_demography.loc[df_demography[pop_year].isna(), "Country"].tolist()
+    if unmatched:
+        logger.warning(f"No World Bank population for {len(unmatched)} countries: {unmatched}")
 
-    # Se renombra la columna de año y se elimina la redundante de nombre
+    # Se renombra la columna de año y se elimina la de código ISO3 (el ID de país se
+    # obtiene del registro de países al cargar los datos)
     df_demography = df_demography.rename(columns = {pop_year: "Population"})
-    df_demography = df_demography.drop(columns = ["Country Name"])
+    df_demography = df_demography.drop(columns = ["ISO3"])
+
+    metrics.add_rows(rows_in = len(df_country.index) + len(df_population.index), rows_out = len(df_demography.index))
 
     # Se mueven los datos combinados a XCOM
-    ti.xcom_push(key = "demography_data", value = df_demography)
+    ti.xcom_push(key = "demography_data", value = handoff.write_frame(df_demography, get_handoff_dir(context), "demography"))
 
 # --------------
 # FUNCIÓN: Se colocan los datos demográficos en la base de datos
+@metrics.instrument
 def post_to_db(**context):
 
     # Se obtiene la "ti" o "Task instance"
     ti = context['ti']
 
     # Se recuperan los datos de XCOM
-    df_demography = ti.xcom_pull(key = "demography_data", task_ids = "merge_data")
+    df_demography = handoff.read_frame(ti.xcom_pull(key = "demography_data", task_ids = "merge_data"))
 
     # Se renombran las columnas del dataframe para ser congruente con
     # la tabla en base de datos
@@ -219,16 +273,58 @@ def post_to_db(**context):
 
     # Para ejecutarlo de forma transaccional
     # (Editar la conexión en 'Connections' antes: Host = db / Schema = test / Login = test / Password = test123 / Port = 3306)
-    connection = MySqlHook('mysql_default').get_sqlalchemy_engine()
+    connection = get_bulk_engine(MySqlHook('mysql_default'))
 
-    # Se agregan los datos a la base de datos
-    # (Borrando los mismos primero)
+    # Se obtiene el ID entero de cada país por su código ISO3 (compartido con la dimensión
+    # "region" del DAG de datos de COVID), para unir ambas tablas por ID en lugar de por nombre
+    lookup = countries.load_iso3_lookup(FSHook('fs_default').get_path())
     with connection.begin() as transaction:
-        transaction.execute("DELETE FROM test.country_data WHERE 1=1")
-        df_demography.to_sql('country_data', con = transaction, schema = 'test', if_exists = 'append', index = False)
+        df_demography["country_id"] = countries.get_country_ids(transaction, df_demography["name"], lookup, schema = 'test')
+
+    # Si los datos no cambiaron, no se vuelve a cargar la tabla ni se actualizan las
+    # regiones y los agregados. En un reintento de la tarea se actualizan siempre, porque
+    # el intento anterior pudo haber cargado la tabla sin terminar de actualizar el resto.
+    changed = countries.country_data_changed(connection, df_demography, schema = 'test') or ti.try_number > 1
+    logger.info(f"Country data {'changed' if changed else 'unchanged, skipping update'}")
+
+    if changed:
+
+        # Se agregan los datos a la base de datos
+        # (Se carga una tabla de staging y se intercambia con la actual con "RENAME TABLE")
+        load_and_swap(connection, df_demography, 'country_data', schema = 'test')
+
+        # Se actualizan el código de país y el continente de cada región, y con ellos
+        # solo las columnas de los agregados diarios que dependen de "country_data"
+        # (código, continente y población), sin volver a agregar la tabla de hechos
+        with connection.begin() as transaction:
+            regions.refresh_region_attributes(transaction, schema = 'test')
+
+        rollups.refresh_country_attributes(connection, schema = 'test')
+
+        # Se publica una nueva copia del dataset del dashboard con la población, el
+        # código de país y el continente actualizados (después del snapshot del DAG de
+        # datos de COVID, por el sensor "covid_data_sensor")
+        snapshot.publish_snapshot(connection, os.path.join(FSHook('fs_default').get_path(), snapshot.SNAPSHOT_FOLDER), schema = 'test')
+
+        # Se registra una nueva versión de los datos para que el dashboard los vuelva a leer
+        versions.bump_data_version(connection, dag.dag_id, context['run_id'], schema = 'test')
 
     # Print a log
     logger.info(f"Rows Inserted: {len(df_demography.index)}")
+    metrics.add_rows(rows_in = len(df_demography.index), rows_out = len(df_demography.index))
+
+    # Se eliminan los archivos de intercambio de la corrida
+    handoff.remove_run_dir(get_handoff_dir(context))
+
+    # Se guardan las huellas de los archivos fuente y las salidas de cada rama, para
+    # omitir las siguientes corridas (o ramas) cuyos archivos fuente no cambien
+    outputs = {
+        SOURCE_FILES["country"]: ti.xcom_pull(key = "country_data", task_ids = "get_country_continentAndCode"),
+        SOURCE_FILES["population"]: ti.xcom_pull(key = "population_data", task_ids = "format_population")
+    }
+    fingerprint.save_state(FSHook('fs_default').get_path(), dag.dag_id,
+                           ti.xcom_pull(key = "source_fingerprints", task_ids = "check_sources"),
+                           outputs)
 
 # ===============
 # SENSORES
@@ -248,10 +344,23 @@ sensor_population = FileSensor(task_id = 'population_sensor',
                                poke_interval = 5,
                                timeout = 60)
 
+# Espera a que termine la carga de datos de COVID del mismo día (ambos DAGs corren a la
+# misma hora), para que las dos cargas no actualicen a la vez las regiones, los
+# agregados y el snapshot del dashboard
+sensor_covid_data = ExternalTaskSensor(task_id = 'covid_data_sensor',
+                                       dag = dag,
+                                       external_dag_id = 'load_covid_data',
+                                       external_task_id = 'publish_snapshot',
+                                       allowed_states = ['success', 'skipped'],
+                                       mode = 'reschedule',
+                                       poke_interval = 60,
+                                       timeout = 6 * 60 * 60)
+
 # ===============
 # OPERADORES
 # ===============
 
+DAG_check_sources = ShortCircuitOperator(task_id = 'check_sources', dag = dag, python_callable = check_sources, provide_context=True)
 DAG_get_country_continentAndCode = PythonOperator(task_id = 'get_country_continentAndCode', dag = dag, python_callable = get_country_continentAndCode, provide_context=True)
 DAG_format_population = PythonOperator(task_id = 'format_population', dag = dag, python_callable = format_population, provide_context=True)
 DAG_merge_data = PythonOperator(task_id = 'merge_data', dag = dag, python_callable = merge_data, provide_context=True)
@@ -261,5 +370,7 @@ DAG_post_to_db = PythonOperator(task_id = 'post_to_db', dag = dag, python_callab
 # PIPELINE
 # ===============
 
-[sensor_population >> DAG_format_population,
- sensor_confirmed  >> DAG_get_country_continentAndCode] >> DAG_merge_data >> DAG_post_to_db
\ No newline at end of file
+[sensor_population, sensor_confirmed] >> DAG_check_sources
+
+DAG_check_sources >> [DAG_format_population,
+                      DAG_get_country_continentAndCode] >> DAG_merge_data >> sensor_covid_data >> DAG_post_to_db
\ No newline at end of file
@@ -0,0 +1,170 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pycountry_convert as pc
+from structlog import get_logger
+
+logger = get_logger()
+
+# Tabla de códigos de JHU ("UID_ISO_FIPS_LookUp_Table.csv", del mismo repositorio que
+# las series), opcional dentro del volumen "monitor". Si está, su código ISO3 de cada
+# país tiene prioridad sobre PyCountry.
+LOOKUP_FILE = "UID_ISO_FIPS_LookUp_Table.csv"
+
+# Código ISO3 de los países de JHU que PyCountry no reconoce por nombre (los mismos
+# códigos de la tabla de JHU)
+ISO3_CORRECTIONS = {
+    "Burma": "MMR",
+    "Congo (Brazzaville)": "COG",
+    "Congo (Kinshasa)": "COD",
+    "Cote d'Ivoire": "CIV",
+    "Holy See": "VAT",
+    "Korea, South": "KOR",
+    "Kosovo": "XKS",
+    "Taiwan*": "TWN",
+    "US": "USA",
+    "West Bank and Gaza": "PSE"
+}
+
+# Códigos del Banco Mundial distintos del código ISO3 de JHU
+WORLD_BANK_CODES = {
+    "XKX": "XKS"
+}
+
+# ===============
+# FUNCIONES
+# ===============
+
+def load_iso3_lookup(base_dir):
+    """
+    Código ISO3 de cada país según la tabla de códigos de JHU (LOOKUP_FILE), si está
+    en "base_dir". Solo se usan las filas de país (sin provincia ni condado).
+
+    Args:
+        base_dir (str): Directorio de los archivos fuente (volumen "monitor").
+
+    Returns:
+        dict: Código ISO3 de cada nombre de país de JHU (vacío si no está la tabla).
+    """
+
+    path = os.path.join(base_dir, LOOKUP_FILE)
+    if not os.path.exists(path):
+        return {}
+
+    lookup = pd.read_csv(path, usecols = ["iso3", "Province_State", "Country_Region"])
+    lookup = lookup[lookup["Province_State"].isna() & lookup["iso3"].notna()]
+
+    return dict(zip(lookup["Country_Region"], lookup["iso3"]))
+
+
+def iso3_codes(names, lookup = None):
+    """
+    Código ISO3 de cada país de JHU: el de la tabla de códigos de JHU (ver
+    "load_iso3_lookup"), el de ISO3_CORRECTIONS o el de PyCountry. Las entidades sin
+    código ISO3 (cruceros, Juegos Olímpicos) conservan su nombre como código, y se
+    registran en el log.
+
+    Args:
+        names (iterable): Nombre de país de cada fila.
+        lookup (dict, optional): Tabla de códigos de JHU. Defaults to None.
+
+    Returns:
+        np.array: Código ISO3 de cada nombre.
+    """
+
+    lookup = lookup or {}
+    codes, uniques = pd.factorize(pd.Series(names, dtype = object))
+
+    iso3 = []
+    unmatched = []
+    for name in uniques:
+        code = lookup.get(name) or ISO3_CORRECTIONS.get(name)
+        if code is None:
+            try:
+                code = pc.country_name_to_country_alpha3(name, cn_name_format = "default")
+            except KeyError:
+                code = name
+                unmatched.append(name)
+        iso3.append(code)
+
+    if unmatched:
+        logger.warning(f"No ISO3 code for {len(unmatched)} countries, keyed by name: {unmatched}")
+
+    return np.array(iso3, dtype = object)[codes]
+
+
+def get_country_ids(connection, names, lookup = None, schema = "test"):
+    """
+    ID entero de cada país, a partir de su código ISO3 (ver "iso3_codes"). Los países
+    nuevos se registran en la tabla "country" (AUTO_INCREMENT), por lo que el ID de
+    un país no cambia entre cargas ni entre DAGs, aunque "country_data" se recargue
+    completa o JHU cambie el nombre del país. El nombre se guarda solo como atributo
+    (el último con el que se cargó).
+
+    Los dos DAGs obtienen el ID de la misma tabla, de modo que "region" y
+    "country_data" se pueden unir por "country_id" en lugar de por nombre.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o transacción abierta.
+        names (iterable): Nombre de país de cada fila.
+        lookup (dict, optional): Tabla de códigos de JHU (ver "load_iso3_lookup"). Defaults to None.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+
+    Returns:
+        np.array: ID de país de cada nombre.
+    """
+
+    codes, uniques = pd.factorize(pd.Series(names, dtype = object))
+
+    if len(uniques) == 0:
+        return np.array([], dtype = np.int32)
+
+    iso3 = iso3_codes(uniques, lookup)
+    connection.execute(
+        f"INSERT INTO `{schema}`.`country` (iso3, name) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE name = VALUES(name)",
+        list(zip(iso3, uniques))
+    )
+
+    ids = pd.read_sql(f"SELECT id, iso3 FROM `{schema}`.`country`", con = connection)
+    country_ids = ids.set_index("iso3")["id"].reindex(iso3).to_numpy()
+
+    if np.isnan(country_ids.astype(float)).any():
+        raise Exception("ERROR: Some countries could not be registered in the country table.")
+
+    return country_ids.astype(np.int32)[codes]
+
+
+# Columnas de "country_data" que carga el DAG de datos demográficos
+COUNTRY_DATA_COLUMNS = ["country_id", "code", "name", "continent", "population"]
+
+
+def _normalize_country_data(df):
+    """Filas de "country_data" ordenadas y con tipos comparables (nulos como "" o NaN)."""
+
+    df = df[COUNTRY_DATA_COLUMNS].sort_values(["country_id", "name"]).reset_index(drop = True)
+    text_columns = ["code", "name", "continent"]
+    df[text_columns] = df[text_columns].astype(object).where(df[text_columns].notna(), "").astype(str)
+
+    return df.astype({"country_id": np.int64, "population": float})
+
+
+def country_data_changed(connection, df_demography, schema = "test"):
+    """
+    Revisa si los datos demográficos nuevos son distintos de los que ya están en
+    "country_data". Si no cambiaron, no es necesario volver a cargar la tabla ni
+    actualizar las regiones y los agregados que dependen de ella.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o engine.
+        df_demography (pd.DataFrame): Datos nuevos, con las columnas de COUNTRY_DATA_COLUMNS.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+
+    Returns:
+        bool: True si los datos cambiaron.
+    """
+
+    current = pd.read_sql(f"SELECT {', '.join(COUNTRY_DATA_COLUMNS)} FROM `{schema}`.`country_data`", con = connection)
+
+    return not _normalize_country_data(current).equals(_normalize_country_data(df_demography))
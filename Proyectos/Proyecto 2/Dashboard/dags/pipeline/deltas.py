@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+# Conteos acumulados de la tabla de hechos
+COUNTS = ["confirmed", "deaths", "recovered"]
+
+# Días de la ventana móvil
+WINDOW = 7
+
+# Columnas que agrega "add_deltas" por cada conteo: cambio diario ("new_<conteo>"),
+# suma de los últimos WINDOW días ("new_<conteo>_7d") y promedio diario de esa suma
+# ("new_<conteo>_7d_avg")
+DELTA_COLUMNS = [f"new_{count}{suffix}" for count in COUNTS for suffix in ("", "_7d", "_7d_avg")]
+
+# ===============
+# FUNCIONES
+# ===============
+
+def _to_matrix(values, rows, cols, shape):
+    """Coloca una columna en una matriz región x día (las celdas sin dato quedan en NaN)."""
+
+    matrix = np.full(shape, np.nan)
+    matrix[rows, cols] = pd.to_numeric(values).to_numpy(dtype = float, na_value = np.nan)
+
+    return matrix
+
+
+def _to_nullable(values):
+    """Convierte un arreglo float con NaN a enteros nullable (Int32)."""
+
+    mask = np.isnan(values)
+    return pd.arrays.IntegerArray(np.where(mask, 0, values).astype(np.int32), mask)
+
+
+def add_deltas(fact, history = None, window = WINDOW):
+    """
+    Agrega a las filas de la tabla de hechos el cambio diario de cada conteo y la suma
+    y el promedio de los últimos "window" días, por región.
+
+    Se calcula sobre una matriz región x día: como los conteos son acumulados, el cambio
+    diario es C[t] - C[t-1] y la suma de la ventana es C[t] - C[t-window], sin "diff",
+    "rolling" ni "groupby" por región. Antes del primer día con datos de una región su
+    acumulado se toma como 0, por lo que el primer día de una región que aparece después
+    cuenta todos sus casos y las ventanas de sus primeros días se promedian solo sobre
+    los días con datos. Las regiones con datos desde el primer día del dataset no tienen
+    un día anterior: como con el "diff" que calculaba antes el dashboard, ese día no
+    tiene cambio (queda nulo, y el dashboard lo muestra como 0) y sus ventanas empiezan
+    a partir de él. Las correcciones a la baja de JHU se conservan como cambios
+    negativos. Los días sin dato de una región (por ejemplo, regiones sin recuperados)
+    quedan nulos.
+
+    Args:
+        fact (df): Filas nuevas de la tabla de hechos (ver "regions.to_fact").
+        history (df, optional): Filas ya cargadas de los "window" días anteriores a las
+        nuevas (carga incremental), con "region_id", "date" y los conteos. Defaults to None.
+        window (int, optional): Días de la ventana móvil. Defaults to WINDOW.
+
+    Returns:
+        df: "fact" con las columnas de DELTA_COLUMNS.
+    """
+
+    fact = fact.copy()
+    data = fact if history is None else pd.concat([history[["region_id", "date"] + COUNTS], fact[["region_id", "date"] + COUNTS]])
+
+    if data.empty:
+        for column in DELTA_COLUMNS:
+            fact[column] = pd.Series(dtype = "float32" if column.endswith("_avg") else "Int32")
+        return fact
+
+    # Posición de cada fila en la matriz región x día
+    rows, _ = pd.factorize(data["region_id"])
+    dates = data["date"].to_numpy(dtype = "datetime64[D]")
+    cols = (dates - dates.min()).astype(np.int64)
+    shape = (rows.max() + 1, cols.max() + 1)
+
+    # Solo se devuelven las filas de "fact" (las últimas de "data")
+    out_rows, out_cols = rows[-len(fact):], cols[-len(fact):]
+
+    for count in COUNTS:
+
+        matrix = _to_matrix(data[count], rows, cols, shape)
+        missing = np.isnan(matrix)
+
+        # Días desde el primer dato de cada región (0 antes de ese día)
+        days_seen = np.cumsum(np.maximum.accumulate(~missing, axis = 1), axis = 1)
+
+        # Regiones con datos desde el primer día del dataset: ese día es su punto de
+        # partida (sin cambio) y sus ventanas solo cuentan los días posteriores
+        first_day = ~missing[:, 0]
+        days_changed = days_seen - first_day[:, None]
+
+        # Acumulado con ceros antes del primer dato de cada región y "window" columnas al
+        # inicio (ceros, o el primer día de las regiones con datos desde el primer día),
+        # para poder restar C[t-1] y C[t-window] sin casos especiales
+        cumulative = np.where(days_seen > 0, matrix, 0.0)
+        start = np.where(first_day, cumulative[:, 0], 0.0)
+        padded = np.concatenate([np.repeat(start[:, None], window, axis = 1), cumulative], axis = 1)
+
+        new = cumulative - padded[:, window - 1:-1]
+        new_window = cumulative - padded[:, :-window]
+        new_avg = new_window / np.maximum(np.minimum(days_changed, window), 1)
+
+        for values, column in [(new, f"new_{count}"), (new_window, f"new_{count}_7d"), (new_avg, f"new_{count}_7d_avg")]:
+            values[missing] = np.nan
+            values[first_day, 0] = np.nan
+            values = values[out_rows, out_cols]
+            fact[column] = values.astype(np.float32) if column.endswith("_avg") else _to_nullable(values)
+
+    return fact
@@ -0,0 +1,166 @@
+import json
+import os
+
+from pipeline import handoff
+
+# Subdirectorio (dentro del volumen "monitor") con el estado de cada DAG: la huella
+# de cada archivo fuente procesado en la última corrida exitosa y la salida generada
+STATE_FOLDER = ".fingerprints"
+
+# ===============
+# FUNCIONES
+# ===============
+
+def state_path(base_dir, dag_id):
+    """
+    Ruta del archivo de estado de un DAG.
+
+    Args:
+        base_dir (str): Directorio base (ruta del volumen "monitor").
+        dag_id (str): ID del DAG.
+
+    Returns:
+        str: Ruta del archivo JSON de estado.
+    """
+
+    return os.path.join(base_dir, STATE_FOLDER, f"{dag_id}.json")
+
+
+def load_state(base_dir, dag_id):
+    """
+    Lee el estado de la última corrida exitosa de un DAG.
+
+    Returns:
+        dict: Estado por archivo fuente (vacío si el DAG nunca ha terminado una corrida).
+    """
+
+    path = state_path(base_dir, dag_id)
+
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def file_fingerprint(path, previous = None):
+    """
+    Huella de un archivo: SHA-256 de su contenido, tamaño y fecha de modificación.
+    Si el tamaño y la fecha de modificación coinciden con la huella anterior, se
+    reutiliza el hash anterior en lugar de volver a leer el archivo.
+
+    Args:
+        path (str): Ruta del archivo.
+        previous (dict, optional): Huella anterior del mismo archivo. Defaults to None.
+
+    Returns:
+        dict: Huella con las llaves "sha256", "size" y "mtime".
+    """
+
+    stat = os.stat(path)
+
+    if previous is not None and previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime:
+        sha256 = previous["sha256"]
+    else:
+        sha256 = handoff.file_checksum(path)
+
+    return {"sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def check_sources(base_dir, dag_id, filenames):
+    """
+    Compara la huella actual de cada archivo fuente con la de la última corrida exitosa.
+
+    Args:
+        base_dir (str): Directorio donde están los archivos fuente.
+        dag_id (str): ID del DAG.
+        filenames (list): Nombres de los archivos fuente.
+
+    Returns:
+        tuple: Huellas actuales ({archivo: huella}) y lista de archivos que cambiaron.
+    """
+
+    state = load_state(base_dir, dag_id)
+    fingerprints = {}
+    changed = []
+
+    for filename in filenames:
+
+        previous = state.get(filename)
+        fingerprints[filename] = file_fingerprint(os.path.join(base_dir, filename), previous)
+
+        if previous is None or previous["sha256"] != fingerprints[filename]["sha256"]:
+            changed.append(filename)
+
+    return fingerprints, changed
+
+
+def reusable_output(base_dir, dag_id, filename, fingerprint, params = None, since = None):
+    """
+    Devuelve el descriptor de la salida generada para un archivo fuente en la última
+    corrida exitosa, si se puede reutilizar: el archivo fuente no cambió, la salida se
+    generó con los mismos parámetros y el archivo de salida sigue intacto.
+
+    Las salidas de una carga incremental guardan en "since" la fecha a partir de la
+    cual se generaron. Una salida sirve para cualquier "since" igual o posterior (la
+    corrida que la reutiliza descarta las fechas que sobran), o para cualquiera si se
+    generó con todas las fechas.
+
+    Args:
+        base_dir (str): Directorio base (ruta del volumen "monitor").
+        dag_id (str): ID del DAG.
+        filename (str): Nombre del archivo fuente.
+        fingerprint (dict): Huella actual del archivo fuente.
+        params (dict, optional): Parámetros fijos con los que se genera la salida (por
+        ejemplo, la versión del formato). Defaults to None.
+        since (str, optional): Última fecha ya cargada ("YYYY-MM-DD"). Defaults to None.
+
+    Returns:
+        dict: Descriptor de la salida (ver "handoff.write_frame") o None.
+    """
+
+    entry = load_state(base_dir, dag_id).get(filename)
+
+    if entry is None or entry["sha256"] != fingerprint["sha256"] or entry.get("params") != (params or {}):
+        return None
+
+    descriptor = entry.get("output")
+
+    if descriptor is None or not os.path.exists(descriptor["path"]):
+        return None
+
+    covered = descriptor.get("since")
+    if covered is not None and (since is None or since < covered):
+        return None
+
+    if handoff.file_checksum(descriptor["path"]) != descriptor["checksum"]:
+        return None
+
+    return descriptor
+
+
+def save_state(base_dir, dag_id, fingerprints, outputs, params = None):
+    """
+    Guarda el estado de una corrida exitosa. Se debe llamar al final del DAG, una vez
+    que los datos ya están en la base de datos.
+
+    Args:
+        base_dir (str): Directorio base (ruta del volumen "monitor").
+        dag_id (str): ID del DAG.
+        fingerprints (dict): Huellas de los archivos fuente (salida de "check_sources").
+        outputs (dict): Descriptor de la salida generada para cada archivo fuente.
+        params (dict, optional): Parámetros con los que se generaron las salidas. Defaults to None.
+    """
+
+    state = {
+        filename: dict(fingerprint, output = outputs.get(filename), params = params or {})
+        for filename, fingerprint in fingerprints.items()
+    }
+
+    path = state_path(base_dir, dag_id)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent = 2)
+
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,229 @@
+import datetime
+import hashlib
+import os
+import re
+import shutil
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+# Subdirectorio (dentro del volumen "monitor") en el que se guardan los datos
+# intermedios que se pasan de una tarea a otra
+HANDOFF_FOLDER = ".handoff"
+
+# ===============
+# FUNCIONES
+# ===============
+
+def run_dir(base_dir, dag_id, run_id):
+    """
+    Directorio de intercambio de una corrida específica de un DAG.
+
+    Args:
+        base_dir (str): Directorio base (ruta del volumen "monitor").
+        dag_id (str): ID del DAG.
+        run_id (str): ID de la corrida ("run_id" del contexto de Airflow).
+
+    Returns:
+        str: Ruta del directorio de la corrida.
+    """
+
+    # Se eliminan caracteres problemáticos del run_id (":", "+", etc.)
+    run_id = re.sub(r"[^A-Za-z0-9_.-]", "_", run_id)
+
+    return os.path.join(base_dir, HANDOFF_FOLDER, dag_id, run_id)
+
+
+def cache_dir(base_dir, dag_id):
+    """
+    Directorio de un DAG para salidas que se conservan entre corridas (por ejemplo,
+    datos formateados que se reutilizan si su archivo fuente no cambia).
+
+    Args:
+        base_dir (str): Directorio base (ruta del volumen "monitor").
+        dag_id (str): ID del DAG.
+
+    Returns:
+        str: Ruta del directorio.
+    """
+
+    return os.path.join(base_dir, HANDOFF_FOLDER, dag_id, "cache")
+
+
+def file_checksum(path, block_size = 1 << 20):
+    """
+    Calcula el SHA-256 de un archivo leyéndolo por bloques.
+
+    Args:
+        path (str): Ruta del archivo.
+        block_size (int, optional): Tamaño de cada bloque leído. Defaults to 1MB.
+
+    Returns:
+        str: Hash en hexadecimal.
+    """
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def write_frame(df, directory, name):
+    """
+    Escribe un dataframe como archivo Arrow (Feather v2, sin compresión para que se
+    pueda leer con memory mapping) y devuelve un descriptor pequeño, apto para XCom,
+    en lugar del dataframe completo.
+
+    Args:
+        df (df): Dataframe a guardar.
+        directory (str): Directorio de la corrida (ver "run_dir").
+        name (str): Nombre del archivo (sin extensión).
+
+    Returns:
+        dict: Descriptor con la ruta, el esquema, el número de filas y el checksum.
+    """
+
+    os.makedirs(directory, exist_ok = True)
+    path = os.path.join(directory, f"{name}.arrow")
+
+    # Se escribe a un archivo temporal y luego se renombra, para que una tarea que
+    # falle a medio camino nunca deje un archivo incompleto con el nombre final
+    table = pa.Table.from_pandas(df, preserve_index = False)
+    feather.write_feather(table, path + ".tmp", compression = "uncompressed")
+    os.replace(path + ".tmp", path)
+
+    return {
+        "path": path,
+        "schema": {field.name: str(field.type) for field in table.schema},
+        "rows": table.num_rows,
+        "checksum": file_checksum(path)
+    }
+
+
+def write_frames(frames, directory, name):
+    """
+    Igual que "write_frame", pero recibe un iterable de dataframes (por ejemplo, los
+    bloques de "reader.iter_long_blocks") y los escribe uno por uno al mismo archivo
+    Arrow, sin concatenarlos en memoria. Todos deben tener las mismas columnas y tipos.
+
+    Args:
+        frames (iterable): Dataframes a guardar (al menos uno).
+        directory (str): Directorio de la corrida (ver "run_dir").
+        name (str): Nombre del archivo (sin extensión).
+
+    Returns:
+        dict: Descriptor con la ruta, el esquema, el número de filas y el checksum.
+    """
+
+    os.makedirs(directory, exist_ok = True)
+    path = os.path.join(directory, f"{name}.arrow")
+
+    schema = None
+    writer = None
+    rows = 0
+
+    try:
+        for df in frames:
+
+            # El esquema del primer bloque se usa para todos los demás
+            table = pa.Table.from_pandas(df, schema = schema, preserve_index = False)
+
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_file(path + ".tmp", schema)
+
+            writer.write_table(table)
+            rows += table.num_rows
+
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        raise Exception(f"ERROR: No data to write to handoff file {path}.")
+
+    os.replace(path + ".tmp", path)
+
+    return {
+        "path": path,
+        "schema": {field.name: str(field.type) for field in schema},
+        "rows": rows,
+        "checksum": file_checksum(path)
+    }
+
+
+def filter_after(descriptor, column, since, directory, name):
+    """
+    Escribe un nuevo archivo de intercambio con solo las filas de un archivo existente
+    cuya fecha en "column" es posterior a "since". El archivo se lee con memory mapping
+    y se filtra con Arrow, sin convertirlo a pandas.
+
+    Args:
+        descriptor (dict): Descriptor del archivo existente (ver "write_frame").
+        column (str): Columna de fecha.
+        since (str): Fecha ("YYYY-MM-DD"); se conservan las filas posteriores.
+        directory (str): Directorio en el que se escribe el nuevo archivo.
+        name (str): Nombre del nuevo archivo (sin extensión).
+
+    Returns:
+        dict: Descriptor del nuevo archivo.
+    """
+
+    table = feather.read_table(descriptor["path"], memory_map = True)
+    bound = pa.scalar(datetime.datetime.fromisoformat(since), type = table.schema.field(column).type)
+    table = table.filter(pc.greater(table[column], bound))
+
+    os.makedirs(directory, exist_ok = True)
+    path = os.path.join(directory, f"{name}.arrow")
+
+    # Se escribe a un archivo temporal y luego se renombra (el archivo nuevo puede
+    # reemplazar al que se está leyendo)
+    feather.write_feather(table, path + ".tmp", compression = "uncompressed")
+    os.replace(path + ".tmp", path)
+
+    return {
+        "path": path,
+        "schema": {field.name: str(field.type) for field in table.schema},
+        "rows": table.num_rows,
+        "checksum": file_checksum(path)
+    }
+
+
+def read_frame(descriptor, verify = True):
+    """
+    Lee un dataframe a partir de un descriptor generado por "write_frame". El archivo
+    se abre con memory mapping, por lo que no se copia a memoria antes de convertirlo.
+
+    Args:
+        descriptor (dict): Descriptor obtenido de XCom.
+        verify (bool, optional): Verificar checksum y número de filas. Defaults to True.
+
+    Returns:
+        df: Dataframe guardado.
+    """
+
+    path = descriptor["path"]
+
+    if verify and file_checksum(path) != descriptor["checksum"]:
+        raise Exception(f"ERROR: Handoff file {path} does not match its checksum.")
+
+    table = feather.read_table(path, memory_map = True)
+
+    if verify and table.num_rows != descriptor["rows"]:
+        raise Exception(f"ERROR: Handoff file {path} has {table.num_rows} rows, expected {descriptor['rows']}.")
+
+    return table.to_pandas()
+
+
+def remove_run_dir(directory):
+    """
+    Elimina los archivos de intercambio de una corrida (una vez que ya no se necesitan).
+
+    Args:
+        directory (str): Directorio de la corrida (ver "run_dir").
+    """
+
+    shutil.rmtree(directory, ignore_errors = True)
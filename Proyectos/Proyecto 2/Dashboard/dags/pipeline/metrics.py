@@ -0,0 +1,246 @@
+import functools
+import os
+import pickle
+import resource
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from structlog import get_logger
+
+logger = get_logger()
+
+# Base de datos SQLite local en la que se guardan las métricas de cada etapa
+METRICS_DB = os.environ.get(
+    "PIPELINE_METRICS_DB",
+    os.path.join(os.environ.get("AIRFLOW_HOME", os.path.expanduser("~")), "task_metrics.db")
+)
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS task_metrics (
+    dag_id TEXT,
+    task_id TEXT,
+    run_id TEXT,
+    stage TEXT,
+    started_at TEXT,
+    status TEXT,
+    wall_seconds REAL,
+    cpu_seconds REAL,
+    peak_rss_mb REAL,
+    rows_in INTEGER,
+    rows_out INTEGER,
+    bytes_read INTEGER,
+    bytes_written INTEGER,
+    xcom_in_bytes INTEGER,
+    xcom_out_bytes INTEGER
+)
+"""
+
+# Etapas en curso (la última es la que recibe los conteos de "add_rows")
+_active = []
+
+# ===============
+# FUNCIONES
+# ===============
+
+def _io_counters():
+    """
+    Bytes leídos y escritos por el proceso hasta el momento. En Linux se usan los
+    contadores de "/proc/self/io" (incluyen archivos y sockets, como la conexión a
+    MySQL); en otros sistemas, los bloques de entrada y salida de "getrusage".
+
+    Returns:
+        tuple: Bytes leídos y bytes escritos.
+    """
+
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+
+    except (OSError, KeyError, ValueError):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_inblock * 512, usage.ru_oublock * 512
+
+
+def _cpu_seconds():
+    """Tiempo de CPU (usuario + sistema) del proceso y de sus procesos hijos terminados."""
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _peak_rss_mb():
+    """Memoria residente máxima (MB) del proceso o de sus procesos hijos."""
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # Linux reporta "ru_maxrss" en KB
+    return peak / 1024
+
+
+def _payload_size(value):
+    """Tamaño (bytes) de un valor de XCom serializado con pickle."""
+
+    try:
+        return len(pickle.dumps(value))
+    except Exception:
+        return 0
+
+
+def add_rows(rows_in = 0, rows_out = 0):
+    """
+    Suma filas de entrada y/o salida a la etapa en curso. No hace nada si se llama
+    fuera de una etapa instrumentada.
+
+    Args:
+        rows_in (int, optional): Filas leídas por la etapa. Defaults to 0.
+        rows_out (int, optional): Filas producidas por la etapa. Defaults to 0.
+    """
+
+    if _active:
+        _active[-1]["rows_in"] += int(rows_in)
+        _active[-1]["rows_out"] += int(rows_out)
+
+
+def save_metrics(metrics, path = None):
+    """
+    Agrega las métricas de una etapa a la tabla "task_metrics" de la base de datos
+    local. Un error al guardar las métricas se registra, pero no detiene la tarea.
+
+    Args:
+        metrics (dict): Métricas de la etapa (ver "stage").
+        path (str, optional): Ruta de la base de datos. Defaults to METRICS_DB.
+    """
+
+    path = path or METRICS_DB
+    columns = list(metrics.keys())
+
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+        with sqlite3.connect(path, timeout = 30) as connection:
+            connection.execute(CREATE_TABLE)
+            connection.execute(
+                f"INSERT INTO task_metrics ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [metrics[col] for col in columns]
+            )
+        connection.close()
+
+    except Exception as error:
+        logger.warning("stage_metrics_not_saved", path = path, error = str(error))
+
+
+@contextmanager
+def stage(name, dag_id = None, task_id = None, run_id = None, ti = None):
+    """
+    Mide una etapa: tiempo real, tiempo de CPU, memoria residente máxima, filas de
+    entrada y salida (ver "add_rows"), bytes leídos y escritos, y tamaño de los datos
+    enviados y recibidos por XCom (si se recibe la "ti"). Al terminar, emite el evento
+    "stage_metrics" y guarda las métricas con "save_metrics", aunque la etapa falle.
+
+    La memoria máxima es la del proceso completo; en Airflow cada tarea corre en su
+    propio proceso, por lo que corresponde a la tarea.
+
+    Args:
+        name (str): Nombre de la etapa.
+        dag_id (str, optional): ID del DAG. Defaults to None.
+        task_id (str, optional): ID de la tarea. Defaults to None.
+        run_id (str, optional): ID de la corrida. Defaults to None.
+        ti (TaskInstance, optional): Task instance, para medir XCom. Defaults to None.
+
+    Yields:
+        dict: Métricas de la etapa (se completan al salir).
+    """
+
+    metrics = {
+        "dag_id": dag_id,
+        "task_id": task_id,
+        "run_id": run_id,
+        "stage": name,
+        "started_at": datetime.utcnow().isoformat(),
+        "status": "success",
+        "rows_in": 0,
+        "rows_out": 0,
+        "xcom_in_bytes": 0,
+        "xcom_out_bytes": 0
+    }
+
+    # Se envuelven "xcom_push" y "xcom_pull" de la task instance para medir lo que
+    # se envía y se recibe por XCom durante la etapa
+    if ti is not None:
+        xcom_push, xcom_pull = ti.xcom_push, ti.xcom_pull
+
+        def measured_push(*args, **kwargs):
+            value = kwargs["value"] if "value" in kwargs else args[1]
+            metrics["xcom_out_bytes"] += _payload_size(value)
+            return xcom_push(*args, **kwargs)
+
+        def measured_pull(*args, **kwargs):
+            value = xcom_pull(*args, **kwargs)
+            metrics["xcom_in_bytes"] += _payload_size(value)
+            return value
+
+        ti.xcom_push, ti.xcom_pull = measured_push, measured_pull
+
+    bytes_read, bytes_written = _io_counters()
+    cpu = _cpu_seconds()
+    start = time.perf_counter()
+    _active.append(metrics)
+
+    try:
+        yield metrics
+
+    except BaseException:
+        metrics["status"] = "failed"
+        raise
+
+    finally:
+        _active.remove(metrics)
+
+        if ti is not None:
+            ti.xcom_push, ti.xcom_pull = xcom_push, xcom_pull
+
+        end_read, end_written = _io_counters()
+        metrics["wall_seconds"] = round(time.perf_counter() - start, 4)
+        metrics["cpu_seconds"] = round(_cpu_seconds() - cpu, 4)
+        metrics["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+        metrics["bytes_read"] = end_read - bytes_read
+        metrics["bytes_written"] = end_written - bytes_written
+
+        logger.info("stage_metrics", **metrics)
+        save_metrics(metrics)
+
+
+def instrument(func):
+    """
+    Decorador para los "python_callable" de los PythonOperator: ejecuta la función
+    dentro de una etapa (ver "stage") con el nombre de la función. Si la tarea recibe
+    el contexto de Airflow ("provide_context=True"), se registran el DAG, la tarea, la
+    corrida y el tamaño de XCom, incluido el valor de retorno (que Airflow publica
+    como "return_value").
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+
+        ti = kwargs.get("ti")
+        dag_run = kwargs.get("dag_run")
+
+        with stage(func.__name__,
+                   dag_id = getattr(ti, "dag_id", None),
+                   task_id = getattr(ti, "task_id", None),
+                   run_id = getattr(dag_run, "run_id", None),
+                   ti = ti) as metrics:
+
+            result = func(*args, **kwargs)
+
+            if result is not None:
+                metrics["xcom_out_bytes"] += _payload_size(result)
+
+            return result
+
+    return wrapper
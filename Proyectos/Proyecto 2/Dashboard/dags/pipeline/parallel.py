@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline import handoff, reader
+
+# Número de procesos con los que se formatean las series en paralelo
+DEFAULT_WORKERS = int(os.environ.get("COVID_FORMAT_WORKERS", os.cpu_count() or 1))
+
+# Versión del formato de las salidas de "format_source". Se guarda con las salidas
+# reutilizables (ver "fingerprint.save_state"): al cambiarla, las salidas de corridas
+# anteriores ya no se reutilizan.
+FORMAT_VERSION = 1
+
+# ===============
+# FUNCIONES
+# ===============
+
+def format_source(path, column_name, directory, name, since = None):
+    """
+    Lee un archivo de JHU por bloques (ver "reader.iter_long_blocks") y escribe el
+    resultado en formato largo a un archivo de intercambio.
+
+    Se define a nivel de módulo (y no dentro del DAG) para que los procesos de
+    "format_sources" lo puedan importar.
+
+    Args:
+        path (str): Ruta del archivo fuente.
+        column_name (str): Nombre de la columna de conteos ("Confirmed", "Deaths", etc.).
+        directory (str): Directorio en el que se escribe la salida.
+        name (str): Nombre del archivo de salida (sin extensión).
+        since (str, optional): Última fecha ya cargada ("YYYY-MM-DD"). Defaults to None.
+
+    Returns:
+        dict: Descriptor de la salida (ver "handoff.write_frames") con la fecha más
+        reciente del archivo fuente en "max_date" y "since".
+    """
+
+    blocks = reader.iter_long_blocks(path, column_name, since = since)
+
+    return dict(handoff.write_frames(blocks, directory, name), max_date = reader.header_max_date(path), since = since)
+
+
+def format_sources(sources, directory, since = None, max_workers = DEFAULT_WORKERS):
+    """
+    Ejecuta "format_source" para varios archivos en paralelo, cada uno en su propio
+    proceso. Los datos no regresan al proceso principal: cada proceso escribe su
+    archivo de intercambio y solo devuelve el descriptor.
+
+    Args:
+        sources (dict): {nombre de salida: (ruta del archivo fuente, nombre de la columna de conteos)}.
+        directory (str): Directorio en el que se escriben las salidas.
+        since (str, optional): Última fecha ya cargada ("YYYY-MM-DD"). Defaults to None.
+        max_workers (int, optional): Número máximo de procesos. Defaults to DEFAULT_WORKERS.
+
+    Returns:
+        dict: Descriptor de la salida de cada archivo ({nombre de salida: descriptor}).
+    """
+
+    if not sources:
+        return {}
+
+    # Con un solo proceso no vale la pena levantar el pool
+    max_workers = max(1, min(max_workers, len(sources)))
+    if max_workers == 1:
+        return {name: format_source(path, column_name, directory, name, since) for name, (path, column_name) in sources.items()}
+
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        futures = {
+            name: executor.submit(format_source, path, column_name, directory, name, since)
+            for name, (path, column_name) in sources.items()
+        }
+
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,220 @@
+import os
+
+import pandas as pd
+from structlog import get_logger
+
+logger = get_logger()
+
+# Meses completos que se conservan en la tabla de hechos (0 = se conserva todo).
+# Los meses anteriores se sacan de la tabla con "EXCHANGE PARTITION".
+RETENTION_MONTHS = int(os.environ.get("COVID_RETENTION_MONTHS", 0))
+
+# Partición para fechas posteriores a la última partición mensual
+CATCH_ALL = "pmax"
+
+# ===============
+# FUNCIONES
+# ===============
+
+def partition_name(month):
+    """Nombre de la partición de un mes (por ejemplo "p202001" para enero de 2020)."""
+
+    return f"p{pd.Timestamp(month):%Y%m}"
+
+
+def retention_cutoff(latest, keep_months = RETENTION_MONTHS):
+    """
+    Primer día que conserva la política de retención: el primer día del más antiguo de
+    los últimos "keep_months" meses hasta "latest".
+
+    Args:
+        latest (str): Fecha más reciente de la tabla.
+        keep_months (int, optional): Meses que se conservan (0 = todos). Defaults to RETENTION_MONTHS.
+
+    Returns:
+        pd.Timestamp: Primer día conservado (None si se conserva todo).
+    """
+
+    if keep_months <= 0 or latest is None:
+        return None
+
+    return pd.Timestamp(latest).to_period("M").to_timestamp() - pd.DateOffset(months = keep_months - 1)
+
+
+def get_archives(connection, table, schema = "test"):
+    """
+    Tablas de archivo de una tabla (los meses retirados por "apply_retention").
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o engine.
+        table (str): Nombre de la tabla.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+
+    Returns:
+        dict: Nombre de la partición de cada mes archivado y nombre de su tabla de archivo.
+    """
+
+    rows = connection.execute(
+        "SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME LIKE %s",
+        (schema, f"{table}\\_p______")
+    ).fetchall()
+
+    return {name[len(table) + 1:]: name for name, in rows if name[len(table) + 2:].isdigit()}
+
+
+def load_cutoff(connection, table, latest, keep_months = RETENTION_MONTHS, schema = "test"):
+    """
+    Primer día que una recarga completa puede volver a escribir en una tabla. Los
+    meses anteriores a la retención y los meses que ya están en una tabla de archivo
+    no se vuelven a cargar: caerían en la partición más baja de la tabla (ya no tienen
+    su propia partición) y quedarían duplicados respecto al archivo.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o engine.
+        table (str): Nombre de la tabla.
+        latest (str): Fecha más reciente que se va a cargar.
+        keep_months (int, optional): Meses que se conservan (0 = todos). Defaults to RETENTION_MONTHS.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+
+    Returns:
+        pd.Timestamp: Primer día que se puede cargar (None si se puede cargar todo).
+    """
+
+    cutoffs = [pd.Timestamp(f"{name[1:]}01") + pd.DateOffset(months = 1) for name in get_archives(connection, table, schema)]
+    cutoff = retention_cutoff(latest, keep_months)
+    if cutoff is not None:
+        cutoffs.append(cutoff)
+
+    return max(cutoffs) if cutoffs else None
+
+
+def get_partitions(connection, table, schema = "test"):
+    """
+    Particiones mensuales de una tabla particionada por "RANGE COLUMNS(date)".
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o engine.
+        table (str): Nombre de la tabla.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+
+    Returns:
+        list: Tuplas (nombre de partición, primer día del mes siguiente) en orden,
+        sin incluir la partición CATCH_ALL.
+    """
+
+    rows = connection.execute(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        (schema, table)
+    ).fetchall()
+
+    return [(name, pd.Timestamp(bound.strip("'"))) for name, bound in rows if name != CATCH_ALL]
+
+
+def ensure_partitions(connection, table, until, schema = "test"):
+    """
+    Crea las particiones mensuales que falten hasta el mes de "until", dividiendo la
+    partición CATCH_ALL (que normalmente está vacía, por lo que la operación es
+    inmediata). Se debe llamar antes de cargar fechas nuevas, para que cada mes quede
+    en su propia partición.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o engine.
+        table (str): Nombre de la tabla.
+        until (str): Fecha más reciente que se va a cargar.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+
+    Returns:
+        list: Nombres de las particiones creadas.
+    """
+
+    partitions = get_partitions(connection, table, schema)
+    if not partitions:
+        raise Exception(f"ERROR: {schema}.{table} is not partitioned by month.")
+
+    bound = partitions[-1][1]
+    until = pd.Timestamp(until)
+
+    new_partitions = []
+    while bound <= until:
+        next_bound = bound + pd.DateOffset(months = 1)
+        new_partitions.append((partition_name(bound), next_bound))
+        bound = next_bound
+
+    if not new_partitions:
+        return []
+
+    definitions = ", ".join(f"PARTITION {name} VALUES LESS THAN ('{end:%Y-%m-%d}')" for name, end in new_partitions)
+    connection.execute(
+        f"ALTER TABLE `{schema}`.`{table}` REORGANIZE PARTITION {CATCH_ALL} INTO "
+        f"({definitions}, PARTITION {CATCH_ALL} VALUES LESS THAN (MAXVALUE))"
+    )
+
+    logger.info(f"Added partitions {[name for name, _ in new_partitions]} to {schema}.{table}")
+
+    return [name for name, _ in new_partitions]
+
+
+def apply_retention(connection, table, keep_months = RETENTION_MONTHS, archive = True, schema = "test"):
+    """
+    Saca de una tabla los meses anteriores a los últimos "keep_months" meses. Cada
+    partición se intercambia ("EXCHANGE PARTITION", sin copiar filas) con una tabla
+    vacía "<tabla>_<partición>", que queda como archivo (o se elimina si "archive" es
+    False), y luego se elimina la partición vacía.
+
+    Un archivo existente nunca se reemplaza: si el mes ya tiene tabla de archivo (por
+    ejemplo, porque se regresó a la tabla), las filas de la partición se agregan al
+    archivo con "INSERT ... SELECT" (falla si alguna fila ya está archivada, por la
+    llave primaria) antes de eliminar la partición.
+
+    Para regresar un mes archivado a la tabla, se crea de nuevo su partición y se
+    intercambia con la tabla de archivo.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o engine.
+        table (str): Nombre de la tabla.
+        keep_months (int, optional): Meses que se conservan (0 = todos). Defaults to RETENTION_MONTHS.
+        archive (bool, optional): Conservar los meses retirados en tablas aparte. Defaults to True.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+
+    Returns:
+        list: Nombres de las particiones retiradas.
+    """
+
+    if keep_months <= 0:
+        return []
+
+    # Meses retirados: todos los anteriores a los últimos "keep_months" meses con datos
+    latest = connection.execute(f"SELECT MAX(date) FROM `{schema}`.`{table}`").fetchone()[0]
+    if latest is None:
+        return []
+
+    cutoff = retention_cutoff(latest, keep_months)
+    expired = [name for name, bound in get_partitions(connection, table, schema) if bound <= cutoff]
+    archives = get_archives(connection, table, schema)
+
+    for name in expired:
+
+        archive_table = f"{table}_{name}"
+
+        # El mes ya tiene archivo: se agregan sus filas sin reemplazarlo
+        if name in archives:
+            if archive:
+                connection.execute(f"INSERT INTO `{schema}`.`{archive_table}` SELECT * FROM `{schema}`.`{table}` PARTITION ({name})")
+            connection.execute(f"ALTER TABLE `{schema}`.`{table}` DROP PARTITION {name}")
+            continue
+
+        # La tabla de intercambio debe tener la misma estructura, sin particiones
+        connection.execute(f"CREATE TABLE `{schema}`.`{archive_table}` LIKE `{schema}`.`{table}`")
+        connection.execute(f"ALTER TABLE `{schema}`.`{archive_table}` REMOVE PARTITIONING")
+        connection.execute(f"ALTER TABLE `{schema}`.`{table}` EXCHANGE PARTITION {name} WITH TABLE `{schema}`.`{archive_table}`")
+        connection.execute(f"ALTER TABLE `{schema}`.`{table}` DROP PARTITION {name}")
+
+        if not archive:
+            connection.execute(f"DROP TABLE `{schema}`.`{archive_table}`")
+
+    if expired:
+        logger.info(f"Retired partitions {expired} from {schema}.{table} ({'archived' if archive else 'dropped'})")
+
+    return expired
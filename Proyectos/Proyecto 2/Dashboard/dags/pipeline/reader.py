@@ -0,0 +1,118 @@
+import os
+
+import pandas as pd
+
+from pipeline.reshape import parse_header_dates, split_header, to_database_format
+
+# Número de columnas de fecha que se leen por bloque
+DEFAULT_DATE_BLOCK = int(os.environ.get("JHU_DATE_BLOCK", 120))
+
+# Número de filas que se leen por bloque (0 = todas las filas en un solo bloque).
+# Útil para los archivos de condados de EE.UU., que son mucho más altos.
+DEFAULT_ROW_BLOCK = int(os.environ.get("JHU_ROW_BLOCK", 0))
+
+# ===============
+# FUNCIONES
+# ===============
+
+def read_header(path):
+    """
+    Lee únicamente el encabezado de un CSV.
+
+    Args:
+        path (str): Ruta del archivo.
+
+    Returns:
+        list: Nombres de las columnas.
+    """
+
+    return pd.read_csv(path, nrows = 0).columns.tolist()
+
+
+def header_max_date(path):
+    """
+    Fecha más reciente de un archivo de JHU, obtenida del encabezado.
+
+    Args:
+        path (str): Ruta del archivo.
+
+    Returns:
+        str: Fecha más reciente ("YYYY-MM-DD") o None si el archivo no tiene fechas.
+    """
+
+    _, date_columns = split_header(read_header(path))
+
+    if not date_columns:
+        return None
+
+    return str(parse_header_dates(date_columns).max().date())
+
+
+def _long_block(data, column_name, categories):
+    """
+    Un bloque en formato largo (ver "reshape.to_database_format"), con la columna de
+    conteos siempre como Int32: según el bloque, "to_database_format" la devuelve
+    como int32 o como Int32 (si tiene nulos), y al concatenar bloques de ambos tipos
+    los conteos se convertirían a float64.
+    """
+
+    block = to_database_format(data, column_name, categories = categories)[0]
+    block[column_name] = block[column_name].astype("Int32")
+
+    return block
+
+
+def iter_long_blocks(path, column_name, since = None, date_block = DEFAULT_DATE_BLOCK, row_block = DEFAULT_ROW_BLOCK):
+    """
+    Lee un archivo "ancho" de JHU y devuelve por bloques de columnas de fecha (y
+    opcionalmente de filas) los datos ya convertidos al formato largo de la base de
+    datos.
+
+    El archivo se lee una sola vez (solo las columnas de identidad y las fechas que se
+    van a cargar), completo o por bloques de "row_block" filas. Cada bloque de filas se
+    convierte al formato largo por grupos de, como máximo, "date_block" fechas, por lo
+    que el tamaño de cada bloque largo no depende del ancho del archivo (que crece una
+    columna por día). Las columnas de texto de identidad usan las mismas categorías en
+    todos los bloques y la columna de conteos es siempre Int32.
+
+    Args:
+        path (str): Ruta del archivo.
+        column_name (str): Nombre de la columna de conteos ("Confirmed", "Deaths", etc.).
+        since (str, optional): Última fecha ya cargada ("YYYY-MM-DD"). Solo se leen las
+        columnas de fechas posteriores. Defaults to None (todas).
+        date_block (int, optional): Columnas de fecha por bloque. Defaults to DEFAULT_DATE_BLOCK.
+        row_block (int, optional): Filas por bloque (0 = sin límite). Defaults to DEFAULT_ROW_BLOCK.
+
+    Yields:
+        df: Bloque en formato largo (ver "reshape.to_database_format"). Si no hay fechas
+        que leer, se devuelve un único bloque vacío con las columnas correctas.
+    """
+
+    id_columns, date_columns = split_header(read_header(path))
+
+    # Carga incremental: solo se leen las columnas de fechas nuevas
+    if since is not None:
+        fechas = parse_header_dates(date_columns)
+        date_columns = [col for col, fecha in zip(date_columns, fechas) if fecha > pd.Timestamp(since)]
+
+    # Por bloques de filas, las columnas de identidad se leen antes (solo esas columnas)
+    # para fijar tipos y categorías en todos los bloques. Sin bloques de filas, el
+    # archivo se lee una sola vez y se toman del mismo dataframe.
+    if row_block:
+        ids = pd.read_csv(path, usecols = id_columns)[id_columns]
+        chunks = pd.read_csv(path, usecols = id_columns + date_columns, dtype = ids.dtypes.to_dict(), chunksize = row_block)
+    else:
+        ids = pd.read_csv(path, usecols = id_columns + date_columns)
+        chunks = [ids]
+
+    categories = {col: pd.Categorical(ids[col]).categories for col in id_columns if ids[col].dtype == object}
+
+    if not date_columns:
+        yield _long_block(ids[id_columns], column_name, categories)
+        return
+
+    # "usecols" no conserva el orden de las columnas, por lo que se reordenan
+    for chunk in chunks:
+        for start in range(0, len(date_columns), date_block):
+            window = date_columns[start:start + date_block]
+            yield _long_block(chunk[id_columns + window], column_name, categories)
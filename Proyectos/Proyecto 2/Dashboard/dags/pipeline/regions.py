@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from structlog import get_logger
+
+from pipeline.countries import get_country_ids
+
+logger = get_logger()
+
+# Columnas de la tabla de hechos (una fila por región y día)
+FACT_COLUMNS = ["region_id", "date", "confirmed", "deaths", "recovered"]
+
+# ===============
+# FUNCIONES
+# ===============
+
+def _region_codes(df):
+    """
+    Asigna a cada fila el índice de su región (provincia y país) dentro de las regiones
+    únicas del dataframe. Las provincias nulas se guardan como "" en la base de datos,
+    ya que MySQL permite varios NULL en una llave única.
+
+    Returns:
+        tuple: Índice de región de cada fila y MultiIndex (provincia, país) de las regiones.
+    """
+
+    provinces = df["Province/State"].astype(object).fillna("")
+    countries = df["Country/Region"].astype(object)
+
+    return pd.MultiIndex.from_arrays([provinces, countries], names = ["province_state", "country_region"]).factorize()
+
+
+def upsert_regions(connection, df, lookup = None, schema = "test"):
+    """
+    Agrega a la dimensión "region" las regiones (provincia y país) nuevas de un
+    dataframe en formato de base de datos y actualiza las coordenadas de las existentes.
+    El ID de cada región lo asigna MySQL (AUTO_INCREMENT) y no cambia entre cargas.
+    Cada región guarda también el ID de su país (ver "countries.get_country_ids").
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o transacción abierta.
+        df (df): Datos con "Province/State", "Country/Region", "Lat" y "Long".
+        lookup (dict, optional): Tabla de códigos de JHU (ver "countries.load_iso3_lookup"). Defaults to None.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+
+    Returns:
+        np.array: ID de región de cada fila del dataframe.
+    """
+
+    if df.empty:
+        return np.array([], dtype = np.int32)
+
+    codes, regions = _region_codes(df)
+
+    # Coordenadas de la primera fila de cada región
+    _, first = np.unique(codes, return_index = True)
+    lat = df["Lat"].to_numpy(dtype = float)[first]
+    lon = df["Long"].to_numpy(dtype = float)[first]
+
+    country_ids = get_country_ids(connection, regions.get_level_values("country_region"), lookup, schema)
+
+    rows = [
+        (province, country, int(country_id), None if np.isnan(la) else float(la), None if np.isnan(lo) else float(lo))
+        for (province, country), country_id, la, lo in zip(regions, country_ids, lat, lon)
+    ]
+
+    connection.execute(
+        f"INSERT INTO `{schema}`.`region` (province_state, country_region, country_id, lat, lon) "
+        "VALUES (%s, %s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE country_id = VALUES(country_id), lat = VALUES(lat), lon = VALUES(lon)",
+        rows
+    )
+
+    ids = pd.read_sql(f"SELECT id, province_state, country_region FROM `{schema}`.`region`", con = connection)
+    region_ids = ids.set_index(["province_state", "country_region"])["id"].reindex(regions).to_numpy()
+
+    logger.info(f"Upserted {len(rows)} regions into {schema}.region")
+
+    return region_ids[codes]
+
+
+def refresh_region_attributes(connection, schema = "test"):
+    """
+    Copia el código de país y el continente de "country_data" (que carga el DAG de
+    datos demográficos) a cada región de la dimensión "region".
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o transacción abierta.
+        schema (str, optional): Esquema de las tablas. Defaults to "test".
+    """
+
+    connection.execute(
+        f"UPDATE `{schema}`.`region` reg "
+        f"LEFT JOIN `{schema}`.`country_data` coud ON coud.country_id = reg.country_id "
+        "SET reg.code = coud.code, reg.continent = coud.continent"
+    )
+
+
+def to_fact(df, region_ids):
+    """
+    Convierte los datos unidos de "merge_data" a filas de la tabla de hechos.
+
+    Args:
+        df (df): Datos con "Date", "Confirmed", "Deaths" y "Recovered".
+        region_ids (np.array): ID de región de cada fila (ver "upsert_regions").
+
+    Returns:
+        df: Datos con las columnas de FACT_COLUMNS.
+    """
+
+    return pd.DataFrame({
+        "region_id": region_ids.astype(np.int32),
+        "date": df["Date"].to_numpy(),
+        "confirmed": df["Confirmed"].to_numpy(),
+        "deaths": df["Deaths"].array,
+        "recovered": df["Recovered"].array
+    }, columns = FACT_COLUMNS)
@@ -0,0 +1,211 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Columnas de identidad presentes al inicio de cada archivo global de JHU
+# (Los archivos de condados de EE.UU. tienen otras: UID, FIPS, Admin2, etc.)
+ID_COLUMNS = ["Province/State", "Country/Region", "Lat", "Long"]
+
+# Formato de las fechas usadas como encabezado en los archivos de JHU
+HEADER_DATE_FORMAT = "%m/%d/%y"
+HEADER_DATE_PATTERN = re.compile(r"^\d{1,2}/\d{1,2}/\d{2}$")
+
+# ===============
+# FUNCIONES
+# ===============
+
+def split_header(columns):
+    """
+    Separa el encabezado de un archivo de JHU en columnas de identidad (todas las que
+    no son fechas) y columnas de fecha.
+
+    Args:
+        columns (list): Encabezado completo del archivo.
+
+    Returns:
+        tuple: Lista de columnas de identidad y lista de columnas de fecha.
+    """
+
+    id_columns = [col for col in columns if not HEADER_DATE_PATTERN.match(str(col))]
+    date_columns = [col for col in columns if HEADER_DATE_PATTERN.match(str(col))]
+
+    return id_columns, date_columns
+
+
+def parse_header_dates(columns):
+    """
+    Convierte los encabezados de fecha de un archivo de JHU (por ejemplo "1/22/20")
+    a un arreglo de datetime64. El parseo se hace una sola vez por archivo, sobre
+    el encabezado, en lugar de hacerlo fila por fila sobre la tabla larga.
+
+    Args:
+        columns (list): Encabezados de las columnas de fecha.
+
+    Returns:
+        pd.DatetimeIndex: Fechas correspondientes a cada columna.
+    """
+
+    return pd.to_datetime(pd.Index(columns), format = HEADER_DATE_FORMAT)
+
+
+def _repeat_column(values, repeats, categories = None):
+    """
+    Repite cada valor de una columna de identidad "repeats" veces, con un tipo compacto:
+    strings como categóricas, floats como float32 y el resto sin cambios.
+    """
+
+    if categories is not None or values.dtype == object:
+        cat = pd.Categorical(values, categories = categories)
+        return pd.Categorical.from_codes(np.repeat(cat.codes, repeats), cat.categories)
+
+    if pd.api.types.is_float_dtype(values):
+        return np.repeat(values.to_numpy(dtype = np.float32), repeats)
+
+    return np.repeat(values.to_numpy(), repeats)
+
+
+def to_database_format(data, column_name, since = None, categories = None):
+    """
+    Convierte un archivo "ancho" de JHU (una columna por fecha) al formato "largo"
+    de la base de datos (una fila por región y fecha).
+
+    La tabla de salida se construye directamente a partir de arreglos de numpy, sin
+    copias intermedias del tamaño de la tabla completa ni fechas como strings:
+
+    - Las columnas de identidad de texto ("Province/State", "Country/Region") son
+      categóricas (códigos repetidos).
+    - Las coordenadas ("Lat", "Long") son float32.
+    - "Date" es datetime64, parseada una sola vez desde el encabezado.
+    - La columna de conteos es int32 o, si el archivo tiene celdas vacías, Int32 con
+      nulos en esas celdas (en lugar de convertir NaN a un entero inválido).
+
+    Las columnas de identidad son todas las que no son fechas, por lo que también
+    funciona con los archivos de condados de EE.UU.
+
+    Args:
+        data (df): Datos tal como se leen del CSV de JHU (o un bloque de columnas).
+        column_name (str): Nombre de la columna de conteos ("Confirmed", "Deaths", etc.).
+        since (str, optional): Última fecha ya cargada ("YYYY-MM-DD"). Si se especifica,
+        solo se convierten las columnas de fechas posteriores. Defaults to None (todas).
+        categories (dict, optional): Categorías fijas por columna de identidad, para que
+        varios bloques del mismo archivo tengan los mismos códigos. Defaults to None.
+
+    Returns:
+        tuple: Dataframe en formato largo y fecha más reciente del dataset como
+        string ("YYYY-MM-DD"). La fecha más reciente se calcula sobre todo el
+        encabezado, aunque se use "since" (None si no hay fechas).
+    """
+
+    id_columns, date_columns = split_header(data.columns)
+    categories = categories or {}
+
+    # Fechas cubiertas por la data
+    fechas = parse_header_dates(date_columns)
+
+    # Se extrae la fecha más reciente del dataset
+    fecha_mas_reciente = str(fechas.max().date()) if len(fechas) else None
+
+    # Carga incremental: solo se conservan las columnas de fechas nuevas
+    valores = data[date_columns]
+    if since is not None:
+        nuevas = fechas > pd.Timestamp(since)
+        fechas = fechas[nuevas]
+        valores = valores.loc[:, nuevas]
+
+    # Número de fechas y número de combinaciones únicas de país y estado
+    num_fechas = len(fechas)
+    num_regiones = len(data)
+
+    # Las regiones se repiten tantas veces como hay fechas (np.repeat) y las fechas
+    # tantas veces como hay regiones (np.tile). El orden resultante coincide con el
+    # "ravel" por filas de la matriz de conteos.
+    columns = {col: _repeat_column(data[col], num_fechas, categories.get(col)) for col in id_columns}
+    columns["Date"] = np.tile(fechas.values, num_regiones)
+
+    nulos = valores.isna().to_numpy()
+    if nulos.any():
+        conteos = valores.fillna(0).to_numpy(dtype = np.int32).ravel()
+        columns[column_name] = pd.arrays.IntegerArray(conteos, nulos.ravel())
+    else:
+        columns[column_name] = valores.to_numpy(dtype = np.int32).ravel()
+
+    df_out = pd.DataFrame(columns)
+
+    return(df_out, fecha_mas_reciente)
+
+
+def _region_keys(data, provinces, countries):
+    """
+    Llave entera de región (provincia, país) de cada fila, calculada sobre los códigos
+    de las columnas categóricas usando las categorías de la tabla base. Las regiones
+    cuyo país o cuya provincia (no nula) no existen en la tabla base reciben la llave
+    -1, al igual que en el "left join" sobre la tabla base.
+    """
+
+    # Los códigos se recalculan con las categorías de la tabla base
+    # (Solo se comparan las categorías, no las filas)
+    province_codes = data["Province/State"].cat.set_categories(provinces).cat.codes.to_numpy(dtype = np.int64)
+    country_codes = data["Country/Region"].cat.set_categories(countries).cat.codes.to_numpy(dtype = np.int64)
+
+    # Provincia nula = código -1, por lo que se desplaza en 1
+    keys = (province_codes + 1) * len(countries) + country_codes
+    keys[country_codes < 0] = -1
+
+    # Una provincia que no existe en la tabla base también tiene código -1, pero no
+    # es la región del país sin provincia (por ejemplo, Gibraltar y Reino Unido)
+    keys[data["Province/State"].notna().to_numpy() & (province_codes < 0)] = -1
+
+    return keys
+
+
+def merge_series(base, others):
+    """
+    Combina varias series en formato largo (salida de "to_database_format") en una sola
+    tabla, alineándolas por región (provincia, país) y día, equivalente a un "left join"
+    sobre la tabla base.
+
+    En lugar de hacer un "pd.merge" por cada serie sobre llaves de strings y floats, cada
+    fila se identifica con un ID entero de región y un desplazamiento en días desde la
+    primera fecha. Cada serie se coloca en una matriz región x día y luego se lee en el
+    orden de la tabla base. Las coordenadas no se usan como llave.
+
+    Args:
+        base (df): Serie base (por ejemplo, confirmados). Define las filas de salida.
+        others (list): Series a agregar. De cada una se toma su última columna (los
+        conteos nulos quedan como nulos en la salida).
+
+    Returns:
+        df: Tabla base con una columna adicional (Int32, con nulos si no hay dato) por serie.
+    """
+
+    provinces = base["Province/State"].cat.categories
+    countries = base["Country/Region"].cat.categories
+
+    # ID de región (0 a num_regiones - 1) y día de cada fila de la tabla base
+    regions, base_region = np.unique(_region_keys(base, provinces, countries), return_inverse = True)
+    start = base["Date"].min()
+    base_day = (base["Date"] - start).dt.days.to_numpy()
+    num_days = int(base_day.max()) + 1 if len(base_day) else 0
+
+    df_out = base.copy()
+
+    for data in others:
+
+        column_name = data.columns[-1]
+
+        # Posición de cada fila de la serie dentro de la matriz región x día
+        keys = _region_keys(data, provinces, countries)
+        region = np.searchsorted(regions, keys).clip(0, max(len(regions) - 1, 0))
+        day = (data["Date"] - start).dt.days.to_numpy()
+        valid = (keys >= 0) & (regions[region] == keys) & (day >= 0) & (day < num_days) if len(regions) else np.zeros(len(keys), dtype = bool)
+        valid &= data[column_name].notna().to_numpy()
+
+        values = np.zeros((len(regions), num_days), dtype = np.int32)
+        present = np.zeros((len(regions), num_days), dtype = bool)
+        values[region[valid], day[valid]] = data[column_name].to_numpy(dtype = np.int32, na_value = 0)[valid]
+        present[region[valid], day[valid]] = True
+
+        df_out[column_name] = pd.arrays.IntegerArray(values[base_region, base_day], ~present[base_region, base_day])
+
+    return df_out
@@ -0,0 +1,158 @@
+import time
+
+from structlog import get_logger
+
+from pipeline.deltas import COUNTS, DELTA_COLUMNS
+
+logger = get_logger()
+
+# Columnas que se suman en cada nivel de agregación
+SUM_COLUMNS = COUNTS + DELTA_COLUMNS
+
+# ===============
+# FUNCIONES
+# ===============
+
+def _sums(alias):
+    """Lista "SUM(<alias>.<columna>)" de SUM_COLUMNS para una consulta."""
+
+    return ", ".join(f"SUM({alias}.{column})" for column in SUM_COLUMNS)
+
+
+def _select_country(schema):
+    """Agregado por país y día a partir de la tabla de hechos."""
+
+    return f"""
+        SELECT
+            reg.country_region, MAX(reg.code), MAX(reg.continent), cf.date,
+            {_sums("cf")}, MAX(coud.population)
+        FROM `{schema}`.`covid_fact` cf
+        JOIN `{schema}`.`region` reg ON reg.id = cf.region_id
+        LEFT JOIN `{schema}`.`country_data` coud ON coud.country_id = reg.country_id
+        WHERE cf.date > %s
+        GROUP BY reg.country_region, cf.date
+    """
+
+
+def _select_continent(schema):
+    """Agregado por continente y día a partir del agregado por país."""
+
+    return f"""
+        SELECT
+            cou.continent, cou.date, {_sums("cou")}, SUM(cou.population)
+        FROM `{schema}`.`covid_daily_country` cou
+        WHERE cou.date > %s AND cou.continent IS NOT NULL
+        GROUP BY cou.continent, cou.date
+    """
+
+
+def _select_global(schema):
+    """Agregado global por día a partir del agregado por país."""
+
+    return f"""
+        SELECT
+            cou.date, {_sums("cou")}, SUM(cou.population)
+        FROM `{schema}`.`covid_daily_country` cou
+        WHERE cou.date > %s
+        GROUP BY cou.date
+    """
+
+
+# Tablas de agregados, en el orden en el que se construyen (cada nivel se calcula a
+# partir del de países). Para cada una: columnas descriptivas que se insertan antes
+# de la fecha y consulta de agregación.
+ROLLUPS = {
+    "covid_daily_country": (["country_region", "code", "continent"], _select_country),
+    "covid_daily_continent": (["continent"], _select_continent),
+    "covid_daily_global": ([], _select_global)
+}
+
+
+def refresh_rollups(engine, since = None, schema = "test"):
+    """
+    Recalcula las tablas de agregados diarios (por país, por continente y global) a
+    partir de "covid_fact", "region" y "country_data", incluidos la población y la suma
+    de los cambios diarios y ventanas de 7 días de cada región (ver "deltas.add_deltas").
+
+    Solo se recalculan las fechas posteriores a "since". Cada tabla se actualiza en una
+    sola transacción, por lo que el dashboard sigue viendo la versión anterior hasta
+    que termina.
+
+    La población de un país se cuenta una sola vez, aunque el país tenga varias
+    provincias en los datos de JHU.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine de la base de datos.
+        since (str, optional): Última fecha que ya estaba agregada ("YYYY-MM-DD").
+        Defaults to None (se recalcula todo).
+        schema (str, optional): Esquema de las tablas. Defaults to "test".
+    """
+
+    since = since or "1900-01-01"
+    start = time.perf_counter()
+
+    for table, (columns, select) in ROLLUPS.items():
+
+        with engine.begin() as transaction:
+            transaction.execute(f"DELETE FROM `{schema}`.`{table}` WHERE date > %s", (since,))
+            transaction.execute(
+                f"INSERT INTO `{schema}`.`{table}` ({', '.join(columns + ['date'] + SUM_COLUMNS + ['population'])}) "
+                + select(schema),
+                (since,)
+            )
+
+    logger.info(f"Refreshed rollup tables since {since} in {time.perf_counter() - start:.2f}s")
+
+
+def refresh_country_attributes(engine, schema = "test"):
+    """
+    Actualiza solo las columnas de los agregados que dependen de "region" y
+    "country_data" (código de país, continente y población), sin volver a agregar
+    "covid_fact". Se usa cuando el DAG de datos demográficos carga una nueva versión
+    de "country_data".
+
+    El agregado por continente se reconstruye completo a partir del agregado por país
+    (un país puede cambiar de continente), y en el agregado global solo se actualiza
+    la población. Todo se hace en una sola transacción.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine de la base de datos.
+        schema (str, optional): Esquema de las tablas. Defaults to "test".
+    """
+
+    start = time.perf_counter()
+    columns, select = ROLLUPS["covid_daily_continent"]
+
+    with engine.begin() as transaction:
+
+        transaction.execute(f"""
+            UPDATE `{schema}`.`covid_daily_country` cou
+            JOIN (
+                SELECT
+                    reg.country_region, MAX(reg.code) AS code, MAX(reg.continent) AS continent,
+                    MAX(coud.population) AS population
+                FROM `{schema}`.`region` reg
+                LEFT JOIN `{schema}`.`country_data` coud ON coud.country_id = reg.country_id
+                GROUP BY reg.country_region
+            ) attr ON attr.country_region = cou.country_region
+            SET cou.code = attr.code, cou.continent = attr.continent, cou.population = attr.population
+        """)
+
+        transaction.execute(f"DELETE FROM `{schema}`.`covid_daily_continent`")
+        transaction.execute(
+            f"INSERT INTO `{schema}`.`covid_daily_continent` ({', '.join(columns + ['date'] + SUM_COLUMNS + ['population'])}) "
+            + select(schema),
+            ("1900-01-01",)
+        )
+
+        transaction.execute(f"""
+            UPDATE `{schema}`.`covid_daily_global` glo
+            JOIN (
+                SELECT cou.date, SUM(cou.population) AS population
+                FROM `{schema}`.`covid_daily_country` cou
+                GROUP BY cou.date
+            ) pop ON pop.date = glo.date
+            SET glo.population = pop.population
+        """)
+
+    logger.info(f"Refreshed country attributes of the rollup tables in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,176 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from structlog import get_logger
+
+from pipeline.handoff import file_checksum
+
+logger = get_logger()
+
+# Subdirectorio (dentro del volumen "monitor") en el que se publican las copias del
+# dataset del dashboard. El contenedor de Streamlit monta este directorio.
+SNAPSHOT_FOLDER = "snapshots"
+
+# Archivo con la versión más reciente (el dashboard solo lee este archivo para saber
+# qué copia abrir)
+LATEST_FILE = "latest.json"
+
+# Copias que se conservan (las sesiones abiertas pueden seguir usando una copia
+# anterior mientras se publica una nueva)
+SNAPSHOT_KEEP = int(os.environ.get("COVID_SNAPSHOT_KEEP", 3))
+
+# Dataset del dashboard: una fila por región y día, con nombres, coordenadas y los
+# datos demográficos de cada país
+SNAPSHOT_QUERY = """
+    SELECT
+        NULLIF(reg.province_state, '') AS province_state, reg.country_region, reg.lat, reg.lon,
+        cf.date, cf.confirmed, cf.deaths, cf.recovered,
+        reg.continent, coud.population, reg.code
+    FROM `{schema}`.`covid_fact` cf
+    JOIN `{schema}`.`region` reg ON reg.id = cf.region_id
+    LEFT JOIN `{schema}`.`country_data` coud ON coud.country_id = reg.country_id
+"""
+
+# Tipos compactos de cada columna, con las mismas reglas que "compact.compact_frame"
+# del dashboard (el contenedor de Streamlit no monta "dags", por lo que se repiten
+# aquí): los textos se guardan como diccionario (cada nombre se guarda una sola vez),
+# las coordenadas como float32 y los conteos con "_compact_count"
+CATEGORY_COLUMNS = ["province_state", "country_region", "continent", "code"]
+FLOAT32_COLUMNS = ["lat", "lon"]
+COUNT_COLUMNS = ["confirmed", "deaths", "recovered", "population", "max_recovered"]
+
+# ===============
+# FUNCIONES
+# ===============
+
+def _compact_count(series):
+    """
+    Tipo de una columna de conteos, igual que en "compact._compact_count" del
+    dashboard: int32 si no tiene nulos y cabe en int32, int64 si no cabe, y float64
+    (con NaN para los nulos) si tiene nulos.
+    """
+
+    values = pd.to_numeric(series)
+
+    if values.isna().any():
+        return values.astype("float64")
+
+    if len(values) and (values.min() < np.iinfo(np.int32).min or values.max() > np.iinfo(np.int32).max):
+        return values.astype("int64")
+
+    return values.astype("int32")
+
+
+def add_max_recovered(df):
+    """
+    Agrega "max_recovered": el máximo de recuperados de cada región hasta cada fecha
+    (algunos países dejaron de reportar recuperados, por lo que el mapa muestra el
+    máximo). Se calcula una vez al publicar la copia, para que el dashboard solo
+    tenga que leer las filas de la fecha elegida. Los días sin dato conservan el
+    máximo anterior, igual que "MAX(recovered)" en MySQL.
+
+    Args:
+        df (df): Resultado de SNAPSHOT_QUERY.
+
+    Returns:
+        df: Dataset con la columna "max_recovered".
+    """
+
+    df = df.copy()
+    ordered = df.sort_values("date", kind = "stable")
+    keys = [ordered["country_region"], ordered["province_state"]]
+
+    running = ordered["recovered"].astype("float64").groupby(keys, dropna = False, sort = False).cummax()
+    df["max_recovered"] = running.groupby(keys, dropna = False, sort = False).ffill()
+
+    return df
+
+
+def compact(df):
+    """
+    Convierte las columnas del dataset del dashboard a tipos compactos (ver
+    CATEGORY_COLUMNS, FLOAT32_COLUMNS y COUNT_COLUMNS).
+
+    Args:
+        df (df): Resultado de SNAPSHOT_QUERY.
+
+    Returns:
+        df: Dataset con tipos compactos.
+    """
+
+    df = df.copy()
+
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype("category")
+    for column in FLOAT32_COLUMNS:
+        df[column] = pd.to_numeric(df[column]).astype("float32")
+    for column in COUNT_COLUMNS:
+        df[column] = _compact_count(df[column])
+
+    df["date"] = pd.to_datetime(df["date"])
+
+    return df
+
+
+def publish_snapshot(engine, directory, schema = "test", keep = SNAPSHOT_KEEP):
+    """
+    Publica una copia versionada del dataset del dashboard como archivo Arrow (Feather
+    v2, sin compresión para que se pueda abrir con memory mapping) y actualiza
+    LATEST_FILE para que apunte a ella. Las copias más antiguas que las últimas "keep"
+    se eliminan (un proceso que ya tenga abierta una copia eliminada la puede seguir
+    leyendo).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine de la base de datos.
+        directory (str): Directorio de las copias (ver SNAPSHOT_FOLDER).
+        schema (str, optional): Esquema de las tablas. Defaults to "test".
+        keep (int, optional): Copias que se conservan. Defaults to SNAPSHOT_KEEP.
+
+    Returns:
+        dict: Descriptor de la copia publicada (versión, ruta, filas, checksum y
+        fecha más reciente).
+    """
+
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok = True)
+
+    df = compact(add_max_recovered(pd.read_sql(SNAPSHOT_QUERY.format(schema = schema), con = engine)))
+
+    # La versión es la hora de publicación, por lo que el orden alfabético de los
+    # archivos es también su orden de publicación
+    version = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    path = os.path.join(directory, f"covid_dataset_{version}.arrow")
+
+    # Se escribe a un archivo temporal y luego se renombra, para que el dashboard
+    # nunca abra un archivo incompleto
+    table = pa.Table.from_pandas(df, preserve_index = False)
+    feather.write_feather(table, path + ".tmp", compression = "uncompressed")
+    os.replace(path + ".tmp", path)
+
+    descriptor = {
+        "version": version,
+        "path": os.path.basename(path),
+        "rows": table.num_rows,
+        "checksum": file_checksum(path),
+        "max_date": None if df.empty else str(df["date"].max().date())
+    }
+
+    latest = os.path.join(directory, LATEST_FILE)
+    with open(latest + ".tmp", "w") as f:
+        json.dump(descriptor, f)
+    os.replace(latest + ".tmp", latest)
+
+    # Se eliminan las copias más antiguas
+    snapshots = sorted(name for name in os.listdir(directory) if name.startswith("covid_dataset_") and name.endswith(".arrow"))
+    for name in snapshots[:-keep] if keep > 0 else []:
+        os.remove(os.path.join(directory, name))
+
+    logger.info(f"Published snapshot {version} with {table.num_rows} rows ({os.path.getsize(path) / 1e6:.1f}MB) "
+                f"in {time.perf_counter() - start:.2f}s")
+
+    return descriptor
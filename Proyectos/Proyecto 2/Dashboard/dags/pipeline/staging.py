@@ -0,0 +1,88 @@
+from structlog import get_logger
+
+from pipeline.bulk_load import bulk_insert
+
+logger = get_logger()
+
+# ===============
+# FUNCIONES
+# ===============
+
+def staging_table(table):
+    """Nombre de la tabla de staging en la que se carga la nueva versión de una tabla."""
+
+    return f"{table}_staging"
+
+
+def previous_table(table):
+    """Nombre de la tabla en la que se conserva la versión anterior de una tabla."""
+
+    return f"{table}_previous"
+
+
+def load_and_swap(engine, df, table, schema = "test", **bulk_kwargs):
+    """
+    Recarga completa de una tabla sin dejarla vacía ni bloqueada mientras se cargan
+    los datos:
+
+    1. Se crea "<tabla>_staging" con la misma estructura que la tabla (CREATE TABLE LIKE).
+    2. Se cargan los datos en la tabla de staging (ver "bulk_insert").
+    3. Se intercambian las tablas con un solo "RENAME TABLE", que es atómico: los
+       lectores ven la versión anterior completa o la nueva completa. La versión
+       anterior queda en "<tabla>_previous" (ver "rollback").
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine de la base de datos (ver "get_bulk_engine").
+        df (df): Datos nuevos de la tabla.
+        table (str): Nombre de la tabla.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+        **bulk_kwargs: Argumentos adicionales para "bulk_insert".
+
+    Returns:
+        dict: Estadísticas de la carga (ver "bulk_insert").
+    """
+
+    staging = staging_table(table)
+    previous = previous_table(table)
+
+    with engine.begin() as connection:
+        connection.execute(f"DROP TABLE IF EXISTS `{schema}`.`{staging}`")
+        connection.execute(f"CREATE TABLE `{schema}`.`{staging}` LIKE `{schema}`.`{table}`")
+
+    with engine.begin() as transaction:
+        stats = bulk_insert(df, staging, transaction, schema = schema, **bulk_kwargs)
+
+    with engine.begin() as connection:
+        connection.execute(f"DROP TABLE IF EXISTS `{schema}`.`{previous}`")
+        connection.execute(
+            f"RENAME TABLE `{schema}`.`{table}` TO `{schema}`.`{previous}`, "
+            f"`{schema}`.`{staging}` TO `{schema}`.`{table}`"
+        )
+
+    logger.info(f"Swapped {schema}.{staging} in as {schema}.{table} (previous version kept in {schema}.{previous})")
+
+    return stats
+
+
+def rollback(engine, table, schema = "test"):
+    """
+    Regresa una tabla a la versión anterior a la última recarga completa. La versión
+    descartada queda en "<tabla>_staging" hasta la siguiente recarga.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine de la base de datos.
+        table (str): Nombre de la tabla.
+        schema (str, optional): Esquema de la tabla. Defaults to "test".
+    """
+
+    staging = staging_table(table)
+    previous = previous_table(table)
+
+    with engine.begin() as connection:
+        connection.execute(f"DROP TABLE IF EXISTS `{schema}`.`{staging}`")
+        connection.execute(
+            f"RENAME TABLE `{schema}`.`{table}` TO `{schema}`.`{staging}`, "
+            f"`{schema}`.`{previous}` TO `{schema}`.`{table}`"
+        )
+
+    logger.info(f"Rolled back {schema}.{table} to {schema}.{previous}")
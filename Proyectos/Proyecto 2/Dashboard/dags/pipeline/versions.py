@@ -0,0 +1,35 @@
+from structlog import get_logger
+
+logger = get_logger()
+
+# ===============
+# FUNCIONES
+# ===============
+
+def bump_data_version(connection, dag_id, load_id, schema = "test"):
+    """
+    Registra una nueva versión de los datos en la tabla "data_version", con el ID de
+    la carga y la fecha más reciente de la tabla de hechos. El dashboard revisa la
+    última versión cada cierto tiempo y, si cambió, vuelve a leer los datos (una sola
+    vez por carga). Se debe llamar al final de la carga, cuando ya se actualizaron
+    todas las tablas que lee el dashboard.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Conexión o engine.
+        dag_id (str): ID del DAG que hizo la carga.
+        load_id (str): ID de la carga ("run_id" del contexto de Airflow).
+        schema (str, optional): Esquema de las tablas. Defaults to "test".
+
+    Returns:
+        int: Número de la nueva versión.
+    """
+
+    result = connection.execute(
+        f"INSERT INTO `{schema}`.`data_version` (dag_id, load_id, max_date) "
+        f"SELECT %s, %s, MAX(date) FROM `{schema}`.`covid_fact`",
+        (dag_id, load_id)
+    )
+
+    logger.info(f"Data version bumped to {result.lastrowid} by {dag_id} ({load_id})")
+
+    return result.lastrowid
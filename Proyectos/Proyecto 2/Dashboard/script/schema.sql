@@ -1,19 +1,154 @@
-CREATE TABLE test.covid_data(
+-- Registro de países: asigna a cada código ISO3 (el de JHU, o el nombre de JHU para
+-- entidades sin código) un ID entero estable, que comparten "region" y "country_data"
+-- (ver dags/pipeline/countries.py). Ambas tablas se unen por "country_id" en lugar de
+-- por nombre. "name" es el último nombre de JHU del país.
+CREATE TABLE test.country(
     id int primary key auto_increment,
-    province_state varchar(256),
-    country_region varchar(256),
+    iso3 varchar(256) not null,
+    name varchar(256),
+    unique key uk_country_iso3 (iso3)
+);
+
+-- Dimensión de regiones (país y, si aplica, provincia o estado). Las provincias
+-- vacías se guardan como '' para que la llave única funcione (MySQL permite varios
+-- NULL en una llave única). "code" y "continent" se copian de "country_data".
+CREATE TABLE test.region(
+    id int primary key auto_increment,
+    province_state varchar(256) not null default '',
+    country_region varchar(256) not null,
+    country_id int,
     lat float,
     lon float,
-    date datetime,
+    code varchar(64),
+    continent varchar(256),
+    unique key uk_region (country_region, province_state),
+    key idx_country (country_id)
+);
+
+-- Tabla de hechos: una fila por región y día. La llave primaria (clustered en
+-- InnoDB) agrupa físicamente las filas de cada región en orden de fecha.
+-- "new_<conteo>" es el cambio respecto al día anterior y "new_<conteo>_7d" y
+-- "new_<conteo>_7d_avg" su suma y promedio en los últimos 7 días, por región
+-- (ver dags/pipeline/deltas.py).
+-- Particionada por mes: las consultas filtradas por fecha solo leen las particiones
+-- de los meses involucrados. El DAG agrega las particiones de cada mes nuevo
+-- dividiendo "pmax" y puede retirar meses antiguos con "EXCHANGE PARTITION"
+-- (ver dags/pipeline/partitions.py).
+CREATE TABLE test.covid_fact(
+    region_id int not null,
+    date date not null,
     confirmed int,
     deaths int,
-    recovered int
+    recovered int,
+    new_confirmed int,
+    new_deaths int,
+    new_recovered int,
+    new_confirmed_7d int,
+    new_deaths_7d int,
+    new_recovered_7d int,
+    new_confirmed_7d_avg float,
+    new_deaths_7d_avg float,
+    new_recovered_7d_avg float,
+    primary key (region_id, date),
+    key idx_date (date)
+)
+PARTITION BY RANGE COLUMNS(date) (
+    PARTITION p202001 VALUES LESS THAN ('2020-02-01'),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
 );
 
 CREATE TABLE test.country_data(
     id int primary key auto_increment,
+    country_id int,
     code varchar(64),
     name varchar(256),
     continent varchar(256),
-    population int
-);
\ No newline at end of file
+    population int,
+    key idx_country (country_id)
+);
+
+-- Vista con el formato de la tabla "covid_data" original (una fila por región y día
+-- con nombres y coordenadas), para consultas manuales
+CREATE VIEW test.covid_data AS
+SELECT 
+    NULLIF(reg.province_state, '') AS province_state, reg.country_region, 
+    reg.lat, reg.lon, cf.date, cf.confirmed, cf.deaths, cf.recovered
+FROM test.covid_fact cf
+JOIN test.region reg ON reg.id = cf.region_id;
+
+-- Agregados diarios por país, continente y a nivel global (ver dags/pipeline/rollups.py).
+-- Las columnas "new_<conteo>*" son la suma de las de "covid_fact" y "population" es
+-- la población de los países incluidos (contando una sola vez a cada país).
+CREATE TABLE test.covid_daily_country(
+    country_region varchar(256) not null,
+    code varchar(64),
+    continent varchar(256),
+    date date not null,
+    confirmed bigint,
+    deaths bigint,
+    recovered bigint,
+    new_confirmed bigint,
+    new_deaths bigint,
+    new_recovered bigint,
+    new_confirmed_7d bigint,
+    new_deaths_7d bigint,
+    new_recovered_7d bigint,
+    new_confirmed_7d_avg double,
+    new_deaths_7d_avg double,
+    new_recovered_7d_avg double,
+    population bigint,
+    primary key (country_region, date),
+    key idx_date (date)
+);
+
+CREATE TABLE test.covid_daily_continent(
+    continent varchar(256) not null,
+    date date not null,
+    confirmed bigint,
+    deaths bigint,
+    recovered bigint,
+    new_confirmed bigint,
+    new_deaths bigint,
+    new_recovered bigint,
+    new_confirmed_7d bigint,
+    new_deaths_7d bigint,
+    new_recovered_7d bigint,
+    new_confirmed_7d_avg double,
+    new_deaths_7d_avg double,
+    new_recovered_7d_avg double,
+    population bigint,
+    primary key (continent, date)
+);
+
+CREATE TABLE test.covid_daily_global(
+    date date primary key,
+    confirmed bigint,
+    deaths bigint,
+    recovered bigint,
+    new_confirmed bigint,
+    new_deaths bigint,
+    new_recovered bigint,
+    new_confirmed_7d bigint,
+    new_deaths_7d bigint,
+    new_recovered_7d bigint,
+    new_confirmed_7d_avg double,
+    new_deaths_7d_avg double,
+    new_recovered_7d_avg double,
+    population bigint
+);
+
+-- Versión de los datos: los DAGs agregan una fila al final de cada carga (ver
+-- dags/pipeline/versions.py) y el dashboard vuelve a leer los datos cuando cambia
+-- la última versión.
+CREATE TABLE test.data_version(
+    version int primary key auto_increment,
+    dag_id varchar(256) not null,
+    load_id varchar(256) not null,
+    max_date date,
+    loaded_at timestamp not null default current_timestamp
+);
+
+-- Tablas de staging para las recargas completas (ver dags/pipeline/staging.py).
+-- Los DAGs las vuelven a crear antes de cada recarga.
+CREATE TABLE test.covid_fact_staging LIKE test.covid_fact;
+CREATE TABLE test.country_data_staging LIKE test.country_data;
@@ -1,8 +1,8 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-from streamlit_folium import folium_static
-from functions import process_folium_map_data, get_DBData
+import streamlit.components.v1 as components
+from functions import get_FoliumMap, get_DataVersion, get_DateRange, get_MapData, get_GlobalSeries, get_ContinentSeries, get_CountrySeries, get_CountrySnapshot
 from datetime import datetime
 import plotly.graph_objects as go
 
@@ -46,8 +46,20 @@ st.markdown("""
 # DATASET
 # ================
 
+# Cada sección consulta solo los datos que muestra (ver "CONSULTAS POR VISTA" en
+# functions.py). Las series se leen de los agregados diarios precalculados por el DAG.
+# Las consultas se guardan en caché por versión de los datos, por lo que se vuelven
+# a leer solo cuando un DAG termina una carga nueva.
 try: 
-    dataset = get_DBData()
+    data_version = get_DataVersion()
+
+    earliest_date, latest_date = get_DateRange(data_version)
+
+    daily_global = get_GlobalSeries(data_version)
+    daily_continent = get_ContinentSeries(data_version)
+
+    # Situación más reciente de cada país
+    latest_countries = get_CountrySnapshot(latest_date, data_version)
 
 except Exception as e:
     st.write("Database not yet available.")
@@ -62,18 +74,15 @@ st.sidebar.markdown("""
 --------
 """)
 
-latest_date = dataset['date'].max()
-earliest_date = dataset['date'].min()
-
 analysis_date = st.sidebar.date_input(
     'Date for COVID data', 
-    value = dataset['date'].max(),
+    value = latest_date,
     min_value = earliest_date,
     max_value = latest_date
 )
 
 st.sidebar.markdown(f"""
-##### Dataset date range: { dataset['date'].min().date().strftime('%m/%d/%Y') } - { dataset['date'].max().date().strftime('%m/%d/%Y') }
+##### Dataset date range: { earliest_date.date().strftime('%m/%d/%Y') } - { latest_date.date().strftime('%m/%d/%Y') }
 ------
 """)
 
@@ -108,21 +117,20 @@ st.sidebar.markdown("##### Hide expander with raw map data")
 # Solo se renderiza el mapa si el usuario lo desea
 if disable_map == False:
 
-    maps = process_folium_map_data(dataset, analysis_date)
-
     # Se utiliza el mapa elegido por el usuario
     if map_type == "Data by Region":
-        map = maps["bubbles"]
+        map = "bubbles"
     elif map_type == "Confirmed Cases by Country":
-        map = maps["confirmed"]
+        map = "confirmed"
     elif map_type == "Deaths by Country":
-        map = maps["deaths"]
+        map = "deaths"
     elif map_type == "Recovered Cases by Country":
-        map = maps["recovered"]
+        map = "recovered"
 
-    # Se renderiza el mapa
+    # Se construye y se renderiza solo el mapa elegido
+    # (el alto incluye el margen de 10px que agregaba "folium_static")
     with st.spinner("Loading Map..."):
-        folium_static(map, width = 1420, height = 580)
+        components.html(get_FoliumMap(map, analysis_date, data_version), width = 1420, height = 590)
 
 else:
     st.image("streamlit/map.PNG")
@@ -130,7 +138,7 @@ else:
 # Pestaña expandible para ver el datset raw
 if hide_raw_map_data == False:
     with st.expander("Raw Map Data"):
-        st.write(dataset[dataset["date"] == analysis_date.strftime('%Y-%m-%d')].reset_index())
+        st.write(get_MapData(analysis_date, data_version))
 
 # ================
 # CONTENT
@@ -171,24 +179,23 @@ st.markdown("""
 with st.container():
     col1, col2, col3, col4, col5, col6 = st.columns([1, 1, 1, 1, 1, 1])
 
-    # Se obtiene la data más reciente
-    latest_data = dataset[dataset['date'] == latest_date]
-
-    # Se eliminan potenciales NANs
-    latest_data[["confirmed", "deaths", "population"]] = latest_data[["confirmed", "deaths", "population"]].fillna(0)
+    # Se obtiene la data más reciente (global)
+    # (Se eliminan potenciales NANs)
+    latest_global = daily_global[daily_global['date'] == latest_date].fillna(0).iloc[0]
 
     # Se calcula por aparte el número de recuperados porque el CSV fuente
     # parece perder datos de repente luego de cierta fecha. Parece que luego
     # de un momento específico, cada país dejó de reportar sus recuperados
-    total_recovered = dataset[["country_region", "recovered"]].groupby(by = ["country_region"]).max().fillna(0).sum()
+    # (la consulta trae el máximo de recuperados de cada país)
+    total_recovered = latest_countries["recovered"].fillna(0).sum()
 
     # Creación de métricas
-    col1.metric("Total Cases", f"{latest_data['confirmed'].sum() / 1000000:,.0f}M")
-    col2.metric("Total Deaths", f"{latest_data['deaths'].sum() / 1000000:,.1f}M")
-    col3.metric("Case-Fatality Ratio", f"{(latest_data['deaths'].sum() / latest_data['confirmed'].sum()) * 100:.2f}%")
-    col4.metric("Recovery Percentage", f"{(total_recovered.values[0] / latest_data['confirmed'].sum()) * 100:.2f}%")
-    col5.metric("Incidence (Cases per 100,000 people)", f"{(latest_data['confirmed'].sum() / latest_data['population'].sum()) * 100000:.0f} cases")
-    col6.metric("Most Fatal Country", latest_data.loc[latest_data["deaths"] == latest_data["deaths"].max(), "country_region"].values[0])
+    col1.metric("Total Cases", f"{latest_global['confirmed'] / 1000000:,.0f}M")
+    col2.metric("Total Deaths", f"{latest_global['deaths'] / 1000000:,.1f}M")
+    col3.metric("Case-Fatality Ratio", f"{(latest_global['deaths'] / latest_global['confirmed']) * 100:.2f}%")
+    col4.metric("Recovery Percentage", f"{(total_recovered / latest_global['confirmed']) * 100:.2f}%")
+    col5.metric("Incidence (Cases per 100,000 people)", f"{(latest_global['confirmed'] / latest_global['population']) * 100000:.0f} cases")
+    col6.metric("Most Fatal Country", latest_countries.loc[latest_countries["deaths"] == latest_countries["deaths"].max(), "country_region"].values[0])
 
 st.markdown("-----")
 
@@ -207,21 +214,20 @@ with st.container():
     sequence_type = col2.radio("Sequence Type", ("Cumulative", "Difference"), key = "seq_conf")
     data_freq = col2.radio("Data Frequency", ("Weekly", "Daily"), key = "freq_conf")
 
-    # Pasos:
-    # 1. Se agrupan los datos por fecha (Máximo global)
-    # 2. Se convierten las fechas en strings a fechas
-    global_confirmed = dataset[["confirmed", "date"]].groupby(by = ["date"], dropna=False).sum().reset_index()
-    global_confirmed["date"] = pd.to_datetime(global_confirmed["date"])
+    # Se extraen los datos globales por fecha (precalculados por el DAG)
+    global_confirmed = daily_global[["date", "confirmed", "new_confirmed", "new_confirmed_7d"]].copy()
 
     # Si los datos se desean mostrar de forma semanal
     if data_freq == "Weekly":
         global_confirmed = global_confirmed[global_confirmed["date"].dt.dayofweek == 0]
 
     # Si se desean presentar las diferencias entre datos
-    # 1. Se calculan las diferencias
+    # 1. Se usan las diferencias precalculadas (diarias, o de 7 días entre lunes); el
+    #    primer día cargado no tiene diferencia (nula) y se muestra como 0, igual que
+    #    con el "diff" anterior
     # 2. Se elimina la última fila de las diferencias
     if sequence_type == "Difference":
-        global_confirmed["confirmed"] = global_confirmed["confirmed"].diff().fillna(0)
+        global_confirmed["confirmed"] = global_confirmed["new_confirmed" if data_freq == "Daily" else "new_confirmed_7d"].fillna(0)
         global_confirmed = global_confirmed.drop(global_confirmed.tail(1).index)
         global_confirmed["perc_change"] = global_confirmed["confirmed"].pct_change().replace([np.inf, -np.inf], np.nan).fillna(0) * 100
 
@@ -260,19 +266,18 @@ with st.container():
     sequence_type = col2.radio("Sequence Type", ("Cumulative", "Difference"), key = "seq_death")
     data_freq = col2.radio("Data Frequency", ("Weekly", "Daily"), key = "freq_death")
 
-    # Se extraen los datos a graficar
-    global_deaths = dataset[["deaths", "date"]].groupby(by = ["date"], dropna=False).sum().reset_index()
-    global_deaths["date"] = pd.to_datetime(global_deaths["date"])
+    # Se extraen los datos a graficar (precalculados por el DAG)
+    global_deaths = daily_global[["date", "deaths", "new_deaths", "new_deaths_7d"]].copy()
 
     # Si los datos se desean mostrar de forma semanal
     if data_freq == "Weekly":
         global_deaths = global_deaths[global_deaths["date"].dt.dayofweek == 0]
 
     # Si se desean presentar las diferencias entre datos
-    # 1. Se calculan las diferencias
+    # 1. Se usan las diferencias precalculadas (diarias, o de 7 días entre lunes)
     # 2. Se elimina la última fila de las diferencias
     if sequence_type == "Difference":
-        global_deaths["deaths"] = global_deaths["deaths"].diff().fillna(0)
+        global_deaths["deaths"] = global_deaths["new_deaths" if data_freq == "Daily" else "new_deaths_7d"].fillna(0)
         global_deaths = global_deaths.drop(global_deaths.tail(1).index)
         global_deaths["perc_change"] = global_deaths["deaths"].pct_change().replace([np.inf, -np.inf], np.nan).fillna(0) * 100
         
@@ -306,10 +311,12 @@ st.markdown("""
 <hr>
 """, unsafe_allow_html = True)
 
-# Data agrupada por continente
-continent_data = dataset[["confirmed", "deaths", "continent", "date", "population", "recovered"]].groupby(by = ["continent", "date"]).sum().reset_index()
+# Data agrupada por continente (precalculada por el DAG)
+continent_data = daily_continent.sort_values(by = ["continent", "date"]).reset_index(drop = True)
 continent_data = continent_data[continent_data["continent"] != "Unknown"]
 continent_data["incidence"] = (continent_data['confirmed'] / continent_data['population']) * 100000
+continent_data["new_incidence"] = (continent_data['new_confirmed'] / continent_data['population']) * 100000
+continent_data["new_incidence_7d"] = (continent_data['new_confirmed_7d'] / continent_data['population']) * 100000
 
 color_map = dict(zip(continent_data["continent"].unique(), px.colors.qualitative.Set1))
 
@@ -340,11 +347,11 @@ with st.container():
         continent_data = continent_data[continent_data["date"].dt.dayofweek == 0]
     
     # CONTROL: Presentar las diferencias entre datos
-    # 1. Se calculan las diferencias
+    # 1. Se usan las diferencias precalculadas (diarias, o de 7 días entre lunes)
     # 2. Se elimina la última fila de las diferencias
     # 3. Se agrega la columna de porcentaje de cambio
     if sequence_type == "Difference":
-        continent_data[metric_type + "_diff"] = continent_data[metric_type].diff().fillna(0)
+        continent_data[metric_type + "_diff"] = continent_data["new_" + metric_type + ("" if data_freq == "Daily" else "_7d")].fillna(0)
         continent_data = continent_data[continent_data["date"] != continent_data["date"].min()]
         continent_data["perc_change"] = continent_data[metric_type].pct_change().replace([np.inf, -np.inf], np.nan).fillna(0) * 100
 
@@ -401,11 +408,9 @@ st.markdown("""
 <hr>
 """, unsafe_allow_html = True)
 
-country_data = dataset[["confirmed", "deaths", "country_region", "date", "population", "code"]].groupby(by = ["country_region", "date", "code"], dropna=False).sum().reset_index()
-
-country_recovered = dataset[["country_region", "recovered"]].groupby(by = ["country_region"], dropna=False).max().fillna(0).reset_index()
-
-country_data = pd.merge(left = country_data, right = country_recovered, on = ["country_region"], how = "left")
+# Situación más reciente de cada país (con el máximo de recuperados de cada país)
+country_data = latest_countries.copy()
+country_data["recovered"] = country_data["recovered"].fillna(0)
 
 #top10 = country_data[country_data["date"] == latest_date].sort_values(by = "confirmed", ascending = False).head(10)
 
@@ -425,7 +430,7 @@ with st.container():
     # CONTROL: Paises a comparar
     countries_comparison = col2.multiselect('Countries to Compare', 
                                             country_data["country_region"].unique().tolist(), 
-                                            (country_data[country_data["date"] == latest_date]
+                                            (country_data
                                                 .sort_values(by = "confirmed", ascending = False)
                                                 .head(10)["country_region"]
                                                 .unique()
@@ -437,7 +442,7 @@ with st.container():
         countries_comparison = countries_comparison[0:10]
 
     # Se obtiene la data más reciente para los países seleccionados
-    top10 = country_data[(country_data["country_region"].isin(countries_comparison)) & (country_data["date"] == latest_date)]
+    top10 = country_data[country_data["country_region"].isin(countries_comparison)]
 
     # Se obtiene un total de ponderación para todas las tasas
     # (Utilizada para hacer a todas las tasas más comparables)
@@ -532,7 +537,7 @@ with st.container():
     selected_country_code = country_data.loc[country_data["country_region"] == selected_country, "code"].tolist()[0]
 
     # Datos de país seleccionado
-    selected_country_data = dataset[dataset['country_region'] == selected_country]
+    selected_country_data = get_CountrySeries(selected_country, data_version).copy()
 
     # Dantos de incidencia
     selected_country_data["incidence"] = (selected_country_data["confirmed"] / selected_country_data["population"]) * 100000
@@ -542,18 +547,21 @@ with st.container():
         selected_country_data = selected_country_data[selected_country_data["date"].dt.dayofweek == 0]
     
     # CONTROL: Datos diferenciales o acumulativos
+    # (Se usan las diferencias precalculadas: diarias, o de 7 días entre lunes)
     if sequence_type == "Difference":
 
+        suffix = "" if sampling_freq == "Daily" else "_7d"
+
         # Procesado de casos confirmados
-        selected_country_data["confirmed"] = selected_country_data["confirmed"].diff().fillna(0)
+        selected_country_data["confirmed"] = selected_country_data["new_confirmed" + suffix].fillna(0)
         selected_country_data["conf_perc_change"] = selected_country_data["confirmed"].pct_change().replace([np.inf, -np.inf], np.nan).fillna(0) * 100
 
         # Procesado de muertes
-        selected_country_data["deaths"] = selected_country_data["deaths"].diff().fillna(0)
+        selected_country_data["deaths"] = selected_country_data["new_deaths" + suffix].fillna(0)
         selected_country_data["death_perc_change"] = selected_country_data["deaths"].pct_change().replace([np.inf, -np.inf], np.nan).fillna(0) * 100
 
         # Procesado de incidencia
-        selected_country_data["incidence"] = selected_country_data["incidence"].diff().fillna(0)
+        selected_country_data["incidence"] = ((selected_country_data["new_confirmed" + suffix] / selected_country_data["population"]) * 100000).fillna(0)
         selected_country_data["incidence_perc_change"] = selected_country_data["incidence"].pct_change().replace([np.inf, -np.inf], np.nan).fillna(0) * 100
 
         # Se elimina la primera y última fecha del cambio
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from structlog import get_logger
+
+logger = get_logger()
+
+# Columnas de texto que se repiten en cada fila (se guardan como categorías)
+CATEGORY_COLUMNS = ["province_state", "country_region", "continent", "code"]
+
+# Coordenadas (la precisión de float32 es de centímetros)
+FLOAT32_COLUMNS = ["lat", "lon"]
+
+# Conteos por región o país (caben en int32 mientras no tengan nulos)
+COUNT_COLUMNS = ["confirmed", "deaths", "recovered"]
+
+# ===============
+# FUNCIONES
+# ===============
+
+def _compact_count(series):
+    """
+    Tipo más pequeño para una columna de conteos: int32 si no tiene nulos y cabe en
+    int32, y si no float64 (que representa exactamente los conteos y usa NaN para
+    los nulos, como espera el resto del dashboard).
+    """
+
+    values = pd.to_numeric(series)
+
+    if values.isna().any():
+        return values.astype("float64")
+
+    if len(values) and (values.min() < np.iinfo(np.int32).min or values.max() > np.iinfo(np.int32).max):
+        return values.astype("int64")
+
+    return values.astype("int32")
+
+
+def memory_mb(df):
+    """Memoria ocupada por un dataframe (incluidos los strings), en MB."""
+
+    return df.memory_usage(deep = True).sum() / 1e6
+
+
+def compact_frame(df, name, sort_by = None):
+    """
+    Convierte un dataframe del dashboard a tipos compactos: los nombres a categorías,
+    las coordenadas a float32 y los conteos a int32. Opcionalmente lo ordena (por
+    ejemplo por país y fecha), para que los filtros y "groupby" posteriores recorran
+    arreglos más pequeños y contiguos. Registra en el log la memoria ahorrada.
+
+    Args:
+        df (df): Dataframe a convertir (solo se convierten las columnas que tenga).
+        name (str): Nombre del dataframe en el log.
+        sort_by (list, optional): Columnas por las que se ordena. Defaults to None.
+
+    Returns:
+        df: Dataframe con tipos compactos.
+    """
+
+    before = memory_mb(df)
+    df = df.copy()
+
+    for column in df.columns:
+        if column in CATEGORY_COLUMNS:
+            df[column] = df[column].astype("category")
+        elif column in FLOAT32_COLUMNS:
+            df[column] = pd.to_numeric(df[column]).astype("float32")
+        elif column in COUNT_COLUMNS:
+            df[column] = _compact_count(df[column])
+
+    if sort_by:
+        df = df.sort_values(by = sort_by).reset_index(drop = True)
+
+    after = memory_mb(df)
+    logger.info(f"Compacted {name}: {before:.2f}MB -> {after:.2f}MB "
+                f"({(1 - after / before) * 100 if before else 0:.0f}% less, {len(df)} rows)")
+
+    return df
@@ -1,34 +1,424 @@
+import os
+import threading
 import numpy as np
 import folium
 from folium import plugins
 import json
 import branca
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
 import streamlit as st
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+
+from compact import compact_frame
+import geo
+from geo import country_values, detail_level, load_packed_topology, load_topology
+from map_cache import RenderedMapCache, files_fingerprint
+
+# ===============================
+# CONEXIÓN CON BASE DE DATOS
+# ===============================
+
+# URL de la base de datos: 'mysql+pymysql://[user]:[pass]@[host]:[port]/[schema]'
+# (PyMySQL permite leer con cursores del lado del servidor, ver "read_sql_chunks")
+DB_URL = os.environ.get("DASHBOARD_DB_URL", "mysql+pymysql://test:test123@db:3306/test")
+
+# Conexiones que se mantienen abiertas en el pool y conexiones extra permitidas
+# cuando todas están ocupadas (compartidas por todas las sesiones del dashboard)
+DB_POOL_SIZE = int(os.environ.get("DASHBOARD_DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DASHBOARD_DB_MAX_OVERFLOW", 5))
+
+# Segundos antes de reemplazar una conexión del pool (MySQL cierra las conexiones
+# inactivas después de "wait_timeout", 8 horas por defecto)
+DB_POOL_RECYCLE = int(os.environ.get("DASHBOARD_DB_POOL_RECYCLE", 3600))
+
+# Filas por bloque en las lecturas grandes
+READ_CHUNKSIZE = int(os.environ.get("DASHBOARD_READ_CHUNKSIZE", 50000))
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Engine de SQLAlchemy del proceso. Se crea una sola vez y todas las sesiones del
+    dashboard (que Streamlit ejecuta en hilos del mismo proceso) comparten su pool de
+    conexiones.
+
+    Returns:
+        sqlalchemy.engine.Engine: Engine de la base de datos.
+    """
+
+    global _engine
+
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(
+                DB_URL,
+                pool_size = DB_POOL_SIZE,
+                max_overflow = DB_MAX_OVERFLOW,
+                pool_recycle = DB_POOL_RECYCLE,
+                pool_pre_ping = True
+            )
+
+    return _engine
+
+
+def read_sql_chunks(query, params = None, dtypes = None, parse_dates = None, chunksize = READ_CHUNKSIZE):
+    """
+    Lee una consulta por bloques con un cursor del lado del servidor, de modo que ni
+    el driver ni pandas cargan el resultado completo en memoria a la vez.
+
+    Cada bloque se convierte a los mismos tipos de dato, para que un bloque sin valores
+    en una columna (por ejemplo, sin recuperados) no quede con otro tipo que el resto.
+
+    Args:
+        query (str): Consulta SQL (parámetros con el formato ":nombre").
+        params (dict, optional): Parámetros de la consulta. Defaults to None.
+        dtypes (dict, optional): Tipo de dato de cada columna. Defaults to None.
+        parse_dates (list, optional): Columnas que se convierten a fecha. Defaults to None.
+        chunksize (int, optional): Filas por bloque. Defaults to READ_CHUNKSIZE.
+
+    Yields:
+        df: Bloques de la consulta.
+    """
+
+    with get_engine().connect() as connection:
+
+        result = connection.execution_options(stream_results = True).execute(text(query), params or {})
+        columns = list(result.keys())
+        chunks = 0
+
+        while True:
+
+            # Si la consulta no devuelve filas se genera un solo bloque vacío, con las
+            # columnas y tipos de la consulta
+            rows = result.fetchmany(chunksize)
+            if not rows and chunks > 0:
+                break
+
+            chunk = pd.DataFrame.from_records(rows, columns = columns)
+
+            for column in parse_dates or []:
+                chunk[column] = pd.to_datetime(chunk[column])
+
+            for column, dtype in (dtypes or {}).items():
+                chunk[column] = pd.to_numeric(chunk[column]).astype(dtype) if dtype != "object" else chunk[column].astype(dtype)
+
+            yield chunk
+            chunks += 1
+
+            if not rows:
+                break
+
+
+def read_sql_streamed(query, params = None, dtypes = None, parse_dates = None, chunksize = READ_CHUNKSIZE):
+    """
+    Lee una consulta completa con "read_sql_chunks" y une sus bloques.
+
+    Returns:
+        df: Resultado de la consulta.
+    """
+
+    return pd.concat(read_sql_chunks(query, params, dtypes, parse_dates, chunksize), ignore_index = True)
 
 # ===============================
-# OBTENER DATOS DE BASE DE DATOS COMO DATAFRAME
+# COPIAS DEL DATASET PUBLICADAS POR EL DAG
 # ===============================
 
-@st.cache(suppress_st_warning = True)
-def get_DBData():
+# Directorio en el que el DAG "load_covid_data" publica las copias del dataset
+# (volumen "monitor/snapshots" compartido con Airflow)
+SNAPSHOT_DIR = os.environ.get("DASHBOARD_SNAPSHOT_DIR", "./snapshots")
+
+def get_latest_snapshot():
+    """
+    Descriptor de la copia más reciente del dataset publicada por el DAG (archivo
+    "latest.json", ver "dags/pipeline/snapshot.py").
+
+    Returns:
+        dict: Versión, ruta, filas, checksum y fecha más reciente de la copia, o None
+        si todavía no se ha publicado ninguna.
+    """
+
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, "latest.json")) as f:
+            descriptor = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    path = os.path.join(SNAPSHOT_DIR, descriptor["path"])
+    if not os.path.exists(path):
+        return None
 
-    # Conexión con base de datos
-    # Argumento: 'mysql+mysqlconnector://[user]:[pass]@[host]:[port]/[schema]'
-    engine = create_engine('mysql+mysqlconnector://test:test123@db:3306/test')
+    return dict(descriptor, path = path)
+
+# ===============================
+# CONSULTAS POR VISTA
+# ===============================
+
+# Cada sección del dashboard tiene su propia consulta, que solo trae las columnas
+# y filas que se muestran, por lo que cada sesión guarda en memoria lo que está en
+# pantalla y no el historial completo. Todas las consultas usan parámetros y se
+# guardan en caché por parámetro y por versión de los datos (ver "get_DataVersion"),
+# de modo que se vuelven a leer una sola vez después de cada carga de los DAGs.
+
+# Segundos entre cada revisión de la versión de los datos
+VERSION_CHECK_SECONDS = int(os.environ.get("DASHBOARD_VERSION_CHECK_SECONDS", 60))
+
+# Versiones que se conservan en caché por consulta (las sesiones abiertas antes de una
+# carga pueden seguir usando la versión anterior)
+CACHE_MAX_ENTRIES = int(os.environ.get("DASHBOARD_CACHE_MAX_ENTRIES", 32))
+
+# Columnas de la vista del mapa (una fila por región para una fecha)
+MAP_COLUMNS = ["province_state", "country_region", "lat", "lon", "date", "confirmed", "deaths", "recovered"]
+
+# Tipos al leer el mapa de MySQL (los conteos como float64, con NaN para los nulos;
+# "compact_frame" los convierte después a int32 si no tienen nulos, igual que los de
+# la copia del DAG)
+MAP_DTYPES = {
+    "province_state": "object",
+    "country_region": "object",
+    "lat": "float64",
+    "lon": "float64",
+    "confirmed": "float64",
+    "deaths": "float64",
+    "recovered": "float64"
+}
+
+@st.cache(suppress_st_warning = True, ttl = VERSION_CHECK_SECONDS)
+def get_DataVersion():
+    """
+    Última versión de los datos, registrada por los DAGs al final de cada carga
+    (tabla "data_version"). Es una consulta de una sola fila que se repite como
+    máximo cada VERSION_CHECK_SECONDS segundos.
+
+    La versión incluye la hora de la carga, para que no se confunda con la versión
+    con el mismo número de otra base de datos (por ejemplo, si se vuelve a crear la
+    base de datos y los números empiezan otra vez en 1).
+
+    Returns:
+        str: Número de versión y hora de la carga ("<versión>-<YYYYMMDDHHMMSS>"), o
+        "0" si todavía no se ha hecho ninguna carga.
+    """
+
+    with get_engine().connect() as connection:
+        row = connection.execute(text("SELECT version, loaded_at FROM data_version ORDER BY version DESC LIMIT 1")).fetchone()
+
+    if row is None:
+        return "0"
+
+    return f"{row[0]}-{pd.Timestamp(row[1]):%Y%m%d%H%M%S}"
+
+
+@st.cache(suppress_st_warning = True, max_entries = CACHE_MAX_ENTRIES)
+def get_DateRange(version):
+    """
+    Primera y última fecha con datos (del agregado global).
 
-    # Se extrae todo el dataset
-    dataset = pd.read_sql(
+    Args:
+        version (str): Versión de los datos (ver "get_DataVersion"). Solo se usa como
+        llave de la caché.
+
+    Returns:
+        tuple: Primera y última fecha (pd.Timestamp).
+    """
+
+    dates = pd.read_sql(
+        "SELECT MIN(date) AS earliest, MAX(date) AS latest FROM covid_daily_global",
+        con = get_engine(),
+        parse_dates = ["earliest", "latest"]
+    )
+
+    return dates["earliest"].iloc[0], dates["latest"].iloc[0]
+
+
+def _map_from_snapshot(path, date):
+    """
+    Vista del mapa a partir de la copia del DAG (ver "get_MapData"). Solo se
+    convierten a pandas las filas de la fecha; "recovered" es la columna
+    "max_recovered" de la copia (el máximo de la región hasta cada fecha, calculado al
+    publicarla). Las copias publicadas antes de esa columna no se usan (None).
+    """
+
+    table = feather.read_table(path, memory_map = True)
+    if "max_recovered" not in table.column_names:
+        return None
+
+    dates = table.column("date")
+    day = pa.scalar(date, type = dates.type)
+
+    columns = [column for column in MAP_COLUMNS if column != "recovered"] + ["max_recovered"]
+    map_data = table.select(columns).filter(pc.equal(dates, day)).to_pandas()
+
+    return map_data.rename(columns = {"max_recovered": "recovered"})[MAP_COLUMNS]
+
+
+def _map_from_db(date):
+    """Vista del mapa a partir de MySQL (ver "get_MapData")."""
+
+    return read_sql_streamed(
         """
-        SELECT covd.*, coud.continent, coud.population, coud.code
-        FROM covid_data covd
-        LEFT JOIN country_data coud ON coud.name = covd.country_region
+        SELECT
+            NULLIF(reg.province_state, '') AS province_state, reg.country_region, reg.lat, reg.lon,
+            cf.date, cf.confirmed, cf.deaths, rec.recovered
+        FROM covid_fact cf
+        JOIN region reg ON reg.id = cf.region_id
+        LEFT JOIN (
+            SELECT region_id, MAX(recovered) AS recovered
+            FROM covid_fact
+            WHERE date <= :date
+            GROUP BY region_id
+        ) rec ON rec.region_id = cf.region_id
+        WHERE cf.date = :date
         """,
-        con = engine
+        params = {"date": date.strftime("%Y-%m-%d")},
+        dtypes = MAP_DTYPES,
+        parse_dates = ["date"]
     )
 
-    return dataset
+
+@st.cache(suppress_st_warning = True, max_entries = CACHE_MAX_ENTRIES)
+def get_MapData(date, version):
+    """
+    Datos del mapa: una fila por región para la fecha elegida, con sus coordenadas.
+    Como algunos países dejaron de reportar recuperados, "recovered" es el máximo de
+    recuperados de la región hasta la fecha. Se lee de la copia publicada por el DAG
+    o, si todavía no hay ninguna, de MySQL, y se guarda con tipos compactos (ver
+    "compact.compact_frame") ordenada por país y provincia.
+
+    Args:
+        date (datetime.date): Fecha a desplegar.
+        version (str): Versión de los datos (llave de la caché).
+
+    Returns:
+        df: Datos con las columnas de MAP_COLUMNS.
+    """
+
+    date = pd.Timestamp(date)
+
+    snapshot = get_latest_snapshot()
+    map_data = _map_from_snapshot(snapshot["path"], date) if snapshot is not None else None
+    if map_data is None:
+        map_data = _map_from_db(date)
+
+    return compact_frame(map_data, "map data", sort_by = ["country_region", "province_state"])
+
+
+@st.cache(suppress_st_warning = True, max_entries = CACHE_MAX_ENTRIES)
+def get_GlobalSeries(version):
+    """
+    Serie diaria global: conteos acumulados, cambios diarios y de 7 días y población.
+
+    Args:
+        version (str): Versión de los datos (llave de la caché).
+
+    Returns:
+        df: Una fila por día, ordenada por fecha.
+    """
+
+    return pd.read_sql(
+        """
+        SELECT date, confirmed, deaths, new_confirmed, new_deaths, new_confirmed_7d, new_deaths_7d, population
+        FROM covid_daily_global
+        ORDER BY date
+        """,
+        con = get_engine(),
+        parse_dates = ["date"]
+    )
+
+
+@st.cache(suppress_st_warning = True, max_entries = CACHE_MAX_ENTRIES)
+def get_ContinentSeries(version):
+    """
+    Series diarias por continente: conteos acumulados, cambios diarios y de 7 días y
+    población.
+
+    Args:
+        version (str): Versión de los datos (llave de la caché).
+
+    Returns:
+        df: Una fila por continente y día, ordenada por continente y fecha.
+    """
+
+    return pd.read_sql(
+        """
+        SELECT continent, date, confirmed, deaths, new_confirmed, new_deaths, new_confirmed_7d, new_deaths_7d, population
+        FROM covid_daily_continent
+        ORDER BY continent, date
+        """,
+        con = get_engine(),
+        parse_dates = ["date"]
+    )
+
+
+@st.cache(suppress_st_warning = True, max_entries = CACHE_MAX_ENTRIES)
+def get_CountrySeries(country, version):
+    """
+    Serie diaria de un país: conteos acumulados, cambios diarios y de 7 días y
+    población.
+
+    Args:
+        country (str): Nombre del país (como aparece en los datos de JHU).
+        version (str): Versión de los datos (llave de la caché).
+
+    Returns:
+        df: Una fila por día, ordenada por fecha (con tipos compactos).
+    """
+
+    country_series = pd.read_sql(
+        text(
+            """
+            SELECT
+                country_region, code, date, confirmed, deaths, recovered,
+                new_confirmed, new_deaths, new_confirmed_7d, new_deaths_7d, population
+            FROM covid_daily_country
+            WHERE country_region = :country
+            ORDER BY date
+            """
+        ),
+        con = get_engine(),
+        params = {"country": country},
+        parse_dates = ["date"]
+    )
+
+    return compact_frame(country_series, "country series")
+
+
+@st.cache(suppress_st_warning = True, max_entries = CACHE_MAX_ENTRIES)
+def get_CountrySnapshot(date, version):
+    """
+    Situación de cada país en una fecha (normalmente la más reciente), para las
+    métricas y la comparación entre países. Como algunos países dejaron de reportar
+    recuperados, "recovered" es el máximo de recuperados de cada país.
+
+    Args:
+        date (datetime.date): Fecha de los datos.
+        version (str): Versión de los datos (llave de la caché).
+
+    Returns:
+        df: Una fila por país, ordenada por nombre (con tipos compactos).
+    """
+
+    country_snapshot = pd.read_sql(
+        text(
+            """
+            SELECT cou.country_region, cou.code, cou.confirmed, cou.deaths, rec.recovered, cou.population
+            FROM covid_daily_country cou
+            LEFT JOIN (
+                SELECT country_region, MAX(recovered) AS recovered
+                FROM covid_daily_country
+                GROUP BY country_region
+            ) rec ON rec.country_region = cou.country_region
+            WHERE cou.date = :date
+            ORDER BY cou.country_region
+            """
+        ),
+        con = get_engine(),
+        params = {"date": pd.Timestamp(date).strftime("%Y-%m-%d")}
+    )
+
+    return compact_frame(country_snapshot, "country snapshot")
 
 # ===============================
 # LINK CAPA Y ELEMENTO FOLIUM
@@ -64,6 +454,219 @@ class BindColormap(MacroElement):
         """)  # noqa
 
 
+# ===============================
+# CAPA DE BURBUJAS
+# ===============================
+
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+
+# Estilo de las burbujas (opciones de L.circleMarker)
+BUBBLE_STYLE = {
+    "color": "#3186cc",
+    "weight": 3,
+    "opacity": 1.0,
+    "fill": True,
+    "fillColor": "#3186cc",
+    "fillOpacity": 0.2
+}
+
+# Número de regiones a partir del cual las burbujas se agrupan (por ejemplo, con
+# datos por condado), y zoom desde el que se muestran sin agrupar
+BUBBLE_CLUSTER_MIN_POINTS = int(os.environ.get("DASHBOARD_BUBBLE_CLUSTER_MIN_POINTS", 1000))
+BUBBLE_CLUSTER_MAX_ZOOM = 7
+
+class BubbleLayer(JSCSSMixin, Layer):
+    """Capa con una burbuja por región, construida en el navegador.
+
+    Los datos se envían una sola vez como un arreglo compacto (una fila por región con
+    latitud, longitud, radio, nombre, confirmados, muertes y recuperados), y una sola
+    función de JavaScript crea los marcadores (dibujados en un canvas) y el popup de
+    cada uno al abrirlo. Con BUBBLE_CLUSTER_MIN_POINTS regiones o más, las burbujas se
+    agrupan con Leaflet.markercluster.
+
+    Parameters
+    ----------
+    data : df
+        Datos por región, con "lat", "lon", "radius", "region_and_province",
+        "confirmed", "deaths" y "recovered".
+    name : str
+        Nombre de la capa.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = {% if this.cluster -%}
+                L.markerClusterGroup({{ this.cluster_options|tojson }});
+            {%- else -%}
+                L.featureGroup();
+            {%- endif %}
+
+            (function (rows, layer, style) {
+                var renderer = L.canvas();
+                var format = function (value) { return value.toLocaleString("en-US"); };
+                var escape = function (text) {
+                    var element = document.createElement("span");
+                    element.textContent = text;
+                    return element.innerHTML;
+                };
+                var popup = function (row) {
+                    return '<h4 style="font-family: Arial">' + escape(row[3]) + '</h4>' +
+                        '<p style="font-family: Arial">' +
+                        '<b>Confirmed</b>: ' + format(row[4]) + '<br>' +
+                        '<b>Deaths</b>: ' + format(row[5]) + '<br>' +
+                        '<b>Recovered</b>: ' + format(row[6]) + '<br></p>';
+                };
+                var markers = rows.map(function (row) {
+                    var marker = L.circleMarker([row[0], row[1]], L.extend({radius: row[2], renderer: renderer}, style));
+                    return marker.bindPopup(function () { return popup(row); }, {minWidth: 250, maxWidth: 250});
+                });
+                if (layer.addLayers) {
+                    layer.addLayers(markers);
+                } else {
+                    markers.forEach(function (marker) { layer.addLayer(marker); });
+                }
+            })({{ this.rows|tojson }}, {{ this.get_name() }}, {{ this.style|tojson }});
+
+            {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """)  # noqa
+
+    def __init__(self, data, name = None):
+        super(BubbleLayer, self).__init__(name = name)
+        self._name = "BubbleLayer"
+
+        # Una fila por región (coordenadas a 4 decimales, ~10m, y radio a 1 decimal)
+        counts = data[["confirmed", "deaths", "recovered"]].fillna(0).astype("int64")
+        self.rows = list(zip(
+            data["lat"].astype(float).round(4).tolist(),
+            data["lon"].astype(float).round(4).tolist(),
+            data["radius"].astype(float).round(1).tolist(),
+            data["region_and_province"].astype(str).tolist(),
+            counts["confirmed"].tolist(),
+            counts["deaths"].tolist(),
+            counts["recovered"].tolist()
+        ))
+        self.style = BUBBLE_STYLE
+
+        # Solo se agregan los archivos de Leaflet.markercluster si se agrupan las burbujas
+        self.cluster = len(self.rows) >= BUBBLE_CLUSTER_MIN_POINTS
+        self.cluster_options = {"chunkedLoading": True, "disableClusteringAtZoom": BUBBLE_CLUSTER_MAX_ZOOM}
+        if self.cluster:
+            self.default_js = plugins.MarkerCluster.default_js
+            self.default_css = plugins.MarkerCluster.default_css
+
+
+# ===============================
+# CAPA DE CHOROPLETH
+# ===============================
+
+from branca.utilities import color_brewer
+
+# Estilo de las fronteras de los países, estilo del país bajo el cursor (los de
+# folium.Choropleth con "highlight") y color de los países sin datos
+CHOROPLETH_STYLE = {
+    "color": "black",
+    "weight": 1,
+    "opacity": 0.5,
+    "fillOpacity": 0.7
+}
+CHOROPLETH_HIGHLIGHT = {
+    "weight": 3,
+    "fillOpacity": 0.9
+}
+CHOROPLETH_NAN_COLOR = "black"
+
+class ChoroplethLayer(JSCSSMixin, Layer):
+    """Choropleth por país, coloreado en el navegador.
+
+    Equivalente a "folium.Choropleth" con un TopoJson, pero sin agregar el estilo y las
+    propiedades a cada país: la topología de cada nivel se incluye en su forma compacta
+    (ver "geo.load_packed_topology") y los datos se envían como un arreglo (índice de
+    color y valor de cada país, en el orden de las geometrías). Los colores se
+    calculan igual que en "folium.Choropleth", el país bajo el cursor se resalta y el
+    popup de cada país se crea al abrirlo.
+
+    Parameters
+    ----------
+    level : str
+        Nivel de detalle de las fronteras (llave de topology.LEVELS).
+    values : np.array
+        Valor de cada país, en el orden de las geometrías (NaN si no tiene datos).
+    bins : list
+        Límites de los intervalos de color.
+    fill_color : str
+        Paleta de ColorBrewer.
+    field : str
+        Nombre del valor en el popup.
+    name : str
+        Nombre de la capa.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function (packed, rows, colors, style, highlight, field) {
+                var format = function (value) { return value.toLocaleString("en-US"); };
+                var escape = function (text) {
+                    var element = document.createElement("span");
+                    element.textContent = text;
+                    return element.innerHTML;
+                };
+                var popup = function (name, value) {
+                    return '<table><tr><th>Country</th><td>' + escape(name) + '</td></tr>' +
+                        '<tr><th>' + field + '</th><td>' + format(value) + '</td></tr></table>';
+                };
+                var arcs = packed.arcs.map(function (flat) {
+                    var arc = [];
+                    for (var i = 0; i < flat.length; i += 2) { arc.push([flat[i], flat[i + 1]]); }
+                    return arc;
+                });
+                var geometries = packed.geometries.map(function (arcs, i) {
+                    var type = arcs === null ? null : (Array.isArray(arcs[0][0]) ? "MultiPolygon" : "Polygon");
+                    return {type: type, arcs: arcs, properties: {ADMIN: packed.names[i], row: rows[i]}};
+                });
+                var topology = {type: "Topology", transform: packed.transform, arcs: arcs,
+                                objects: {countries: {type: "GeometryCollection", geometries: geometries}}};
+                var features = topojson.feature(topology, topology.objects.countries).features;
+                var countries = L.geoJson(features, {
+                    style: function (feature) {
+                        return L.extend({fillColor: colors[feature.properties.row[0]]}, style);
+                    },
+                    onEachFeature: function (feature, layer) {
+                        layer.bindPopup(function () { return popup(feature.properties.ADMIN, feature.properties.row[1]); });
+                        layer.on({
+                            mouseover: function (e) { e.target.setStyle(highlight); },
+                            mouseout: function (e) { countries.resetStyle(e.target); }
+                        });
+                    }
+                });
+                return countries;
+            })({{ this.topology }}, {{ this.rows|tojson }}, {{ this.colors|tojson }}, {{ this.style|tojson }}, {{ this.highlight|tojson }}, {{ this.field|tojson }});
+
+            {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """)  # noqa
+
+    default_js = folium.TopoJson.default_js
+
+    def __init__(self, level, values, bins, fill_color, field, name = None):
+        super(ChoroplethLayer, self).__init__(name = name)
+        self._name = "ChoroplethLayer"
+
+        self.topology = load_packed_topology(level)
+        self.field = field
+        self.style = CHOROPLETH_STYLE
+        self.highlight = CHOROPLETH_HIGHLIGHT
+
+        # Color de cada país como en "folium.Choropleth": intervalo de "bins" (el último
+        # incluye su límite superior), o el color de los países sin datos
+        edges = np.array(bins, dtype = float)
+        edges[-1] = np.nextafter(edges[-1], np.inf)
+        color_index = np.clip(np.digitize(values, edges, right = False) - 1, 0, len(bins) - 2)
+        color_index[np.isnan(values)] = len(bins) - 1
+
+        self.colors = color_brewer(fill_color, n = len(bins) - 1) + [CHOROPLETH_NAN_COLOR]
+        self.rows = list(zip(color_index.tolist(), np.nan_to_num(values).astype("int64").tolist()))
+
+
 # ===============================
 # GENERAR BINS O NIVELES DE COLOR PARA MAPA
 # ===============================
@@ -107,28 +710,79 @@ def generate_bins(max_value):
 # PROCESAR DATOS PARA MAPA
 # ===============================
 
-def process_folium_map_data(dataset, sel_date = "2021-05-22"):
-    """
-    Toma datos preprocesados de COVID y los despliega de manera legible
-    dentro de un mapa propio de folium.
+# Zoom inicial de los mapas (con DASHBOARD_MAP_DETAIL=auto, define el nivel de
+# detalle de las fronteras, ver "geo.detail_level")
+MAP_ZOOM_START = int(os.environ.get("DASHBOARD_MAP_ZOOM_START", 2))
+
+# Choropleth de cada conteo: columna de datos, propiedad del popup, colores y leyenda
+CHOROPLETHS = {
+    "confirmed": {
+        "column": "confirmed",
+        "field": "Confirmed",
+        "name": "Confirmed by Country",
+        "fill_color": "BuPu",
+        "colormap": branca.colormap.linear.BuPu_08,
+        "caption": "Log(Confirmed)"
+    },
+    "deaths": {
+        "column": "deaths",
+        "field": "Deaths",
+        "name": "Deaths by Country",
+        "fill_color": "YlOrRd",
+        "colormap": branca.colormap.linear.YlOrRd_09,
+        "caption": "Log(Deaths)"
+    },
+    "recovered": {
+        "column": "recovered",
+        "field": "Recovered",
+        "name": "Recovered by Country",
+        "fill_color": "Greens",
+        "colormap": branca.colormap.linear.Greens_08,
+        "caption": "Log(Recovered)"
+    }
+}
+
+# Tipos de mapa que se pueden construir (ver "get_FoliumMap")
+MAP_TYPES = ["bubbles"] + list(CHOROPLETHS)
 
+# Caché del HTML de los mapas ya construidos, por fecha, tipo de mapa y versión de los
+# datos, compartida por todas las sesiones del proceso: bytes máximos en memoria y,
+# opcionalmente, directorio y bytes máximos para los mapas que no caben en memoria
+MAP_CACHE_BYTES = int(os.environ.get("DASHBOARD_MAP_CACHE_BYTES", 64 * 10**6))
+MAP_CACHE_DIR = os.environ.get("DASHBOARD_MAP_CACHE_DIR") or None
+MAP_CACHE_DISK_BYTES = int(os.environ.get("DASHBOARD_MAP_CACHE_DISK_BYTES", 256 * 10**6))
+
+map_cache = RenderedMapCache(MAP_CACHE_BYTES, directory = MAP_CACHE_DIR, max_disk_bytes = MAP_CACHE_DISK_BYTES)
+
+# Huella del código y la geometría de los mapas (y de la versión de folium), parte de
+# la llave de cada mapa: los mapas guardados en disco por una versión anterior del
+# dashboard no se vuelven a usar
+MAP_FINGERPRINT = files_fingerprint(
+    [os.path.abspath(__file__), geo.__file__, geo.GEOJSON_PATH] + [geo.topology_path(level) for level in geo.LEVELS],
+    folium.__version__
+)
+
+def prepare_map_data(dataset):
+    """
+    Prepara los datos de una fecha para los mapas: los conteos por país (con los
+    nombres del GeoJson) para los choropleth y los datos de cada región (con su nombre
+    y el tamaño de su burbuja) para el mapa de burbujas.
 
     Args:
-        dataset (df): Datos obtenidos de la base de datos central de MySQL,
-        los cuales son previamente cargados utilizando Airflow.
-        sel_date (str, optional): Fecha para la que se van a desplegar resultados.
-        Defaults to "2021-05-22".
+        dataset (df): Datos de cada región para la fecha a desplegar, con
+        los recuperados hasta esa fecha (ver "get_MapData").
 
     Returns:
-        folium.map: Mapa de folium con todos sus elementos respectivos listos para
-        ser presentados utilizando "folium_static()".
+        tuple: Datos por país ("GroupedData") y datos por región ("unGroupedData").
     """
 
     # Se eliminan columnas innecesarias
+    # (Los nombres se convierten a texto, ya que aquí se reemplazan por nombres nuevos)
     dataset = dataset[["country_region", "province_state", "date", "confirmed", "deaths", "recovered", "lat", "lon"]]
-    
-    # Se convierte la fecha de datetime a string
-    sel_date = sel_date.strftime('%Y-%m-%d')
+    dataset = dataset.astype({"country_region": object, "province_state": object})
+
+    # Regiones que nunca reportaron recuperados
+    dataset["recovered"] = dataset["recovered"].fillna(0)
 
     # Algunos nombres que aparecen como paises en el archivo GeoJson descargado
     # aparecen como "Estado/Provincia" en el dataset principal. Aquí se hace el mapeo,
@@ -153,20 +807,12 @@ def process_folium_map_data(dataset, sel_date = "2021-05-22"):
     for key in map_state_geoJson:
         dataset.loc[dataset["province_state"] == key, "country_region"] = map_state_geoJson[key]
 
-    # Group por país y fecha
-    GroupedData = (dataset[dataset["date"] == sel_date]
+    # Group por país
+    GroupedData = (dataset
                     .groupby(by = "country_region")
                     .max()
                     .reset_index())
 
-    # Se corrige el número de de recuperados hasta la fecha 
-    data_till_sel_date = dataset[dataset["date"] < sel_date]
-    GroupedData["recovered"] = (data_till_sel_date[["country_region", "recovered"]]
-                                    .groupby(by = ["country_region"], dropna=False)
-                                    .max()
-                                    .fillna(0)
-                                    .reset_index())["recovered"]
-
     # Algunos paises en el GeoJson están escritos diferente con respecto
     # a los datos del dataset. Aquí se hace el mapeo para que ambos nombres
     # sean iguales.
@@ -199,15 +845,8 @@ def process_folium_map_data(dataset, sel_date = "2021-05-22"):
     # Datos por fecha sin "groupby"
     # --------------
 
-    # Extracción de datos de día específico
-    unGroupedData = dataset[dataset["date"] == sel_date].reset_index() 
-
-    # Se corrige el número de de recuperados hasta la fecha 
-    unGroupedData["recovered"]= (data_till_sel_date[["country_region", "province_state", "recovered"]]
-                                    .groupby(by = ["country_region", "province_state"], dropna=False)
-                                    .max()
-                                    .fillna(0)
-                                    .reset_index())["recovered"]
+    # Datos de cada región
+    unGroupedData = dataset.reset_index()
 
     # Creación de columna de País + Estado. 
     # Valores iniciales: Nombres de país
@@ -241,248 +880,112 @@ def process_folium_map_data(dataset, sel_date = "2021-05-22"):
     except:
         unGroupedData["marker_size"] = 0.5
 
-    # --------------
-    # Edición GeoJson
-    # --------------
-
-    # Carga de datos de GeoJson
-    with open("./streamlit/countries-min.json") as f:
-        geojson_countries = json.load(f)
-
-    # Se le agregan propiedades al JSON
-    for i in geojson_countries['features']:
-
-        # Se agrega la feature "id" y la propiedad "Country"
-        i['id'] = i['properties']['ADMIN']
-        i['properties']["Country"] = i['id']
+    return GroupedData, unGroupedData
 
-        # Se agrega la propiedad "Confirmed" al GeoJson
-        # (Si el match es nulo, se coloca un 0 en la propiedad)
-        match_confirmed = GroupedData.loc[GroupedData["country_region"] == i["id"], "confirmed"].values
 
-        if len(match_confirmed) != 0:
-            i['properties']["Confirmed"] = int(match_confirmed[0])
-        else:
-            i['properties']["Confirmed"] = 0
-
-        # Se agrega la propiedad "Deaths" al GeoJson
-        # (Si el match es nulo, se coloca un 0 en la propiedad)
-        match_deaths = GroupedData.loc[GroupedData["country_region"] == i["id"], "deaths"].values
+@st.cache(suppress_st_warning = True, max_entries = CACHE_MAX_ENTRIES, allow_output_mutation = True)
+def get_MapTables(date, version):
+    """
+    Datos de los mapas de una fecha (ver "prepare_map_data"). Se calculan una sola vez
+    por fecha y versión, y los comparten todos los tipos de mapa. Los mapas solo leen
+    estos dataframes, por lo que la caché no revisa si se modificaron.
 
-        if len(match_deaths) != 0:
-            i['properties']["Deaths"] = int(match_deaths[0])
-        else:
-            i['properties']["Deaths"] = 0
+    Args:
+        date (datetime.date): Fecha a desplegar.
+        version (str): Versión de los datos (llave de la caché).
 
-        # Se agrega la propiedad "Recovered" al GeoJson
-        # (Si el match es nulo, se coloca un 0 en la propiedad)
-        match_recovered = GroupedData.loc[GroupedData["country_region"] == i["id"], "recovered"].values
+    Returns:
+        tuple: Datos por país y datos por región.
+    """
 
-        if len(match_recovered) != 0:
-            i['properties']["Recovered"] = int(match_recovered[0])
-        else:
-            i['properties']["Recovered"] = 0
+    return prepare_map_data(get_MapData(date, version))
 
-    # --------------
-    # Folium Map
-    # --------------
 
-    # ======================
-    # Confirmed: Choropleth
+def _base_map():
+    """Mapa de folium vacío, con el zoom y los límites de todos los mapas."""
 
-    map_confirmed = folium.Map(
+    return folium.Map(
         location=[0, 0], 
-        zoom_start = 2, 
+        zoom_start = MAP_ZOOM_START, 
         min_zoom = 2,
         control_scale = True,
         max_bounds = True,
         min_lat = -60)
 
-    # Se generan los bins en los que se va a dividir el número de casos
-    confirmed_bins = generate_bins(max(unGroupedData["confirmed"]))
-
-    # Creación de choropleth
-    choropleth_confirmed = folium.Choropleth(
-        geo_data = geojson_countries,
-        name = "Confirmed by Country",
-        data = GroupedData,
-        columns = ["country_region", "confirmed"],
-        key_on = "feature.id",
-        fill_color = "BuPu",
-        fill_opacity = 0.7,
-        line_opacity = 0.5,
-        legend_name = "Confirmed Cases",
-        highlight = True, 
-        bins = confirmed_bins
-    )
-
-    # Se elimina la leyenda creada por defecto por choropleth
-    for key in choropleth_confirmed._children:
-        if key.startswith('color_map'):
-            del(choropleth_confirmed._children[key])
-
-    # Se agrega el choropleth luego de eliminar la leyenda
-    choropleth_confirmed.add_to(map_confirmed)
 
-    # Colormap logarítmico para confirmados
-    bins_log = np.log(np.array(confirmed_bins) + 1)
-    colormap_confirmed = branca.colormap.linear.BuPu_08.scale(0, 500)
-    colormap_confirmed = colormap_confirmed.to_step(index = bins_log)
-    colormap_confirmed.caption = 'Log(Confirmed)'
-    colormap_confirmed.add_to(map_confirmed)
+def build_choropleth_map(map_type, GroupedData, unGroupedData):
+    """
+    Mapa choropleth de un conteo por país (ver CHOROPLETHS).
 
-    # Popup con el nombre del país y el número de confirmados
-    folium.features.GeoJsonPopup(fields = ["Country", "Confirmed"]).add_to(choropleth_confirmed.geojson)
+    Args:
+        map_type (str): Conteo a desplegar ("confirmed", "deaths" o "recovered").
+        GroupedData (df): Datos por país (ver "prepare_map_data").
+        unGroupedData (df): Datos por región, para la escala de colores.
 
-    # Adición de mini-mapa
-    map_confirmed.add_child(plugins.MiniMap(toggle_display=True))
+    Returns:
+        folium.map: Mapa de folium con el choropleth, su escala de colores y su popup.
+    """
 
-    # Link entre la escala de color logarítimica y el mapa
-    map_confirmed.add_child(BindColormap(choropleth_confirmed, colormap_confirmed))
+    settings = CHOROPLETHS[map_type]
+    column = settings["column"]
 
-    # ===================
-    # Muertes: Choropleth
+    folium_map = _base_map()
 
-    map_deaths = folium.Map(
-        location=[0, 0], 
-        zoom_start = 2, 
-        min_zoom = 2,
-        control_scale = True,
-        max_bounds = True,
-        min_lat = -60)
-
-    # Se generan los bins en los que se va a dividir el número de muertos
-    death_bins = generate_bins(max(unGroupedData["deaths"]))
-
-    # Creación de choropleth
-    choropleth_deaths = folium.Choropleth(
-        geo_data = geojson_countries,
-        name = "Deaths by Country",
-        data = GroupedData,
-        columns = ["country_region", "deaths"],
-        key_on = "feature.id",
-        fill_color = "YlOrRd",
-        fill_opacity = 0.7,
-        line_opacity = 0.5,
-        legend_name = "Deaths",
-        highlight = True, 
-        bins = death_bins
+    # Se generan los bins en los que se va a dividir el número de casos
+    bins = generate_bins(max(unGroupedData[column]))
+
+    # Fronteras simplificadas de acuerdo al zoom inicial o a DASHBOARD_MAP_DETAIL
+    # (TopoJson con arcos compartidos, que se carga una sola vez por proceso, ver
+    # "topology.py") y valor de cada país
+    level = detail_level(MAP_ZOOM_START)
+    values = country_values(load_topology(level), GroupedData, column)
+
+    # Creación de choropleth (coloreado en el navegador, ver "ChoroplethLayer")
+    choropleth = ChoroplethLayer(
+        level,
+        values,
+        bins,
+        fill_color = settings["fill_color"],
+        field = settings["field"],
+        name = settings["name"]
     )
+    choropleth.add_to(folium_map)
 
-    # Se elimina la leyenda creada por defecto por choropleth
-    for key in choropleth_deaths._children:
-        if key.startswith('color_map'):
-            del(choropleth_deaths._children[key])
-
-    # Se agrega el choropleth luego de eliminar la leyenda
-    choropleth_deaths.add_to(map_deaths)
-
-    # Colormap logarítmico de muertes
-    bins_log = np.log(np.array(death_bins) + 1)
-    colormap_deaths = branca.colormap.linear.YlOrRd_09.scale(0, 500)
-    colormap_deaths = colormap_deaths.to_step(index = bins_log)
-    colormap_deaths.caption = 'Log(Deaths)'
-    colormap_deaths.add_to(map_deaths)
-
-    # Popup con el nombre del país y el número de confirmados
-    folium.features.GeoJsonPopup(fields = ["Country", "Deaths"]).add_to(choropleth_deaths.geojson)
+    # Colormap logarítmico
+    bins_log = np.log(np.array(bins) + 1)
+    colormap = settings["colormap"].scale(0, 500)
+    colormap = colormap.to_step(index = bins_log)
+    colormap.caption = settings["caption"]
+    colormap.add_to(folium_map)
 
     # Adición de mini-mapa
-    map_deaths.add_child(plugins.MiniMap(toggle_display=True))
+    folium_map.add_child(plugins.MiniMap(toggle_display=True))
 
     # Link entre la escala de color logarítimica y el mapa
-    map_deaths.add_child(BindColormap(choropleth_deaths, colormap_deaths))
+    folium_map.add_child(BindColormap(choropleth, colormap))
 
-    # ===================
-    # Recuperados: Choropleth
+    return folium_map
 
-    map_recovered = folium.Map(
-        location=[0, 0], 
-        zoom_start = 2, 
-        min_zoom = 2,
-        control_scale = True,
-        max_bounds = True,
-        min_lat = -60)
-
-    # Se convierten a float los bins en los que se va a dividir el número de casos
-    recovered_bins = generate_bins(max(unGroupedData["recovered"]))
-
-    choropleth_recovered = folium.Choropleth(
-        geo_data = geojson_countries,
-        name = "Recovered by Country",
-        data = GroupedData,
-        columns = ["country_region", "recovered"],
-        key_on = "feature.id",
-        fill_color = "Greens",
-        fill_opacity = 0.7,
-        line_opacity = 0.5,
-        legend_name = "Recovered",
-        highlight = True, 
-        bins = recovered_bins,
-        show = True
-    )
 
-    # Se elimina la leyenda creada por defecto por choropleth
-    for key in choropleth_recovered._children:
-        if key.startswith('color_map'):
-            del(choropleth_recovered._children[key])
-
-    # Se agrega el choropleth luego de eliminar la leyenda
-    choropleth_recovered.add_to(map_recovered)
-
-    # Colormap logarítmico de recuperados
-    bins_log = np.log(np.array(recovered_bins) + 1)
-    colormap_recovered = branca.colormap.linear.Greens_08.scale(0, 500)
-    colormap_recovered = colormap_recovered.to_step(index = bins_log)
-    colormap_recovered.caption = 'Log(Recovered)'
-    colormap_recovered.add_to(map_recovered)
-
-    # Popup con el nombre del país y el número de confirmados
-    folium.features.GeoJsonPopup(fields = ["Country", "Recovered"]).add_to(choropleth_recovered.geojson)
+def build_bubbles_map(unGroupedData):
+    """
+    Mapa de burbujas con los datos de cada región.
 
-    # Adición de mini-mapa
-    map_recovered.add_child(plugins.MiniMap(toggle_display=True))
+    Args:
+        unGroupedData (df): Datos por región (ver "prepare_map_data").
 
-    # Link entre la escala de color logarítimica y el mapa
-    map_recovered.add_child(BindColormap(choropleth_recovered, colormap_recovered))
+    Returns:
+        folium.map: Mapa de folium con una burbuja por región (ver "BubbleLayer").
+    """
 
-    # ===================
-    # Data por Región: Burbujas
+    map_bubbles = _base_map()
 
-    map_bubbles = folium.Map(
-        location=[0, 0], 
-        zoom_start = 2, 
-        min_zoom = 2,
-        control_scale = True,
-        max_bounds = True,
-        min_lat = -60)
+    # Radio de cada burbuja de acuerdo a su factor de escalado
+    regions = unGroupedData.assign(radius = unGroupedData["marker_size"] * 12)
 
-    # Se crea una capa para todos los marcadores circulares
-    feature_group = folium.FeatureGroup(name = "Cases by Region")
-
-    # Para cada pareja de latitud y longitud se crea un marcador circular
-    unGroupedData.apply(lambda row: 
-        folium.CircleMarker(
-            location = [row["lat"], row["lon"]], 
-            radius = row["marker_size"] * 12, 
-            color = "#3186cc",
-            fill = True,
-            fill_color = "#3186cc",
-            popup = folium.Popup(
-                folium.IFrame(
-                    f'''<h4 style="font-family: Arial">{row["region_and_province"]}</h4>
-                    <p style="font-family: Arial">
-                    <b>Confirmed</b>: {"{:,}".format(row["confirmed"])}<br>
-                    <b>Deaths</b>: {"{:,}".format(row["deaths"])}<br>
-                    <b>Recovered</b>: {"{:,}".format(int(row["recovered"])) if np.isnan(row["recovered"]) == False else 0}<br>
-                    </p>
-                    '''
-                ), 
-                min_width=250,
-                max_width=250
-            )     
-        ).add_to(feature_group),
-        axis = 1)
+    # Se crea una sola capa con todas las burbujas (los marcadores y sus popups se
+    # crean en el navegador a partir de un solo arreglo con los datos)
+    feature_group = BubbleLayer(regions, name = "Cases by Region")
 
     # Se agregan todos los puntos al mapa como una capa
     feature_group.add_to(map_bubbles)
@@ -494,14 +997,53 @@ def process_folium_map_data(dataset, sel_date = "2021-05-22"):
     minimap = plugins.MiniMap(toggle_display=True)
     map_bubbles.add_child(minimap)
 
-    # Nota: El mapa generado es bastante grande por la resolución de la geometría en el GeoJson
-    # Dependiendo del tamaño se deberán modificar los límites de tamaño de elementos estáticos
-    # de streamlit en el dockerfile correspondiente de acuerdo a lo dicho en el siguiente foro: 
+    return map_bubbles
+
+
+def _render_map(map_type, date, version):
+    """Construye el mapa elegido y lo convierte a HTML (ver "get_FoliumMap")."""
+
+    GroupedData, unGroupedData = get_MapTables(date, version)
+
+    if map_type == "bubbles":
+        folium_map = build_bubbles_map(unGroupedData)
+    else:
+        folium_map = build_choropleth_map(map_type, GroupedData, unGroupedData)
+
+    # Nota: Las fronteras se envían como TopoJson simplificado (ver "topology.py"), por lo
+    # que cada mapa pesa mucho menos que con el GeoJson completo. Si se usa un nivel de
+    # detalle mayor u otro GeoJson, puede ser necesario modificar los límites de tamaño de
+    # elementos estáticos de streamlit en el dockerfile correspondiente de acuerdo a lo
+    # dicho en el siguiente foro:
     # https://discuss.streamlit.io/t/runtimeerror-data-of-size-107-9mb-exceeds-write-limit-of-50-0mb/6970/13
 
-    return ({
-        "confirmed": map_confirmed,
-        "deaths": map_deaths,
-        "recovered": map_recovered,
-        "bubbles": map_bubbles
-    })
\ No newline at end of file
+    return folium.Figure().add_child(folium_map).render()
+
+
+def get_FoliumMap(map_type, date, version):
+    """
+    HTML del mapa elegido (el documento que se despliega con
+    "streamlit.components.v1.html"). Solo se construye el mapa elegido, y solo si no
+    está en "map_cache": un mapa ya desplegado en cualquier sesión (por ejemplo, el del
+    día más reciente) se devuelve sin volver a construirlo. Los datos de la fecha se
+    comparten entre los tipos de mapa (ver "get_MapTables"), por lo que cambiar de tipo
+    de mapa no vuelve a procesarlos.
+
+    Args:
+        map_type (str): Tipo de mapa (uno de MAP_TYPES).
+        date (datetime.date): Fecha a desplegar.
+        version (str): Versión de los datos (ver "get_DataVersion").
+
+    Returns:
+        str: HTML del mapa.
+    """
+
+    if map_type not in MAP_TYPES:
+        raise ValueError(f"Unknown map type: {map_type} (expected one of {MAP_TYPES})")
+
+    # (el nivel de detalle de las fronteras y la huella del código también son parte de
+    # la llave, para que los mapas guardados en disco no se usen si cambia
+    # DASHBOARD_MAP_DETAIL o el dashboard)
+    key = (pd.Timestamp(date).strftime("%Y-%m-%d"), map_type, version, detail_level(MAP_ZOOM_START), MAP_FINGERPRINT)
+
+    return map_cache.get_or_build(key, lambda: _render_map(map_type, date, version))
@@ -0,0 +1,245 @@
+import functools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from jinja2.utils import htmlsafe_json_dumps
+
+from topology import LEVELS, OBJECT_NAME, build_topology, topology_path
+
+# GeoJSON con las fronteras de cada país (baja resolución)
+GEOJSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "countries-min.json")
+
+# Nivel de detalle de las fronteras en los mapas ("low", "medium" o "high", ver
+# topology.LEVELS). Con "auto" se elige de acuerdo al zoom inicial del mapa
+# (DASHBOARD_MAP_ZOOM_START, ver "functions.MAP_ZOOM_START").
+MAP_DETAIL = os.environ.get("DASHBOARD_MAP_DETAIL", "auto")
+
+# Zoom máximo de cada nivel de detalle (con un zoom mayor se usa "high")
+ZOOM_LEVELS = [(3, "low"), (5, "medium")]
+
+# Propiedades que se agregan a cada país: nombre de la propiedad y columna de datos
+STAT_PROPERTIES = {
+    "Confirmed": "confirmed",
+    "Deaths": "deaths",
+    "Recovered": "recovered"
+}
+
+# ===============
+# FUNCIONES
+# ===============
+
+@functools.lru_cache(maxsize = None)
+def load_geojson(path = GEOJSON_PATH):
+    """
+    Carga un GeoJSON una sola vez por proceso. El resultado se comparte entre todas
+    las sesiones, por lo que no se debe modificar (ver "enrich_geojson").
+
+    Args:
+        path (str, optional): Ruta del archivo. Defaults to GEOJSON_PATH.
+
+    Returns:
+        dict: FeatureCollection del archivo.
+    """
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def detail_level(zoom):
+    """
+    Nivel de detalle de las fronteras para un zoom: el de MAP_DETAIL o, con "auto",
+    el primero de ZOOM_LEVELS que admite el zoom.
+
+    Args:
+        zoom (int): Zoom inicial del mapa.
+
+    Returns:
+        str: Nivel de detalle (llave de topology.LEVELS).
+    """
+
+    if MAP_DETAIL != "auto":
+        return MAP_DETAIL
+
+    for max_zoom, level in ZOOM_LEVELS:
+        if zoom <= max_zoom:
+            return level
+
+    return "high"
+
+
+@functools.lru_cache(maxsize = None)
+def load_topology(level):
+    """
+    Carga el TopoJSON de un nivel de detalle una sola vez por proceso (ver
+    "topology.py"). Si el archivo no se ha generado, la topología se construye a
+    partir de GEOJSON_PATH. Como en "load_geojson", el resultado no se debe modificar
+    (ver "enrich_topology").
+
+    Args:
+        level (str): Nivel de detalle (llave de topology.LEVELS).
+
+    Returns:
+        dict: Topología con los países en el objeto OBJECT_NAME.
+    """
+
+    if level not in LEVELS:
+        raise ValueError(f"Unknown map detail level: {level} (expected one of {list(LEVELS)})")
+
+    path = topology_path(level)
+    if not os.path.exists(path):
+        return build_topology(load_geojson(), **LEVELS[level])
+
+    with open(path) as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize = None)
+def load_packed_topology(level):
+    """
+    TopoJSON de un nivel de detalle (ver "load_topology") como texto JSON compacto
+    para incluirlo en el HTML de un mapa. Solo se incluye lo que cambia entre países:
+    cada arco como un arreglo plano [x0, y0, dx1, dy1, ...], los arcos de cada
+    geometría (sin "type" ni "properties"; un MultiPolygon tiene un nivel más) y el
+    nombre de cada país en una lista aparte. "functions.ChoroplethLayer" vuelve a
+    formar la topología en el navegador. Se genera una sola vez por proceso y nivel.
+
+    Args:
+        level (str): Nivel de detalle (llave de topology.LEVELS).
+
+    Returns:
+        str: Topología en JSON (segura para incluirse en un <script>), con
+        "transform", "arcs", "geometries" y "names".
+    """
+
+    topology = load_topology(level)
+    geometries = topology["objects"][OBJECT_NAME]["geometries"]
+
+    packed = {
+        "transform": topology["transform"],
+        "arcs": [[value for point in arc for value in point] for arc in topology["arcs"]],
+        "geometries": [geometry.get("arcs") for geometry in geometries],
+        "names": [geometry["properties"]["ADMIN"] for geometry in geometries]
+    }
+
+    return htmlsafe_json_dumps(packed, dumps = json.dumps, separators = (",", ":"))
+
+
+def country_values(topology, country_stats, column, object_name = OBJECT_NAME):
+    """
+    Valor de "column" de cada país del objeto "object_name", en el orden de sus
+    geometrías (NaN si el país no tiene datos).
+
+    Args:
+        topology (dict): Topología con el nombre de cada país en la propiedad "ADMIN".
+        country_stats (df): Datos por país, con "country_region" y "column".
+        column (str): Columna de datos.
+        object_name (str, optional): Objeto con los países. Defaults to OBJECT_NAME.
+
+    Returns:
+        np.array: Valor de cada país (float).
+    """
+
+    values = country_stats.set_index("country_region")[column].to_dict()
+    geometries = topology["objects"][object_name]["geometries"]
+
+    return np.array([values.get(geometry["properties"]["ADMIN"], np.nan) for geometry in geometries], dtype = float)
+
+
+def _to_int(value):
+    """Convierte un conteo a int (0 si es nulo)."""
+
+    return 0 if pd.isna(value) else int(value)
+
+
+def _stats_by_country(country_stats):
+    """Diccionario nombre de país -> conteos (tupla en el orden de STAT_PROPERTIES)."""
+
+    country_stats = country_stats.drop_duplicates(subset = "country_region", keep = "first")
+    columns = [country_stats[column].tolist() for column in STAT_PROPERTIES.values()]
+
+    return dict(zip(country_stats["country_region"].tolist(), zip(*columns)))
+
+
+def _country_properties(properties, stats):
+    """Nuevas propiedades de un país: las originales más su nombre y sus conteos."""
+
+    country = properties["ADMIN"]
+    values = stats.get(country, (0,) * len(STAT_PROPERTIES))
+
+    properties = dict(properties, Country = country)
+    properties.update((name, _to_int(value)) for name, value in zip(STAT_PROPERTIES, values))
+
+    return country, properties
+
+
+def enrich_geojson(geojson, country_stats):
+    """
+    Agrega a cada país del GeoJSON su nombre ("id" y propiedad "Country") y sus
+    conteos (propiedades de STAT_PROPERTIES, 0 si el país no tiene datos).
+
+    Los conteos se buscan en un diccionario nombre de país -> conteos, construido una
+    sola vez a partir de "country_stats", en lugar de filtrar el dataframe por cada
+    país y cada conteo. Se devuelve un nuevo FeatureCollection con propiedades nuevas;
+    la geometría de cada país no se copia, sino que se comparte con "geojson", que no
+    se modifica.
+
+    Args:
+        geojson (dict): FeatureCollection con el nombre de cada país en la propiedad
+        "ADMIN" (ver "load_geojson").
+        country_stats (df): Conteos por país, con "country_region" y las columnas de
+        STAT_PROPERTIES. Si un país aparece varias veces se usa la primera fila.
+
+    Returns:
+        dict: FeatureCollection con las propiedades agregadas.
+    """
+
+    stats = _stats_by_country(country_stats)
+
+    features = []
+    for feature in geojson["features"]:
+
+        country, properties = _country_properties(feature["properties"], stats)
+        features.append({
+            "type": "Feature",
+            "id": country,
+            "properties": properties,
+            "geometry": feature["geometry"]
+        })
+
+    return dict(geojson, features = features)
+
+
+def enrich_topology(topology, country_stats, object_name = OBJECT_NAME):
+    """
+    Equivalente de "enrich_geojson" para un TopoJSON (ver "load_topology"): agrega a
+    cada país del objeto "object_name" su nombre y sus conteos. Se devuelve una nueva
+    topología con geometrías y propiedades nuevas; los arcos se comparten con
+    "topology", que no se modifica.
+
+    Como folium agrega el estilo de cada país a sus propiedades al desplegar el mapa,
+    cada capa debe usar su propia topología.
+
+    Args:
+        topology (dict): Topología con el nombre de cada país en la propiedad "ADMIN".
+        country_stats (df): Conteos por país (ver "enrich_geojson").
+        object_name (str, optional): Objeto con los países. Defaults to OBJECT_NAME.
+
+    Returns:
+        dict: Topología con las propiedades agregadas.
+    """
+
+    stats = _stats_by_country(country_stats)
+    collection = topology["objects"][object_name]
+
+    geometries = []
+    for geometry in collection["geometries"]:
+
+        country, properties = _country_properties(geometry["properties"], stats)
+        geometries.append(dict(geometry, id = country, properties = properties))
+
+    objects = dict(topology["objects"])
+    objects[object_name] = dict(collection, geometries = geometries)
+
+    return dict(topology, objects = objects)
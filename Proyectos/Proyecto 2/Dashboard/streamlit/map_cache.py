@@ -0,0 +1,233 @@
+import collections
+import hashlib
+import os
+import threading
+
+from structlog import get_logger
+
+logger = get_logger()
+
+# ===============
+# FUNCIONES
+# ===============
+
+def files_fingerprint(paths, *extra):
+    """
+    Huella corta (SHA-256) del contenido de unos archivos y de otros valores (por
+    ejemplo, versiones de librerías). Sirve como parte de la llave de los mapas, para
+    que los mapas guardados en disco no se usen si cambia el código o la geometría con
+    los que se construyen.
+
+    Args:
+        paths (list): Rutas de los archivos.
+        *extra: Otros valores que se incluyen en la huella.
+
+    Returns:
+        str: Los primeros 12 caracteres del hash en hexadecimal.
+    """
+
+    sha = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            sha.update(f.read())
+    for value in extra:
+        sha.update(str(value).encode())
+
+    return sha.hexdigest()[:12]
+
+
+def _file_name(key):
+    """Nombre del archivo de una llave (sus partes separadas por "_")."""
+
+    return "_".join(str(part).replace(os.sep, "-") for part in key) + ".html"
+
+
+class RenderedMapCache:
+    """
+    Caché LRU del HTML de los mapas ya construidos, compartida por todas las sesiones
+    del proceso (el módulo se importa una sola vez por proceso de Streamlit).
+
+    La memoria se limita a "max_bytes": al agregar un mapa se eliminan los mapas
+    usados hace más tiempo hasta que el total cabe en el límite. Si se indica un
+    directorio, los mapas eliminados de memoria se guardan en disco (con un límite de
+    "max_disk_bytes", eliminando primero los archivos usados hace más tiempo) y se
+    vuelven a cargar a memoria cuando se piden de nuevo.
+
+    Args:
+        max_bytes (int): Bytes máximos de HTML en memoria.
+        directory (str, optional): Directorio para los mapas eliminados de memoria.
+        Defaults to None (no se guardan en disco).
+        max_disk_bytes (int, optional): Bytes máximos en disco. Defaults to 256MB.
+    """
+
+    def __init__(self, max_bytes, directory = None, max_disk_bytes = 256 * 10**6):
+
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._building = {}
+
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        HTML de un mapa (de memoria o, si se guardó en disco, del archivo), o None si
+        no está en la caché.
+        """
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+        html = self._read(key)
+
+        with self._lock:
+            if html is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        self.put(key, html)
+        return html
+
+    def put(self, key, html):
+        """Agrega el HTML de un mapa, eliminando los mapas usados hace más tiempo."""
+
+        size = len(html.encode())
+        spilled = []
+
+        with self._lock:
+
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            # Un mapa más grande que el límite no se guarda en memoria
+            if size > self.max_bytes:
+                spilled.append((key, html))
+            else:
+                self._entries[key] = (html, size)
+                self._size += size
+
+            while self._size > self.max_bytes:
+                old_key, (old_html, old_size) = self._entries.popitem(last = False)
+                self._size -= old_size
+                spilled.append((old_key, old_html))
+
+        for old_key, old_html in spilled:
+            self._write(old_key, old_html)
+
+    def get_or_build(self, key, build):
+        """
+        HTML de un mapa de la caché o, si no está, construido con "build()" y agregado
+        a la caché. Si varias sesiones piden a la vez el mismo mapa, se construye una
+        sola vez y las demás esperan el resultado (que reciben aunque el mapa no quepa
+        en memoria).
+
+        Args:
+            key (tuple): Llave del mapa.
+            build (function): Función sin argumentos que devuelve el HTML del mapa.
+
+        Returns:
+            str: HTML del mapa.
+        """
+
+        html = self.get(key)
+        if html is not None:
+            return html
+
+        # Construcción en curso de cada llave: candado y HTML construido
+        with self._lock:
+            building = self._building.setdefault(key, {"lock": threading.Lock(), "html": None})
+
+        try:
+            with building["lock"]:
+
+                # Otra sesión pudo haberlo construido mientras se esperaba
+                if building["html"] is not None:
+                    return building["html"]
+
+                with self._lock:
+                    if key in self._entries:
+                        return self._entries[key][0]
+
+                html = build()
+                building["html"] = html
+                self.put(key, html)
+                logger.info(f"Rendered map {key}: {len(html.encode()) / 1e6:.2f}MB "
+                            f"(cache: {len(self)} maps, {self._size / 1e6:.1f}/{self.max_bytes / 1e6:.0f}MB)")
+        finally:
+            with self._lock:
+                if self._building.get(key) is building:
+                    del self._building[key]
+
+        return html
+
+    def _read(self, key):
+        """HTML de un mapa guardado en disco (None si no existe)."""
+
+        if not self.directory:
+            return None
+
+        path = os.path.join(self.directory, _file_name(key))
+        try:
+            with open(path, encoding = "utf-8") as f:
+                html = f.read()
+
+            # Se marca como usado, para que sea de los últimos en eliminarse
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return html
+
+    def _write(self, key, html):
+        """Guarda en disco un mapa eliminado de memoria y aplica el límite del disco."""
+
+        if not self.directory:
+            return
+
+        path = os.path.join(self.directory, _file_name(key))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """Elimina los archivos usados hace más tiempo hasta cumplir "max_disk_bytes"."""
+
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".html"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,349 @@
+"""
+Preprocesamiento de la geometría de los mapas: convierte el GeoJSON de países a
+TopoJSON con arcos compartidos y genera versiones simplificadas con varios niveles
+de detalle (ver LEVELS).
+
+Las fronteras compartidas por dos países se guardan una sola vez (como un arco) y se
+simplifican una sola vez, por lo que los países vecinos siguen compartiendo
+exactamente la misma frontera. Cada arco se simplifica por separado (Douglas-Peucker),
+sin revisar si cruza a otro arco del mismo país o de sus vecinos: en los niveles más
+simplificados un arco puede cruzar a otro cercano (sólo se nota con zoom). Las
+coordenadas se cuantizan a una cuadrícula de enteros y cada arco se guarda como
+diferencias entre puntos consecutivos (formato TopoJSON).
+
+Uso (desde "Dashboard"), para volver a generar los archivos de "streamlit/geometry":
+    python streamlit/topology.py
+"""
+
+import json
+import os
+
+import numpy as np
+
+# Niveles de detalle: tolerancia de la simplificación (en grados), tamaño de la
+# cuadrícula de cuantización y área mínima (en grados cuadrados) de las islas que se
+# conservan (el polígono más grande de cada país siempre se conserva). "high"
+# conserva todos los puntos del GeoJSON; "low" está pensado para la vista del mundo
+# completo (zoom 2, ~0.35 grados por pixel).
+LEVELS = {
+    "high": {"tolerance": 0.0, "quantization": 100000, "min_area": 0.0},
+    "medium": {"tolerance": 0.1, "quantization": 20000, "min_area": 0.05},
+    "low": {"tolerance": 0.35, "quantization": 5000, "min_area": 0.5}
+}
+
+# Nombre del objeto con los países dentro del TopoJSON ("objects.countries")
+OBJECT_NAME = "countries"
+
+# Propiedades del GeoJSON que se conservan en cada país
+KEEP_PROPERTIES = ["ADMIN"]
+
+# Directorio de los archivos generados
+GEOMETRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geometry")
+
+# ===============
+# FUNCIONES
+# ===============
+
+def topology_path(level, directory = GEOMETRY_DIR):
+    """Ruta del TopoJSON de un nivel de detalle."""
+
+    return os.path.join(directory, f"countries-{level}.topo.json")
+
+
+def _polygons(geometry):
+    """Lista de polígonos (cada uno una lista de anillos) de un Polygon o MultiPolygon."""
+
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+
+    raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+
+def _area(ring):
+    """Área de un anillo (fórmula del área de Gauss), en unidades de la cuadrícula."""
+
+    points = np.asarray(ring, dtype = float)
+    x, y = points[:, 0], points[:, 1]
+
+    return abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+
+def _quantize(features, quantization, min_area = 0.0):
+    """
+    Convierte los anillos de cada país a puntos enteros de una cuadrícula de
+    "quantization" x "quantization" sobre la extensión de todos los países. Los anillos
+    que quedan con menos de 3 puntos distintos (islas más pequeñas que una celda) se
+    eliminan, al igual que los polígonos con área menor a "min_area" (en grados
+    cuadrados) que no sean el polígono más grande de su país.
+
+    Ningún país se queda sin geometría: si todos sus anillos se eliminan, se conserva
+    un triángulo de una celda en la posición de su anillo exterior más grande.
+
+    Returns:
+        tuple: Polígonos cuantizados de cada país (anillos sin repetir el primer punto)
+        y "transform" del TopoJSON.
+    """
+
+    points = np.concatenate([np.asarray(ring, dtype = float)[:, :2]
+                             for feature in features
+                             for polygon in _polygons(feature["geometry"])
+                             for ring in polygon])
+
+    x0, y0 = points.min(axis = 0)
+    x1, y1 = points.max(axis = 0)
+    kx = (x1 - x0) / (quantization - 1) or 1.0
+    ky = (y1 - y0) / (quantization - 1) or 1.0
+
+    quantized = []
+    for feature in features:
+
+        polygons = []
+        largest_exterior, largest_area = None, -1.0
+        for polygon in _polygons(feature["geometry"]):
+
+            rings = []
+            for i, ring in enumerate(polygon):
+
+                coords = np.asarray(ring, dtype = float)[:, :2]
+                grid = np.column_stack([np.round((coords[:, 0] - x0) / kx), np.round((coords[:, 1] - y0) / ky)]).astype(np.int64)
+
+                # Se eliminan los puntos repetidos consecutivos y el punto de cierre
+                keep = np.ones(len(grid), dtype = bool)
+                keep[1:] = np.any(grid[1:] != grid[:-1], axis = 1)
+                grid = grid[keep]
+                if len(grid) > 1 and (grid[0] == grid[-1]).all():
+                    grid = grid[:-1]
+
+                if i == 0 and _area(coords) > largest_area:
+                    largest_exterior, largest_area = grid, _area(coords)
+
+                if len(grid) >= 3:
+                    rings.append([tuple(point) for point in grid.tolist()])
+
+                # Si el anillo exterior desaparece, desaparece el polígono
+                elif i == 0:
+                    break
+
+            if rings:
+                polygons.append(rings)
+
+        # País cuyos anillos desaparecieron todos (más pequeño que una celda): un
+        # triángulo de una celda en la posición de su anillo exterior más grande
+        if not polygons and largest_exterior is not None:
+            x, y = largest_exterior[0].tolist()
+            polygons = [[[(x, y), (x + 1, y), (x, y + 1)]]]
+
+        # Islas pequeñas (se conserva siempre el polígono más grande del país)
+        if min_area > 0 and len(polygons) > 1:
+            areas = [_area(rings[0]) * kx * ky for rings in polygons]
+            largest = int(np.argmax(areas))
+            polygons = [rings for i, (rings, area) in enumerate(zip(polygons, areas)) if i == largest or area >= min_area]
+
+        quantized.append(polygons)
+
+    return quantized, {"scale": [kx, ky], "translate": [float(x0), float(y0)]}
+
+
+def _junctions(rings):
+    """
+    Puntos en los que se cortan los anillos en arcos: los puntos en los que cambian
+    los vecinos de un anillo (inicio y fin de cada frontera compartida).
+    """
+
+    neighbors = {}
+    junctions = set()
+
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            a, b = ring[i - 1], ring[(i + 1) % n]
+            pair = (a, b) if a < b else (b, a)
+            previous = neighbors.setdefault(point, pair)
+            if previous != pair:
+                junctions.add(point)
+
+    return junctions
+
+
+def _cut(ring, junctions):
+    """Divide un anillo en arcos que empiezan y terminan en un punto de corte."""
+
+    cuts = [i for i, point in enumerate(ring) if point in junctions]
+
+    # Anillo sin cortes (por ejemplo, una isla): un solo arco cerrado, que empieza en
+    # su punto menor para que el mismo anillo siempre produzca el mismo arco
+    if not cuts:
+        start = ring.index(min(ring))
+        rotated = ring[start:] + ring[:start]
+        return [rotated + [rotated[0]]]
+
+    start = cuts[0]
+    rotated = ring[start:] + ring[:start] + [ring[start]]
+    positions = [i - start if i >= start else i - start + len(ring) for i in cuts] + [len(ring)]
+
+    return [rotated[a:b + 1] for a, b in zip(positions[:-1], positions[1:])]
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Simplifica una línea con el algoritmo de Douglas-Peucker, conservando el primer y
+    el último punto.
+
+    Args:
+        points (np.array): Puntos de la línea (n x 2).
+        tolerance (float): Distancia máxima entre la línea original y la simplificada.
+
+    Returns:
+        np.array: Puntos conservados.
+    """
+
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return points
+
+    keep = np.zeros(n, dtype = bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start, end = points[first], points[last]
+        segment = points[first + 1:last] - start
+        direction = end - start
+        length = np.hypot(*direction)
+
+        # Distancia de cada punto al segmento (o al punto, si el arco es cerrado)
+        if length == 0:
+            distances = np.hypot(segment[:, 0], segment[:, 1])
+        else:
+            distances = np.abs(direction[0] * segment[:, 1] - direction[1] * segment[:, 0]) / length
+
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = first + 1 + index
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+
+    return points[keep]
+
+
+def build_topology(geojson, tolerance = 0.0, quantization = 100000, min_area = 0.0, object_name = OBJECT_NAME):
+    """
+    Convierte un GeoJSON de polígonos a TopoJSON con arcos compartidos, simplificando
+    cada arco con una tolerancia en grados.
+
+    Args:
+        geojson (dict): FeatureCollection de Polygon y MultiPolygon.
+        tolerance (float, optional): Tolerancia de la simplificación, en grados.
+        Defaults to 0.0 (sin simplificar).
+        quantization (int, optional): Tamaño de la cuadrícula. Defaults to 100000.
+        min_area (float, optional): Área mínima de las islas, en grados cuadrados.
+        Defaults to 0.0 (se conservan todas).
+        object_name (str, optional): Nombre del objeto. Defaults to OBJECT_NAME.
+
+    Returns:
+        dict: Topología con el objeto "object_name" (un GeometryCollection con las
+        propiedades de KEEP_PROPERTIES de cada país).
+    """
+
+    features = geojson["features"]
+    quantized, transform = _quantize(features, quantization, min_area)
+    junctions = _junctions([ring for polygons in quantized for rings in polygons for ring in rings])
+
+    arcs = []
+    arc_index = {}
+
+    def add_arc(points):
+        key = tuple(points)
+        if key in arc_index:
+            return arc_index[key]
+        if key[::-1] in arc_index:
+            return ~arc_index[key[::-1]]
+        arc_index[key] = len(arcs)
+        arcs.append(points)
+        return arc_index[key]
+
+    geometries = []
+    for feature, polygons in zip(features, quantized):
+
+        polygon_arcs = [[[add_arc(arc) for arc in _cut(ring, junctions)] for ring in rings] for rings in polygons]
+        properties = {key: feature["properties"][key] for key in KEEP_PROPERTIES if key in feature["properties"]}
+
+        if not polygon_arcs:
+            geometries.append({"type": None, "properties": properties})
+        elif len(polygon_arcs) == 1:
+            geometries.append({"type": "Polygon", "arcs": polygon_arcs[0], "properties": properties})
+        else:
+            geometries.append({"type": "MultiPolygon", "arcs": polygon_arcs, "properties": properties})
+
+    # Cada arco se simplifica una sola vez (la tolerancia se pasa a unidades de la
+    # cuadrícula) y se guarda como diferencias entre puntos consecutivos
+    grid_tolerance = tolerance / min(transform["scale"])
+    encoded = []
+    for arc in arcs:
+
+        points = np.asarray(arc, dtype = np.int64)
+        simplified = douglas_peucker(points, grid_tolerance)
+
+        # Un arco cerrado (isla) debe conservar al menos un triángulo
+        if (points[0] == points[-1]).all() and len(simplified) < 4:
+            simplified = points
+
+        deltas = np.vstack([simplified[:1], np.diff(simplified, axis = 0)])
+        encoded.append(deltas.tolist())
+
+    return {
+        "type": "Topology",
+        "transform": transform,
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded
+    }
+
+
+def build_levels(geojson_path, directory = GEOMETRY_DIR, levels = LEVELS):
+    """
+    Genera el TopoJSON de cada nivel de detalle.
+
+    Args:
+        geojson_path (str): Ruta del GeoJSON de países.
+        directory (str, optional): Directorio de salida. Defaults to GEOMETRY_DIR.
+        levels (dict, optional): Niveles a generar. Defaults to LEVELS.
+
+    Returns:
+        dict: Ruta y tamaño (bytes) del archivo de cada nivel.
+    """
+
+    with open(geojson_path) as f:
+        geojson = json.load(f)
+
+    os.makedirs(directory, exist_ok = True)
+
+    outputs = {}
+    for level, settings in levels.items():
+
+        path = topology_path(level, directory)
+        with open(path + ".tmp", "w") as f:
+            json.dump(build_topology(geojson, **settings), f, separators = (",", ":"))
+        os.replace(path + ".tmp", path)
+
+        outputs[level] = (path, os.path.getsize(path))
+
+    return outputs
+
+
+if __name__ == "__main__":
+
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "countries-min.json")
+
+    print(f"{'level':>8} {'size (KB)':>10}  (source: {os.path.getsize(source) / 1000:.0f}KB)")
+    for level, (path, size) in build_levels(source).items():
+        print(f"{level:>8} {size / 1000:>10.0f}  {os.path.relpath(path)}")